@@ -0,0 +1,78 @@
+"""Store image job uploads as shared, chunked blobs
+
+Revision ID: 3e8b1f4c7a92
+Revises: d61a8c5f0e27
+Create Date: 2026-10-18 19:05:37.214906
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3e8b1f4c7a92'
+down_revision: Union[str, None] = 'd61a8c5f0e27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'image_job_blobs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('job_id', sa.Integer(), nullable=False),
+        sa.Column('sha256', sa.String(), nullable=False),
+        sa.Column('size', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['job_id'], ['image_jobs.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_image_job_blobs_job_id'), 'image_job_blobs', ['job_id'], unique=False)
+
+    op.create_table(
+        'image_job_blob_chunks',
+        sa.Column('blob_id', sa.Integer(), nullable=False),
+        sa.Column('seq', sa.Integer(), nullable=False),
+        sa.Column('data', sa.LargeBinary(), nullable=False),
+        sa.ForeignKeyConstraint(['blob_id'], ['image_job_blobs.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('blob_id', 'seq')
+    )
+
+    # Jobs still waiting keep their uploads: each file becomes a blob of one
+    # chunk, under the file's own id
+    op.add_column('image_job_files', sa.Column('blob_id', sa.Integer(), nullable=True))
+    op.execute(
+        "INSERT INTO image_job_blobs (id, job_id, sha256, size) "
+        "SELECT id, job_id, encode(sha256(data), 'hex'), length(data) FROM image_job_files"
+    )
+    op.execute("INSERT INTO image_job_blob_chunks (blob_id, seq, data) SELECT id, 0, data FROM image_job_files")
+    op.execute("UPDATE image_job_files SET blob_id = id")
+    op.execute(
+        "SELECT setval(pg_get_serial_sequence('image_job_blobs', 'id'), COALESCE(MAX(id), 0) + 1, false) "
+        "FROM image_job_blobs"
+    )
+
+    op.alter_column('image_job_files', 'blob_id', nullable=False)
+    op.create_index(op.f('ix_image_job_files_blob_id'), 'image_job_files', ['blob_id'], unique=False)
+    op.create_foreign_key(
+        'image_job_files_blob_id_fkey', 'image_job_files', 'image_job_blobs', ['blob_id'], ['id'], ondelete='CASCADE'
+    )
+    op.drop_column('image_job_files', 'data')
+
+
+def downgrade() -> None:
+    op.add_column('image_job_files', sa.Column('data', sa.LargeBinary(), nullable=True))
+    op.execute(
+        "UPDATE image_job_files SET data = ("
+        "SELECT string_agg(chunk.data, ''::bytea ORDER BY chunk.seq) FROM image_job_blob_chunks chunk "
+        "WHERE chunk.blob_id = image_job_files.blob_id)"
+    )
+    op.alter_column('image_job_files', 'data', nullable=False)
+
+    op.drop_constraint('image_job_files_blob_id_fkey', 'image_job_files', type_='foreignkey')
+    op.drop_index(op.f('ix_image_job_files_blob_id'), table_name='image_job_files')
+    op.drop_column('image_job_files', 'blob_id')
+    op.drop_table('image_job_blob_chunks')
+    op.drop_index(op.f('ix_image_job_blobs_job_id'), table_name='image_job_blobs')
+    op.drop_table('image_job_blobs')
@@ -0,0 +1,53 @@
+"""Add composite and partial indexes for customer pipeline queries
+
+Revision ID: 5e2d9c41b7a0
+Revises: a3517a436cb7
+Create Date: 2026-10-18 10:12:44.318205
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e2d9c41b7a0'
+down_revision: Union[str, None] = 'a3517a436cb7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# customers is live and large: each index is built CONCURRENTLY, so writes
+# carry on while it builds. Postgres refuses that inside a transaction, hence
+# the autocommit block. A build that fails part way leaves an INVALID index
+# behind; drop it before running the upgrade again.
+INDEXES = [
+    # Keyset pagination and created_at ranges (admin lists, monthly registrations)
+    ('ix_customers_created_at_id', ['created_at', 'customer_id'], None),
+    # Per-branch lists (accounts, admin branch views)
+    ('ix_customers_branch_created_at_id', ['branch_id', 'created_at', 'customer_id'], None),
+    # Sales executive lists and dashboard counts
+    ('ix_customers_branch_sales_exec_created_at_id', ['branch_id', 'sales_executive_id', 'created_at', 'customer_id'], None),
+    ('ix_customers_branch_status', ['branch_id', 'status'], None),
+
+    # Verification queues only ever touch a small slice of the table
+    ('ix_customers_accounts_pending', ['branch_id', 'created_at', 'customer_id'],
+     'sales_verified = true AND accounts_verified = false'),
+    ('ix_customers_rto_pending', ['created_at', 'customer_id'],
+     'sales_verified = true AND accounts_verified = true AND rto_verified = false'),
+    ('ix_customers_rto_verified', ['created_at', 'customer_id'], 'rto_verified = true'),
+]
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, columns, where in INDEXES:
+            op.create_index(name, 'customers', columns, postgresql_concurrently=True,
+                            postgresql_where=sa.text(where) if where else None)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, _, _ in reversed(INDEXES):
+            op.drop_index(name, table_name='customers', postgresql_concurrently=True)
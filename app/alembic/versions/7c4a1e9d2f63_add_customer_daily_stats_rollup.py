@@ -0,0 +1,58 @@
+"""Add customer_daily_stats reporting rollup
+
+Revision ID: 7c4a1e9d2f63
+Revises: 5e2d9c41b7a0
+Create Date: 2026-10-18 11:03:27.904116
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c4a1e9d2f63'
+down_revision: Union[str, None] = '5e2d9c41b7a0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'customer_daily_stats',
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('branch_id', sa.Integer(), nullable=False),
+        sa.Column('sales_executive_id', sa.Integer(), nullable=False),
+        sa.Column('stage', sa.String(), nullable=False),
+        sa.Column('customers', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('revenue', sa.DECIMAL(precision=14, scale=2), nullable=False, server_default='0'),
+        sa.PrimaryKeyConstraint('day', 'branch_id', 'sales_executive_id', 'stage')
+    )
+
+    # Backfill from existing customers; the stage CASE mirrors
+    # reporting.pipeline_stage
+    op.execute("""
+        INSERT INTO customer_daily_stats (day, branch_id, sales_executive_id, stage, customers, revenue)
+        SELECT
+            created_at::date,
+            COALESCE(branch_id, 0),
+            COALESCE(sales_executive_id, 0),
+            CASE
+                WHEN registered THEN 'Registered'
+                WHEN rto_verified THEN 'RTO'
+                WHEN accounts_verified THEN 'Accounts'
+                WHEN sales_verified THEN 'Sales'
+                WHEN status = 'submitted' THEN 'Submitted'
+                ELSE 'Pending'
+            END,
+            COUNT(*),
+            COALESCE(SUM(total_price), 0)
+        FROM customers
+        WHERE created_at IS NOT NULL
+        GROUP BY 1, 2, 3, 4
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('customer_daily_stats')
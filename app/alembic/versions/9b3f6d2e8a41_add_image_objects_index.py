@@ -0,0 +1,38 @@
+"""Add image_objects content-hash index
+
+Revision ID: 9b3f6d2e8a41
+Revises: 7c4a1e9d2f63
+Create Date: 2026-10-18 15:42:09.318274
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9b3f6d2e8a41'
+down_revision: Union[str, None] = '7c4a1e9d2f63'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'image_objects',
+        sa.Column('bucket', sa.String(), nullable=False),
+        sa.Column('source_sha256', sa.String(length=64), nullable=False),
+        sa.Column('variant', sa.String(), nullable=False),
+        sa.Column('object_key', sa.String(), nullable=False),
+        sa.Column('url', sa.String(), nullable=False),
+        sa.Column('size', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('bucket', 'source_sha256', 'variant')
+    )
+    op.create_index('ix_image_objects_bucket_object_key', 'image_objects', ['bucket', 'object_key'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_image_objects_bucket_object_key', table_name='image_objects')
+    op.drop_table('image_objects')
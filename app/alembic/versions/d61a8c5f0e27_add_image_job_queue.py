@@ -0,0 +1,61 @@
+"""Add image job queue and customers.processing_status
+
+Revision ID: d61a8c5f0e27
+Revises: 9b3f6d2e8a41
+Create Date: 2026-10-18 17:26:51.604318
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd61a8c5f0e27'
+down_revision: Union[str, None] = '9b3f6d2e8a41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('customers', sa.Column('processing_status', sa.String(), nullable=True))
+
+    op.create_table(
+        'image_jobs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('customer_id', sa.Integer(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('last_error', sa.String(), nullable=True),
+        sa.Column('run_after', sa.DateTime(), nullable=False),
+        sa.Column('locked_at', sa.DateTime(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['customer_id'], ['customers.customer_id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_image_jobs_customer_id'), 'image_jobs', ['customer_id'], unique=False)
+    op.create_index('ix_image_jobs_status_run_after', 'image_jobs', ['status', 'run_after'], unique=False)
+
+    op.create_table(
+        'image_job_files',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('job_id', sa.Integer(), nullable=False),
+        sa.Column('field', sa.String(), nullable=False),
+        sa.Column('filename', sa.String(), nullable=False),
+        sa.Column('compress', sa.Boolean(), nullable=False),
+        sa.Column('remove_background', sa.Boolean(), nullable=False),
+        sa.Column('data', sa.LargeBinary(), nullable=False),
+        sa.ForeignKeyConstraint(['job_id'], ['image_jobs.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_image_job_files_job_id'), 'image_job_files', ['job_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_image_job_files_job_id'), table_name='image_job_files')
+    op.drop_table('image_job_files')
+    op.drop_index('ix_image_jobs_status_run_after', table_name='image_jobs')
+    op.drop_index(op.f('ix_image_jobs_customer_id'), table_name='image_jobs')
+    op.drop_table('image_jobs')
+    op.drop_column('customers', 'processing_status')
@@ -1,8 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException, status,Form
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from decimal import Decimal
 import models, database, oauth2, schemas
+from pagination import CustomerFilters, PageParams, paginate_async, project
+import reporting
 from datetime import datetime
 
 
@@ -21,39 +24,45 @@ def is_user_in_accounts_role(user: models.User):
         )
 
 
-@router.get("/customers/pending", response_model=List[schemas.CustomerOut])  # Use List for multiple results
-def get_pending_customers(
-    db: Session = Depends(database.get_db),
+@router.get("/customers/pending", response_model=schemas.Page[schemas.CustomerOut])
+async def get_pending_customers(
+    page: PageParams = Depends(),
+    filters: CustomerFilters = Depends(),
+    db: AsyncSession = Depends(database.get_async_db),
     current_user: models.User = Depends(oauth2.get_current_user)
 ):
     is_user_in_accounts_role(current_user)
     
     # Query to get customers that have not been verified
-    customers = db.query(models.Customer).filter(
-        models.Customer.branch_id == current_user.branch_id,
-        models.Customer.sales_verified==True,
-        models.Customer.accounts_verified == False
-    ).all()
+    def query(session):
+        return project(session, schemas.CustomerOut).filter(
+            models.Customer.branch_id == current_user.branch_id,
+            models.Customer.sales_verified==True,
+            models.Customer.accounts_verified == False
+        )
     
-    return customers
+    return await paginate_async(db, query, page, filters)
 
 
 
-@router.get("/customers/verified", response_model=List[schemas.CustomerOut])  # Use List for multiple results
-def get_verified_customers(
-    db: Session = Depends(database.get_db),
+@router.get("/customers/verified", response_model=schemas.Page[schemas.CustomerOut])
+async def get_verified_customers(
+    page: PageParams = Depends(),
+    filters: CustomerFilters = Depends(),
+    db: AsyncSession = Depends(database.get_async_db),
     current_user: models.User = Depends(oauth2.get_current_user)
 ):
     is_user_in_accounts_role(current_user)
     
     # Query to get customers that have not been verified
-    customers = db.query(models.Customer).filter(
-        models.Customer.branch_id == current_user.branch_id,
-        models.Customer.sales_verified == True,
-        models.Customer.accounts_verified == True
-    ).all()
+    def query(session):
+        return project(session, schemas.CustomerOut).filter(
+            models.Customer.branch_id == current_user.branch_id,
+            models.Customer.sales_verified == True,
+            models.Customer.accounts_verified == True
+        )
     
-    return customers
+    return await paginate_async(db, query, page, filters)
 
 
 @router.get("/customers/{customer_id}", response_model=schemas.CustomerOut)
@@ -85,7 +94,9 @@ def verify_customer_by_accounts(customer_id: int, db: Session = Depends(database
 
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found.")
-    
+
+    before = reporting.snapshot(customer)
+
     # Check if finance is approved and update the balance amount accordingly
     if customer.finance_amount and customer.finance_amount > 0:
         balance_amount = customer.total_price - customer.amount_paid - customer.finance_amount
@@ -99,6 +110,7 @@ def verify_customer_by_accounts(customer_id: int, db: Session = Depends(database
     )
     
     db.add(verification_log)
+    reporting.record_change(db, before, customer)
     db.commit()
 
     return {"message": "Accounts verification completed and balance amount updated based on finance approval."}
@@ -142,6 +154,8 @@ def update_customer(
     if customer is None:
         raise HTTPException(status_code=404, detail="Customer not found")
 
+    before = reporting.snapshot(customer)
+
     # Update fields if values are provided
     if first_name is not None:
         customer.first_name = first_name
@@ -217,6 +231,7 @@ def update_customer(
     customer.balance_amount = balance_amount
 
 
+    reporting.record_change(db, before, customer)
     db.commit()
     db.refresh(customer)
 
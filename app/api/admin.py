@@ -1,5 +1,5 @@
 from datetime import date
-from typing import List
+from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 import models, schemas, utils, database, oauth2
@@ -8,6 +8,10 @@ from schemas import BranchCreate, BranchResponse, UserCreate
 from utils import hash
 from database import get_db
 from fastapi import Query
+from pagination import CustomerFilters, PageParams, paginate, project
+import reporting
+import roles
+from json_responses import trusted_response
 
 router = APIRouter(
     prefix="/admin",
@@ -20,15 +24,45 @@ def admin_required(current_user: models.User = Depends(get_current_user)):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
 
 
-@router.get("/customers", response_model=List[schemas.CustomerListResponse])
-def get_all_customers(db: Session = Depends(database.get_db), current_user: models.User = Depends(oauth2.get_current_user)):
+def format_customer_row(customer):
+    # Determine status based on verification flags
+    status = "Pending"
+    if customer.registered:
+        status = "Registered"
+    elif customer.rto_verified:
+        status = "RTO"
+    elif customer.accounts_verified:
+        status = "Accounts"
+    elif customer.sales_verified:
+        status = "Sales"
+
+    return {
+        "customer_id": customer.customer_id,
+        "name": customer.name,
+        "vehicle_name": customer.vehicle_name,
+        "total_price": float(customer.total_price),
+        "status": status,
+        "sales_executive_name": f"{customer.sales_exec_first_name} {customer.sales_exec_last_name}",
+        "branch_name": customer.branch_name
+    }
+
+
+@router.get("/customers", response_model=schemas.Page[schemas.CustomerListResponse])
+def get_all_customers(
+    branch_id: Optional[int] = Query(None),
+    page: PageParams = Depends(),
+    filters: CustomerFilters = Depends(),
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(oauth2.get_current_user)
+):
     if current_user.role_id != 1:
         raise HTTPException(status_code=403, detail="Not authorized.")
 
     # Query with joins to get all required information
-    customers = (
+    query = (
         db.query(
             models.Customer.customer_id,
+            models.Customer.created_at,
             models.Customer.name,
             models.Customer.vehicle_name,
             models.Customer.total_price,
@@ -42,38 +76,12 @@ def get_all_customers(db: Session = Depends(database.get_db), current_user: mode
         )
         .join(models.User, models.Customer.sales_executive_id == models.User.user_id)
         .join(models.Branch, models.Customer.branch_id == models.Branch.branch_id)
-        .all()
     )
+    if branch_id is not None:
+        query = query.filter(models.Customer.branch_id == branch_id)
 
-    if not customers:
-        raise HTTPException(status_code=404, detail="No customers found.")
-
-    # Process the results to format them according to the schema
-    formatted_customers = []
-    for customer in customers:
-        # Determine status based on verification flags
-        status = "Pending"
-        if customer.registered:
-            status = "Registered"
-        elif customer.rto_verified:
-            status = "RTO"
-        elif customer.accounts_verified:
-            status = "Accounts"
-        elif customer.sales_verified:
-            status = "Sales"
-
-        formatted_customer = {
-            "customer_id": customer.customer_id,
-            "name": customer.name,
-            "vehicle_name": customer.vehicle_name,
-            "total_price": float(customer.total_price),
-            "status": status,
-            "sales_executive_name": f"{customer.sales_exec_first_name} {customer.sales_exec_last_name}",
-            "branch_name": customer.branch_name
-        }
-        formatted_customers.append(formatted_customer)
-
-    return formatted_customers
+    # Rows are formatted into the response schema here, so skip re-validating them
+    return trusted_response(paginate(query, page, filters, transform=format_customer_row))
 
 
 @router.get("/monthly-customers", response_model=List[schemas.CustomerListResponse])
@@ -120,31 +128,41 @@ def get_monthly_customer_registrations(
         raise HTTPException(status_code=404, detail="No customers found for the specified month and year.")
 
     # Process the results to format them according to the schema
-    formatted_customers = []
-    for customer in customers:
-        # Determine status based on verification flags
-        status = "Pending"
-        if customer.registered:
-            status = "Registered"
-        elif customer.rto_verified:
-            status = "RTO"
-        elif customer.accounts_verified:
-            status = "Accounts"
-        elif customer.sales_verified:
-            status = "Sales"
-
-        formatted_customer = {
-            "customer_id": customer.customer_id,
-            "name": customer.name,
-            "vehicle_name": customer.vehicle_name,
-            "total_price": float(customer.total_price),
-            "status": status,
-            "sales_executive_name": f"{customer.sales_exec_first_name} {customer.sales_exec_last_name}",
-            "branch_name": customer.branch_name
-        }
-        formatted_customers.append(formatted_customer)
-
-    return formatted_customers
+    return trusted_response([format_customer_row(customer) for customer in customers])
+
+
+# Reports below read the customer_daily_stats rollup (see reporting.py), so
+# their cost depends on the reporting window, not on the size of customers.
+
+@router.get("/reports/monthly-trends", response_model=List[schemas.MonthlyTrend])
+def get_monthly_trends(
+    year: int = Query(...),
+    branch_id: Optional[int] = Query(None),
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(admin_required)
+):
+    return reporting.monthly_trends(db, year, branch_id)
+
+
+@router.get("/reports/branch-leaderboard", response_model=List[schemas.BranchLeaderboardEntry])
+def get_branch_leaderboard(
+    start_date: Optional[date] = Query(None),
+    end_date: Optional[date] = Query(None),
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(admin_required)
+):
+    return reporting.branch_leaderboard(db, start_date, end_date)
+
+
+@router.get("/reports/stage-funnel", response_model=List[schemas.StageCount])
+def get_stage_funnel(
+    branch_id: Optional[int] = Query(None),
+    start_date: Optional[date] = Query(None),
+    end_date: Optional[date] = Query(None),
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(admin_required)
+):
+    return reporting.stage_funnel(db, branch_id, start_date, end_date)
 
 @router.get("/sales-verified-customers", response_model=List[schemas.CustomerOut])
 def get_sales_verified_customers_by_branch(branch_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(oauth2.get_current_user)):
@@ -228,7 +246,7 @@ def create_user(
     db.commit()
     db.refresh(new_user)
 
-    role_name = db.query(models.Role.role_name).filter(models.Role.role_id == new_user.role_id).scalar()
+    role_name = roles.role_name(db, new_user.role_id)
 
     response = {
         "user_id": new_user.user_id,
@@ -257,21 +275,32 @@ def get_employees(branch_id: int, role_id:int, db: Session = Depends(database.ge
 
 @router.get("/users", response_model=List[schemas.UserOut])
 def get_all_users(db: Session = Depends(database.get_db), current_user: models.User = Depends(admin_required)):
-    users = db.query(models.User).all()
+    # Role names come from the same query instead of one lookup per user
+    users = (
+        db.query(
+            models.User.user_id,
+            models.User.first_name,
+            models.User.last_name,
+            models.User.email,
+            models.User.branch_id,
+            models.Role.role_name
+        )
+        .outerjoin(models.Role, models.User.role_id == models.Role.role_id)
+        .all()
+    )
 
     if not users:
         raise HTTPException(status_code=404, detail="No users found.")
 
     user_list = []
     for user in users:
-        role_name = db.query(models.Role.role_name).filter(models.Role.role_id == user.role_id).scalar()
         user_list.append({
             "user_id": user.user_id,
             "first_name": user.first_name,
             "last_name": user.last_name,
             "email": user.email,
             "branch_id": user.branch_id,
-            "role_name": role_name
+            "role_name": user.role_name
         })
 
     return user_list
@@ -283,7 +312,7 @@ def get_user_by_id(user_id: int, db: Session = Depends(database.get_db), current
     if not user:
         raise HTTPException(status_code=404, detail=f"User with ID {user_id} not found")
     
-    role_name = db.query(models.Role.role_name).filter(models.Role.role_id == user.role_id).scalar()
+    role_name = roles.role_name(db, user.role_id)
 
     return {
         "user_id": user.user_id,
@@ -309,8 +338,9 @@ def update_user(user_id: int, user: schemas.UserCreate, db: Session = Depends(da
 
     db.commit()
     db.refresh(user_in_db)
+    oauth2.invalidate_user(user_id)
 
-    role_name = db.query(models.Role.role_name).filter(models.Role.role_id == user_in_db.role_id).scalar()
+    role_name = roles.role_name(db, user_in_db.role_id)
 
     return {
         "user_id": user_in_db.user_id,
@@ -329,6 +359,7 @@ def delete_user(user_id: int, db: Session = Depends(database.get_db), current_us
 
     user.is_active = False
     db.commit()
+    oauth2.invalidate_user(user_id)
 
     return {"detail": f"User with ID {user_id} deactivated"}
 
@@ -389,10 +420,14 @@ def delete_branch(branch_id: int, db: Session = Depends(database.get_db)):
 
 
 
-@router.get("/total-branch-customers/{branch_id}", response_model=schemas.CustomerListResponse)
-def get_user_by_id(branch_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(admin_required)):
-    customers = db.query(models.Customer).filter(models.Customer.branch_id == branch_id).all()
-    
-   
-    customer_data = [schemas.CustomerOut.from_orm(customer) for customer in customers]
-    return schemas.CustomerListResponse(customers=customer_data)
+@router.get("/total-branch-customers/{branch_id}", response_model=schemas.Page[schemas.CustomerOut])
+def get_branch_customers(
+    branch_id: int,
+    page: PageParams = Depends(),
+    filters: CustomerFilters = Depends(),
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(admin_required)
+):
+    query = project(db, schemas.CustomerOut).filter(models.Customer.branch_id == branch_id)
+
+    return paginate(query, page, filters)
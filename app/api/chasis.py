@@ -1,13 +1,11 @@
-from io import BytesIO
 from fastapi import APIRouter, Depends, HTTPException,UploadFile,File, Form
 from typing import List
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from uuid import uuid4
 import models, schemas, database, oauth2
-import utils
-from PIL import Image
+import utils, imaging
 from datetime import datetime
-from io import BytesIO
 
 router = APIRouter(
     prefix="/chasis",
@@ -20,7 +18,7 @@ router = APIRouter(
 async def upload_chassis_data(
     chassis_number: str = Form(...),
     chassis_photo: UploadFile = File(...),
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_async_db),
     current_user: models.User = Depends(oauth2.get_current_user)
 ):
     # Validate the file type
@@ -31,11 +29,9 @@ async def upload_chassis_data(
     file_extension = chassis_photo.filename.split('.')[-1]  # Get file extension (e.g., jpg, png)
     photo_filename = f"{chassis_number}.{file_extension}"  # Use chassis_number as the file name
 
-    # Read the image data as a BytesIO object
-    file_content = await chassis_photo.read()
-
-    # Upload the file to S3 using chassis_number as the name
-    s3_link = await utils.upload_image_to_s3(BytesIO(file_content), "tvstophaven", photo_filename)
+    # Upload the photo as-is using chassis_number as the name
+    with await imaging.ingest(chassis_photo, "chassis_photo") as photo, photo.open() as fileobj:
+        s3_link = await utils.upload_image_to_s3(fileobj, "tvstophaven", photo_filename)
 
     # Save the chassis number, S3 link, and user who uploaded the file in the database
     new_chassis = models.Chassis(
@@ -45,8 +41,8 @@ async def upload_chassis_data(
     )
     
     db.add(new_chassis)
-    db.commit()     
-    db.refresh(new_chassis)
+    await db.commit()
+    await db.refresh(new_chassis)
 
     return new_chassis  
 
@@ -3,6 +3,7 @@ from fastapi.security.oauth2 import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 import models, schemas, utils, database, oauth2
 from oauth2 import create_access_token
+import roles
 
 
 
@@ -27,7 +28,7 @@ def login(user_credentials: OAuth2PasswordRequestForm = Depends(), db: Session =
             status_code=status.HTTP_403_FORBIDDEN, detail="User account is inactive")
 
     access_token_user = create_access_token(data={"user_id": user.user_id})
-    role_name = db.query(models.Role.role_name).filter(models.Role.role_id==user.role_id).scalar()
+    role_name = roles.role_name(db, user.role_id)
     response = {
         "access_token": access_token_user,
         "token_type": "bearer",
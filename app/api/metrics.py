@@ -0,0 +1,42 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+import oauth2
+import database
+import image_executor
+import image_jobs
+import process_pdf
+
+
+router = APIRouter(
+    prefix="/metrics",
+    tags=["Metrics"],
+    dependencies=[Depends(oauth2.get_current_user)]
+)
+
+
+@router.get("/image-executor")
+def get_image_executor_metrics():
+    # Queue wait vs. processing time for the image process pool
+    return image_executor.executor.metrics()
+
+
+
+@router.get("/tick-box-index")
+def get_tick_box_index_metrics():
+    # How often PDF tick placement skipped the get_drawings() scan
+    return process_pdf.box_index.metrics()
+
+
+@router.get("/db-pool")
+def get_db_pool_metrics():
+    # Connections in use and how long requests waited for one
+    return {
+        "sync": database.pool_metrics(database.engine),
+        "async": database.pool_metrics(database.async_engine),
+    }
+
+
+@router.get("/image-jobs")
+async def get_image_job_metrics(db: AsyncSession = Depends(database.get_async_db)):
+    # Background image jobs by status
+    return await image_jobs.queue_metrics(db)
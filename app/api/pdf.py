@@ -1,13 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, FastAPI, File, UploadFile, Form
-from fastapi.responses import FileResponse
-from typing import List
-from process_pdf import add_stamps_and_signature
-import fitz  
-from PIL import Image
+from fastapi import APIRouter, HTTPException, File, UploadFile, Form
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response
+from urllib.parse import quote
+from process_pdf import compile_plan, stamp_pdf_bytes
 import json
 import os
-import uuid
-import cv2
 
 router = APIRouter(
     prefix="/pdf",
@@ -16,30 +13,45 @@ router = APIRouter(
 
 # Directories
 STAMPS_DIR = "./stamps/"
-SIGNATURES_DIR = "./uploads/signatures/"
-OUTPUT_DIR = "./uploads/output/"
-CHASSIS_IMAGE_DIR = "./uploads/chassis/"
 
 
 # Ensure directories exist
 os.makedirs(STAMPS_DIR, exist_ok=True)
-os.makedirs(SIGNATURES_DIR, exist_ok=True)
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-os.makedirs(CHASSIS_IMAGE_DIR, exist_ok=True)
 
 
-with open("placement_config.json", "r") as config_file:
-    placement_config = json.load(config_file)
-with open("form21_config.json", "r") as config_file:
-    form21_config = json.load(config_file)
-with open("invoice_config.json","r") as config_file:
-    invoice_config = json.load(config_file)
-with open("disclaimer_config.json","r") as config_file:
-    disclaimer_config = json.load(config_file)
-with open("helmetcert_config.json","r") as config_file:
-    helmetcert_config = json.load(config_file)
-with open("inspection_config.json","r") as config_file:
-    inspection_config = json.load(config_file)
+def load_plan(config_path):
+    # Parse and validate the config once at import; a bad config fails startup
+    # instead of the first request that uses it.
+    with open(config_path, "r") as config_file:
+        return compile_plan(json.load(config_file))
+
+
+placement_config = load_plan("placement_config.json")
+form21_config = load_plan("form21_config.json")
+invoice_config = load_plan("invoice_config.json")
+disclaimer_config = load_plan("disclaimer_config.json")
+helmetcert_config = load_plan("helmetcert_config.json")
+inspection_config = load_plan("inspection_config.json")
+
+
+def pdf_response(content: bytes, filename: str) -> Response:
+    # Same Content-Disposition FileResponse would send, without a file on disk
+    if quote(filename) != filename:
+        disposition = f"attachment; filename*=utf-8''{quote(filename)}"
+    else:
+        disposition = f'attachment; filename="{filename}"'
+    return Response(content, media_type='application/pdf', headers={"Content-Disposition": disposition})
+
+
+async def process_in_memory(pdf_bytes, signature_bytes, config, finance_company, text_inputs, chassis_image_bytes=None) -> bytes:
+    # Stamping and re-serialising the whole document is CPU-bound, so it runs
+    # on the threadpool rather than on the event loop
+    try:
+        return await run_in_threadpool(
+            stamp_pdf_bytes, pdf_bytes, signature_bytes, config, finance_company, text_inputs, chassis_image_bytes
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing PDF: {e}")
 
 
 @router.post("/process_pdf/invoice")
@@ -49,30 +61,11 @@ async def process_pdf(pdf: UploadFile = File(...), signature: UploadFile = File(
     if signature.content_type not in ["image/png", "image/jpeg"]:
         raise HTTPException(status_code=400, detail="Signature must be an image (PNG or JPEG).")
     
-    # Save uploaded files temporarily
-    pdf_id = str(uuid.uuid4())
-    pdf_path = os.path.join(OUTPUT_DIR, f"{pdf_id}_{pdf.filename}")
-    signature_path = os.path.join(SIGNATURES_DIR, f"{pdf_id}_{signature.filename}")
     finance_company = ''
     text_inputs = ''
-    with open(pdf_path, "wb") as pdf_file:
-        pdf_file.write(await pdf.read())
+    output = await process_in_memory(await pdf.read(), await signature.read(), invoice_config, finance_company, text_inputs)
     
-    with open(signature_path, "wb") as sig_file:
-        sig_file.write(await signature.read())
-    
-    # Process the PDF
-    output_pdf_path = os.path.join(OUTPUT_DIR, f"processed_{pdf_id}_{pdf.filename}")
-    try:
-        add_stamps_and_signature(pdf_path, signature_path, output_pdf_path, invoice_config, finance_company,text_inputs)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error processing PDF: {e}")
-    finally:
-        # Clean up temporary files
-        os.remove(pdf_path)
-        os.remove(signature_path)
-    
-    return FileResponse(output_pdf_path, filename=f"processed_{pdf.filename}", media_type='application/pdf')
+    return pdf_response(output, f"processed_{pdf.filename}")
 
 
 
@@ -82,30 +75,13 @@ async def process_pdf(pdf: UploadFile = File(...), signature: UploadFile = File(
 async def process_pdf(pdf: UploadFile = File(...)):
     if pdf.content_type != "application/pdf":
         raise HTTPException(status_code=400, detail="Uploaded file is not a PDF.")
-   
-    # Save uploaded files temporarily
-    pdf_id = str(uuid.uuid4())
-    pdf_path = os.path.join(OUTPUT_DIR, f"{pdf_id}_{pdf.filename}")
-    
-    with open(pdf_path, "wb") as pdf_file:
-        pdf_file.write(await pdf.read())
-    
 
-    signature_path=''
+    signature_bytes = None
     finance_company = ''
     text_inputs = ''
-    # Process the PDF
-    output_pdf_path = os.path.join(OUTPUT_DIR, f"processed_{pdf_id}_{pdf.filename}")
-    try:
-        add_stamps_and_signature(pdf_path, signature_path, output_pdf_path, form21_config, finance_company, text_inputs)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error processing PDF: {e}")
-    finally:
-        # Clean up temporary files
-        os.remove(pdf_path)
-     
+    output = await process_in_memory(await pdf.read(), signature_bytes, form21_config, finance_company, text_inputs)
     
-    return FileResponse(output_pdf_path, filename=f"processed_{pdf.filename}", media_type='application/pdf')
+    return pdf_response(output, f"processed_{pdf.filename}")
 
 
 
@@ -116,32 +92,12 @@ async def process_pdf(pdf: UploadFile = File(...), signature: UploadFile = File(
     if signature.content_type not in ["image/png", "image/jpeg"]:
         raise HTTPException(status_code=400, detail="Signature must be an image (PNG or JPEG).")
     
-    # Save uploaded files temporarily
-    pdf_id = str(uuid.uuid4())
-    pdf_path = os.path.join(OUTPUT_DIR, f"{pdf_id}_{pdf.filename}")
-    signature_path = os.path.join(SIGNATURES_DIR, f"{pdf_id}_{signature.filename}")
-    
     text_inputs = {
         "date": date
     }
-    with open(pdf_path, "wb") as pdf_file:
-        pdf_file.write(await pdf.read())
-    
-    with open(signature_path, "wb") as sig_file:
-        sig_file.write(await signature.read())
+    output = await process_in_memory(await pdf.read(), await signature.read(), placement_config, finance_company, text_inputs)
     
-    # Process the PDF
-    output_pdf_path = os.path.join(OUTPUT_DIR, f"processed_{pdf_id}_{pdf.filename}")
-    try:
-        add_stamps_and_signature(pdf_path, signature_path, output_pdf_path, placement_config, finance_company,text_inputs)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error processing PDF: {e}")
-    finally:
-        # Clean up temporary files
-        os.remove(pdf_path)
-        os.remove(signature_path)
-    
-    return FileResponse(output_pdf_path, filename=f"processed_{pdf.filename}", media_type='application/pdf')
+    return pdf_response(output, f"processed_{pdf.filename}")
 
 
 
@@ -153,30 +109,11 @@ async def process_pdf(pdf: UploadFile = File(...), signature: UploadFile = File(
     if signature.content_type not in ["image/png", "image/jpeg"]:
         raise HTTPException(status_code=400, detail="Signature must be an image (PNG or JPEG).")
     
-    # Save uploaded files temporarily
-    pdf_id = str(uuid.uuid4())
-    pdf_path = os.path.join(OUTPUT_DIR, f"{pdf_id}_{pdf.filename}")
-    signature_path = os.path.join(SIGNATURES_DIR, f"{pdf_id}_{signature.filename}")
-    
-    with open(pdf_path, "wb") as pdf_file:
-        pdf_file.write(await pdf.read())
-    
-    with open(signature_path, "wb") as sig_file:
-        sig_file.write(await signature.read())
     finance_company =''
     text_inputs = ''
-    # Process the PDF
-    output_pdf_path = os.path.join(OUTPUT_DIR, f"processed_{pdf_id}_{pdf.filename}")
-    try:
-        add_stamps_and_signature(pdf_path, signature_path, output_pdf_path, disclaimer_config, finance_company,text_inputs)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error processing PDF: {e}")
-    finally:
-        # Clean up temporary files
-        os.remove(pdf_path)
-        os.remove(signature_path)
+    output = await process_in_memory(await pdf.read(), await signature.read(), disclaimer_config, finance_company, text_inputs)
     
-    return FileResponse(output_pdf_path, filename=f"processed_{pdf.filename}", media_type='application/pdf')
+    return pdf_response(output, f"processed_{pdf.filename}")
 
 @router.post("/process_pdf/helmetcert")
 async def process_pdf_with_text(
@@ -191,20 +128,11 @@ async def process_pdf_with_text(
     if signature.content_type not in ["image/png", "image/jpeg"]:
         raise HTTPException(status_code=400, detail="Signature must be an image (PNG or JPEG).")
     
-    # Save uploaded files temporarily
-    pdf_id = str(uuid.uuid4())
-    pdf_path = os.path.join(OUTPUT_DIR, f"{pdf_id}_{pdf.filename}")
-    signature_path = os.path.join(SIGNATURES_DIR, f"{pdf_id}_{signature.filename}")
-    
     try:    
-        with open(pdf_path, "wb") as pdf_file:
-            pdf_file.write(await pdf.read())
-        
-        
-        with open(signature_path, "wb") as sig_file:            
-            sig_file.write(await signature.read())
+        pdf_bytes = await pdf.read()
+        signature_bytes = await signature.read()
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error saving files: {e}")
+        raise HTTPException(status_code=500, detail=f"Error reading files: {e}")
     
     finance_company = ''  # You can modify this based on user input
     
@@ -216,20 +144,9 @@ async def process_pdf_with_text(
         "manufac": "TVS"
     }
     
-    # Process the PDF
-    output_pdf_path = os.path.join(OUTPUT_DIR, f"processed_{pdf_id}_{pdf.filename}")
-    try:
-        add_stamps_and_signature(pdf_path, signature_path, output_pdf_path, helmetcert_config, finance_company, text_inputs)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error processing PDF: {e}")
-    finally:
-        # Clean up temporary files
-        if os.path.exists(pdf_path):
-            os.remove(pdf_path)
-        if os.path.exists(signature_path):
-            os.remove(signature_path)
+    output = await process_in_memory(pdf_bytes, signature_bytes, helmetcert_config, finance_company, text_inputs)
     
-    return FileResponse(output_pdf_path, filename=f"processed_{pdf.filename}", media_type='application/pdf')
+    return pdf_response(output, f"processed_{pdf.filename}")
 
 
 @router.post("/process_pdf/inspection_letter")
@@ -240,37 +157,14 @@ async def process_pdf(
     date: str = None):
     if pdf.content_type != "application/pdf":
         raise HTTPException(status_code=400, detail="Uploaded file is not a PDF.")
-   
-    # Save uploaded files temporarily
-    pdf_id = str(uuid.uuid4())
-    pdf_path = os.path.join(OUTPUT_DIR, f"{pdf_id}_{pdf.filename}")
-    chassis_image_path= os.path.join(CHASSIS_IMAGE_DIR, f"{pdf_id}_{chasis_number_pic.filename}")
-
-    with open(pdf_path, "wb") as pdf_file:
-        pdf_file.write(await pdf.read())
-    with open(chassis_image_path, "wb") as chasis_file:
-        chasis_file.write(await chasis_number_pic.read())
-    
 
-    signature_path=''
+    signature_bytes = None
     finance_company = ''
     text_inputs = {
         "sale_invoice_no": sale_invoice_no,
         "date": date
     }
     
-    # Process the PDF
-    output_pdf_path = os.path.join(OUTPUT_DIR, f"processed_{pdf_id}_{pdf.filename}")
-    try:
-        add_stamps_and_signature(pdf_path, signature_path, output_pdf_path, inspection_config, finance_company, text_inputs, chassis_image_path)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error processing PDF: {e}")
-    finally:
-        # Clean up temporary files
-        os.remove(pdf_path)
-     
+    output = await process_in_memory(await pdf.read(), signature_bytes, inspection_config, finance_company, text_inputs, await chasis_number_pic.read())
     
-    return FileResponse(output_pdf_path, filename=f"processed_{pdf.filename}", media_type='application/pdf')
-
-
-        
\ No newline at end of file
+    return pdf_response(output, f"processed_{pdf.filename}")
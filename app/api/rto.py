@@ -1,19 +1,22 @@
-from io import BytesIO
 import logging
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, status
 from fastapi.responses import JSONResponse
 
 from typing import List, Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 import models, schemas, database, oauth2
+from pagination import CustomerFilters, PageParams, paginate_async, project
+import reporting
 from datetime import datetime
-import utils
-import uuid
+import imaging
 import zipfile
 from fastapi.responses import StreamingResponse
 from botocore.exceptions import ClientError
 import io
-import requests
+import asyncio
+import httpx
 
 
 router = APIRouter(
@@ -30,14 +33,14 @@ def is_user_in_rto_role(user: models.User):
         )
 
 
-@router.get("/verified-customers", response_model=List[schemas.CustomerOut])
-def get_verified_customers(db: Session = Depends(database.get_db), current_user: models.User = Depends(oauth2.get_current_user)):
+@router.get("/verified-customers", response_model=schemas.Page[schemas.CustomerOut])
+async def get_verified_customers(page: PageParams = Depends(), filters: CustomerFilters = Depends(), db: AsyncSession = Depends(database.get_async_db), current_user: models.User = Depends(oauth2.get_current_user)):
     is_user_in_rto_role(current_user)
 
-   
-    customers = db.query(models.Customer).filter(models.Customer.rto_verified == True).all()
+    def query(session):
+        return project(session, schemas.CustomerOut).filter(models.Customer.rto_verified == True)
 
-    return customers
+    return await paginate_async(db, query, page, filters)
 
 
 @router.post("/verify/{customer_id}")
@@ -50,6 +53,8 @@ def verify_customer_rto(customer_id: int, db: Session = Depends(database.get_db)
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found.")
 
+    before = reporting.snapshot(customer)
+
     # Check if the customer is eligible for RTO verification
     if not (customer.sales_verified and customer.accounts_verified):
         raise HTTPException(status_code=400, detail="Customer must be sales and accounts verified before RTO verification.")
@@ -66,6 +71,7 @@ def verify_customer_rto(customer_id: int, db: Session = Depends(database.get_db)
     )
 
     db.add(verification_log)
+    reporting.record_change(db, before, customer)
     db.commit()
 
     return {"message": "Customer RTO registration successful"}
@@ -90,6 +96,8 @@ def update_customer(
     if customer is None:
         raise HTTPException(status_code=404, detail="Customer not found")
 
+    before = reporting.snapshot(customer)
+
     # Update fields if values are provided
     if first_name is not None:
         customer.first_name = first_name
@@ -104,6 +112,7 @@ def update_customer(
         customer.vehicle_number = vehicle_number
         customer.registered = True
 
+    reporting.record_change(db, before, customer)
     db.commit()
     db.refresh(customer)
 
@@ -111,38 +120,41 @@ def update_customer(
 
 
 
-@router.get("/pending-customers", response_model=List[schemas.CustomerOut])
-def get_pending_customers(db: Session = Depends(database.get_db), current_user: models.User = Depends(oauth2.get_current_user)):
+@router.get("/pending-customers", response_model=schemas.Page[schemas.CustomerOut])
+async def get_pending_customers(page: PageParams = Depends(), filters: CustomerFilters = Depends(), db: AsyncSession = Depends(database.get_async_db), current_user: models.User = Depends(oauth2.get_current_user)):
     is_user_in_rto_role(current_user)
 
     # Fetch customers who are eligible for RTO verification
-    customers = db.query(models.Customer).filter(
-        models.Customer.sales_verified == True,
-        models.Customer.accounts_verified == True,
-        models.Customer.rto_verified == False
-    ).all()
+    def query(session):
+        return project(session, schemas.CustomerOut).filter(
+            models.Customer.sales_verified == True,
+            models.Customer.accounts_verified == True,
+            models.Customer.rto_verified == False
+        )
+    result = await paginate_async(db, query, page, filters)
 
-    if not customers:
+    if not result["items"]:
         logging.info("No customers found matching the RTO criteria.")
     else:
-        logging.info(f"Found {len(customers)} customers matching RTO criteria.")
+        logging.info(f"Found {len(result['items'])} customers matching RTO criteria on this page.")
 
-    return customers
+    return result
 
 
 # Endpoint to get all customers eligible for RTO verification
-@router.get("/customer-list", response_model=List[schemas.CustomerOut])
-def get_customers(db: Session = Depends(database.get_db), current_user: models.User = Depends(oauth2.get_current_user)):
+@router.get("/customer-list", response_model=schemas.Page[schemas.CustomerOut])
+async def get_customers(page: PageParams = Depends(), filters: CustomerFilters = Depends(), db: AsyncSession = Depends(database.get_async_db), current_user: models.User = Depends(oauth2.get_current_user)):
     is_user_in_rto_role(current_user)
     
     # Fetch customers who are sales and accounts verified but not yet RTO verified
-    customers = db.query(models.Customer).filter(
-        models.Customer.sales_verified == True,
-        models.Customer.accounts_verified == True,
-        models.Customer.rto_verified == False
-    ).all()
+    def query(session):
+        return project(session, schemas.CustomerOut).filter(
+            models.Customer.sales_verified == True,
+            models.Customer.accounts_verified == True,
+            models.Customer.rto_verified == False
+        )
     
-    return customers
+    return await paginate_async(db, query, page, filters)
 
 
 
@@ -162,11 +174,6 @@ def get_customer_by_id(customer_id: int, db: Session = Depends(database.get_db))
 
 
 
-def generate_unique_filename(original_filename: str) -> str:
-    ext = original_filename.split('.')[-1]  # Get the file extension
-    unique_name = f"{uuid.uuid4()}.{ext}"  # Create a unique filename with the same extension
-    return unique_name
-
 
 
 
@@ -174,75 +181,126 @@ def generate_unique_filename(original_filename: str) -> str:
 @router.post("/combineadhaar/{customer_id}",response_model=schemas.CustomerOut)
 async def combine_adhaar(
     customer_id: int,
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_async_db),
     aadhaar_front_photo: UploadFile = File(...),
     aadhaar_back_photo: UploadFile = File(...),
 ):
-    customer = db.query(models.Customer).filter(models.Customer.customer_id == customer_id).first()
-
-    aadhaar_front_io = BytesIO(aadhaar_front_photo.file.read())
-    aadhaar_back_io = BytesIO(aadhaar_back_photo.file.read())
-    combined_adhaar = utils.combine_images_vertically(aadhaar_front_io,aadhaar_back_io)
-    combined_adhaar_io = BytesIO(combined_adhaar.read())
-    compressed_adhaar = await utils.compress_image(combined_adhaar_io)
-    aadhaar_filename = generate_unique_filename("aadhaarcombined.jpg")
+    customer = await db.scalar(select(models.Customer).filter(models.Customer.customer_id == customer_id))
+    if not customer:
+        raise HTTPException(status_code=404, detail="Customer not found.")
 
-    aadhaar_combined_url = await utils.upload_image_to_s3(compressed_adhaar, "tvstophaven", aadhaar_filename)
+    with await imaging.ingest(aadhaar_front_photo, "adhaar_front") as front, \
+            await imaging.ingest(aadhaar_back_photo, "adhaar_back") as back:
+        aadhaar_combined_url = await imaging.upload_combined(
+            front, back, "aadhaarcombined.jpg", "tvstophaven", max_dimension=imaging.max_dimension_for("adhaar_front")
+        )
 
     customer.photo_adhaar_combined = aadhaar_combined_url
 
-    db.commit()
-    db.refresh(customer)
+    await db.commit()
+    await db.refresh(customer)
     return customer
 
 
 BUCKET_NAME = "tvstophaven"
 
+# Images fetched at once per download; also bounds how many fetched images
+# can sit in memory waiting to be written to the ZIP stream.
+DOWNLOAD_CONCURRENCY = 4
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(30.0),
+            limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+        )
+    return _http_client
+
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+class _ZipChunkWriter:
+    """Write-only sink for zipfile; the response drains it after every entry.
+
+    It has no tell()/seek(), so zipfile writes data descriptors and never
+    needs to go back and patch headers, which is what makes streaming work.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def _stream_images_zip(image_urls: List[schemas.ImageUrl]):
+    client = get_http_client()
+    semaphore = asyncio.Semaphore(DOWNLOAD_CONCURRENCY)
+    fetched = asyncio.Queue(maxsize=DOWNLOAD_CONCURRENCY)
+
+    async def fetch(image: schemas.ImageUrl):
+        # The slot is held until the image is handed to the writer, so memory
+        # stays bounded no matter how many documents are requested.
+        async with semaphore:
+            content = None
+            try:
+                image_url = str(image.url)
+                response = await client.get(image_url)
+                if response.status_code == 200:
+                    content = response.content
+                else:
+                    logging.error(f"Failed to download {image.name} from {image_url}")
+            except Exception as e:
+                logging.error(f"Error downloading image {image.name}: {e}")
+            await fetched.put((image.name, content))
+
+    tasks = [asyncio.create_task(fetch(image)) for image in image_urls]
+    writer = _ZipChunkWriter()
+    missing_files = []
+    try:
+        # Images are already compressed, so store them rather than deflate
+        with zipfile.ZipFile(writer, "w", zipfile.ZIP_STORED) as zip_file:
+            for _ in range(len(tasks)):
+                name, content = await fetched.get()
+                if content is None:
+                    missing_files.append(name)
+                    continue
+                zip_file.writestr(name, content)
+                yield writer.drain()
+
+            if missing_files:
+                # Headers are long gone by now, so report failures inside the archive
+                zip_file.writestr("MISSING_FILES.txt", "\n".join(missing_files))
+        yield writer.drain()
+    finally:
+        for task in tasks:
+            task.cancel()
+
 
 @router.post("/download-images/")
 async def download_images(request: schemas.DownloadRequest):
-    try:
-        # Buffer for the ZIP file
-        zip_buffer = io.BytesIO()
-
-        # Initialize missing_files list
-        missing_files = []
-
-        # Create a ZipFile object in memory
-        with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-            for image in request.image_urls:
-                try:
-                    # Cast the URL to a string explicitly
-                    image_url = str(image.url)
-
-                    # Fetch the image from the provided URL
-                    response = requests.get(image_url)
-
-                    # Check if the request was successful
-                    if response.status_code == 200:
-                        # Add the file to the ZIP
-                        zip_file.writestr(image.name, response.content)
-                    else:
-                        logging.error(f"Failed to download {image.name} from {image_url}")
-                        missing_files.append(image.name)
-                except Exception as e:
-                    logging.error(f"Error downloading image {image.name}: {e}")
-                    missing_files.append(image.name)
-
-        # Prepare the response
-        zip_buffer.seek(0)  # Move pointer to the beginning for reading
-
-        if missing_files:
-            return JSONResponse(
-                status_code=206,
-                content={"message": "Download partially completed", "missing_files": missing_files}
-            )
-
-        return StreamingResponse(
-            zip_buffer,
-            media_type="application/zip",
-            headers={"Content-Disposition": f"attachment; filename=customer_{request.customer_id}_documents.zip"}
-        )
-    except Exception as e:
-        logging.error(f"Error creating zip file: {e}")
-        raise HTTPException(status_code=500, detail="Failed to create ZIP file.")
+    # Each image is written to the response as soon as it arrives, so the
+    # first bytes go out without waiting for the slowest download.
+    return StreamingResponse(
+        _stream_images_zip(request.image_urls),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename=customer_{request.customer_id}_documents.zip"}
+    )
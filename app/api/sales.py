@@ -1,19 +1,17 @@
-from io import BytesIO
-import uuid
 from fastapi import APIRouter, Depends, File, HTTPException, UploadFile, Form, status
 from typing import List, Optional
-import utils
-import io
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from uuid import uuid4
-import models, schemas, database, oauth2, utils
+import models, schemas, database, oauth2, imaging
+from pagination import CustomerFilters, PageParams, paginate_async, project
+from dashboard import invalidate_sales_dashboard, sales_dashboard_stats
+import reporting
 from schemas import CustomerResponse , CustomerUpdate, CustomerUpdatesales
 from sqlalchemy import func
 from datetime import datetime
-from PIL import Image
 from decimal import Decimal
-import cv2
-import numpy as np
 import logging
 
 
@@ -24,77 +22,12 @@ router = APIRouter(
 )
 
 
-def remove_background(image: UploadFile) -> BytesIO:
-    # Read the uploaded image as a numpy array using OpenCV
-    file_bytes = np.frombuffer(image.file.read(), np.uint8)
-    img = cv2.imdecode(file_bytes, cv2.IMREAD_GRAYSCALE)
-
-    # Define a threshold for the background
-    thresh = 110
-    
-    # Threshold the image to create a binary image
-    _, img_thresh = cv2.threshold(img, thresh, 255, cv2.THRESH_BINARY)
-
-    # Convert the thresholded image back to PIL Image for further processing
-    img_pil = Image.fromarray(img_thresh).convert("RGBA")
-    
-    # Load the pixel data from the image
-    pixdata = img_pil.load()
-
-    # Get the width and height of the image
-    width, height = img_pil.size
-
-    # Loop over the pixels and make the white pixels transparent
-    for y in range(height):
-        for x in range(width):
-            if pixdata[x, y] == (255, 255, 255, 255):  # White pixel
-                pixdata[x, y] = (255, 255, 255, 0)     # Make transparent
-
-    # Save the modified image to a BytesIO object
-    transparent_image_io = BytesIO()
-    img_pil.save(transparent_image_io, format="PNG")
-    transparent_image_io.seek(0)
-
-    return transparent_image_io
-
-def combine_images_vertically(image1: UploadFile, image2: UploadFile) -> BytesIO:
-    # Open both images
-    image1 = Image.open(io.BytesIO(image1.file.read()))
-    image2 = Image.open(io.BytesIO(image2.file.read()))
-    
-    # Get the width and height of both images
-    width1, height1 = image1.size
-    width2, height2 = image2.size
-
-    # Create a new image with the width of the wider image and the combined height
-    total_height = height1 + height2
-    max_width = max(width1, width2)
-    
-    # Create a blank image for the combined result
-    combined_image = Image.new("RGB", (max_width, total_height))
-    
-    # Paste the first image at the top and the second image below it
-    combined_image.paste(image1, (0, 0))
-    combined_image.paste(image2, (0, height1))
-    
-    # Save combined image to BytesIO
-    combined_image_bytes = BytesIO()
-    combined_image.save(combined_image_bytes, format='JPEG')
-    combined_image_bytes.seek(0)
-    
-    return combined_image_bytes
-
-
 def is_user_in_sales_role(user: models.User):
     if user.role_id != 2:  # Ensure the user is a sales executive
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="You do not have access to this resource"
         )
-def generate_unique_filename(original_filename: str) -> str:
-    ext = original_filename.split('.')[-1]  # Get the file extension
-    unique_name = f"{uuid.uuid4()}.{ext}"  # Create a unique filename with the same extension
-    return unique_name
 
 @router.get("/balances", response_model=List[schemas.CustomerBalanceOut])
 def get_pending_balances(db: Session = Depends(database.get_db), current_user: models.User = Depends(oauth2.get_current_user)):
@@ -111,90 +44,33 @@ def get_pending_balances(db: Session = Depends(database.get_db), current_user: m
     return customers_with_pending_balances
 
 
-async def compress_image(file, min_size_kb=300, max_size_kb=400) -> BytesIO:
-    # Check if input is `UploadFile`; if so, read it into `bytes`
-    if isinstance(file, UploadFile):
-        file_bytes = await file.read()  # Use await if it's an UploadFile
-        file_stream = BytesIO(file_bytes)
-    elif isinstance(file, BytesIO):
-        file_stream = file  # Already a BytesIO object
-    else:
-        raise TypeError("Unsupported file type. Must be UploadFile or BytesIO.")
-
-    # Open the image using PIL
-    image = Image.open(file_stream)
-
-    # Convert to RGB if necessary
-    if image.mode in ("RGBA", "P"):
-        image = image.convert("RGB")
-
-    quality = 85
-    compressed_image = BytesIO()
-
-    while True:
-        compressed_image.seek(0)
-        compressed_image.truncate(0)
-        
-        image.save(compressed_image, format='JPEG', quality=quality)
-        size_kb = compressed_image.tell() / 1024
-        
-        # Check size constraints
-        if min_size_kb <= size_kb <= max_size_kb:
-            break
-        elif size_kb < min_size_kb:
-            quality += 5
-        else:
-            quality -= 5
-
-        if quality < 10 or quality > 95:
-            break
-
-    compressed_image.seek(0)
-    return compressed_image
-
-
-
-def generate_unique_filename(original_filename: str) -> str:
-    ext = original_filename.split('.')[-1]
-    unique_name = f"{uuid.uuid4()}.{ext}"
-    return unique_name
-
-
 @router.post("/customers/delivery-update/{customer_id}", response_model=schemas.CustomerResponse)
 async def update_customer(
     customer_id: int,
     number_plate_front: UploadFile = File(...),
     number_plate_back: UploadFile = File(...),
     delivery_photo: UploadFile = File(...),
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_async_db),
     current_user: models.User = Depends(oauth2.get_current_user)
 ):
     is_user_in_sales_role(current_user)
 
-    customer = db.query(models.Customer).filter(models.Customer.customer_id == customer_id).first()
+    customer = await db.scalar(select(models.Customer).filter(models.Customer.customer_id == customer_id))
     if customer is None:
         raise HTTPException(status_code=404, detail="Customer not found")
 
-    number_plate_front_filename = generate_unique_filename(number_plate_front.filename)
-    number_plate_back_filename = generate_unique_filename(number_plate_back.filename)
-    delivery_photo_filename = generate_unique_filename(delivery_photo.filename)
-
-    # Read the contents of UploadFile and wrap it in BytesIO
-    number_plate_front_bytes = BytesIO(await number_plate_front.read())
-    number_plate_back_bytes = BytesIO(await number_plate_back.read())
-    delivery_photo_bytes = BytesIO(await delivery_photo.read())
-
-    # Call your upload function with the BytesIO objects
-    number_plate_front_url = await utils.upload_image_to_s3(number_plate_front_bytes, "tvstophaven", number_plate_front_filename)
-    number_plate_back_url = await utils.upload_image_to_s3(number_plate_back_bytes, "tvstophaven", number_plate_back_filename)
-    delivery_photo_url = await utils.upload_image_to_s3(delivery_photo_bytes, "tvstophaven", delivery_photo_filename)
-
-    customer.number_plate_front = number_plate_front_url
-    customer.number_plate_back = number_plate_back_url
-    customer.delivery_photo = delivery_photo_url
-
-    db.commit()
-    db.refresh(customer)
+    # Upload all three photos concurrently
+    uploads = [
+        imaging.ImageUpload("number_plate_front", number_plate_front, number_plate_front.filename, compress=False),
+        imaging.ImageUpload("number_plate_back", number_plate_back, number_plate_back.filename, compress=False),
+        imaging.ImageUpload("delivery_photo", delivery_photo, delivery_photo.filename, compress=False),
+    ]
+    image_urls = await imaging.upload_images(uploads, "tvstophaven")
+    for field, url in image_urls.items():
+        setattr(customer, field, url)
+
+    await db.commit()
+    await db.refresh(customer)
     return customer
 
 
@@ -203,36 +79,28 @@ async def update_customer_adhaar(
     customer_id: int,
     aadhaar_front_photo: UploadFile = File(...),
     aadhaar_back_photo: UploadFile = File(...),
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_async_db),
     current_user: models.User = Depends(oauth2.get_current_user)
 ):
     is_user_in_sales_role(current_user)
     
-    customer = db.query(models.Customer).filter(models.Customer.customer_id == customer_id).first()
+    customer = await db.scalar(select(models.Customer).filter(models.Customer.customer_id == customer_id))
     if customer is None:
         raise HTTPException(status_code=404, detail="Customer not found")
 
-    # Compress the Aadhaar front and back images
-    aadhaar_front_io = BytesIO(aadhaar_front_photo.file.read())
-    aadhaar_back_io = BytesIO(aadhaar_back_photo.file.read())
-
-    compressed_aadhaar_front = await compress_image(aadhaar_front_io)
-    compressed_aadhaar_back = await compress_image(aadhaar_back_io)
+    # Compress and upload the Aadhaar front and back images concurrently
+    uploads = [
+        imaging.ImageUpload("adhaar_front", aadhaar_front_photo, "aadhaar_front.jpg"),
+        imaging.ImageUpload("adhaar_back", aadhaar_back_photo, "aadhaar_back.jpg"),
+    ]
+    image_urls = await imaging.upload_images(uploads, "tvstophaven")
 
-    # Generate unique filenames
-    aadhaar_front_filename = generate_unique_filename("aadhaar_front.jpg")
-    aadhaar_back_filename = generate_unique_filename("aadhaar_back.jpg")
-
-    # Upload to S3
-    aadhaar_front_url = await utils.upload_image_to_s3(compressed_aadhaar_front, "tvstophaven", aadhaar_front_filename)
-    aadhaar_back_url = await utils.upload_image_to_s3(compressed_aadhaar_back, "tvstophaven", aadhaar_back_filename)
-    
     # Update customer record with separate Aadhaar images
-    customer.adhaar_front = aadhaar_front_url
-    customer.adhaar_back = aadhaar_back_url
-    
-    db.commit()
-    db.refresh(customer)
+    for field, url in image_urls.items():
+        setattr(customer, field, url)
+
+    await db.commit()
+    await db.refresh(customer)
     
     return customer
 
@@ -243,27 +111,26 @@ async def update_customer(
     customer_id: int,
     aadhaar_front_photo: UploadFile = File(...),
     aadhaar_back_photo: UploadFile = File(...),
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_async_db),
     current_user: models.User = Depends(oauth2.get_current_user)
 ):
     is_user_in_sales_role(current_user)
     
-    customer = db.query(models.Customer).filter(models.Customer.customer_id == customer_id).first()
+    customer = await db.scalar(select(models.Customer).filter(models.Customer.customer_id == customer_id))
     if customer is None:
         raise HTTPException(status_code=404, detail="Customer not found")
     
-    # Combine Aadhaar images
-    combined_aadhaar_image = combine_images_vertically(aadhaar_front_photo, aadhaar_back_photo)
-    compressed_combined_aadhaar = await compress_image(combined_aadhaar_image)
-    
-    # Upload to S3
-    aadhaar_combined_filename = generate_unique_filename("aadhaar_combined.jpg")
-    aadhaar_combined_url = await utils.upload_image_to_s3(compressed_combined_aadhaar, "tvstophaven", aadhaar_combined_filename)
+    # Combine, compress and upload the Aadhaar images
+    with await imaging.ingest(aadhaar_front_photo, "adhaar_front") as front, \
+            await imaging.ingest(aadhaar_back_photo, "adhaar_back") as back:
+        aadhaar_combined_url = await imaging.upload_combined(
+            front, back, "aadhaar_combined.jpg", "tvstophaven", max_dimension=imaging.max_dimension_for("adhaar_front")
+        )
     
     # Update customer record
     customer.photo_adhaar_combined = aadhaar_combined_url
-    db.commit()
-    db.refresh(customer)
+    await db.commit()
+    await db.refresh(customer)
     
     return customer
 
@@ -271,22 +138,21 @@ async def update_customer(
 async def update_customer(
     customer_id: int,
     passport_photo: UploadFile = File(...),
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_async_db),
     current_user: models.User = Depends(oauth2.get_current_user)
 ):
     is_user_in_sales_role(current_user)
     
-    customer = db.query(models.Customer).filter(models.Customer.customer_id == customer_id).first()
+    customer = await db.scalar(select(models.Customer).filter(models.Customer.customer_id == customer_id))
     if customer is None:
         raise HTTPException(status_code=404, detail="Customer not found")
 
-    passport_io = BytesIO(passport_photo.file.read())
-    compressed_passport = await compress_image(passport_io)
-    passport_compressed_filename = generate_unique_filename("passport.jpg")
-    passport_url =await utils.upload_image_to_s3(compressed_passport, "tvstophaven", passport_compressed_filename)
-    customer.photo_passport = passport_url
-    db.commit()
-    db.refresh(customer)
+    image_urls = await imaging.upload_images(
+        [imaging.ImageUpload("photo_passport", passport_photo, "passport.jpg")], "tvstophaven"
+    )
+    customer.photo_passport = image_urls["photo_passport"]
+    await db.commit()
+    await db.refresh(customer)
     return customer
 
 
@@ -294,35 +160,27 @@ async def update_customer(
 async def update_customer_sign(
     customer_id: int,
     customer_sign: UploadFile = File(...),
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_async_db),
     current_user: models.User = Depends(oauth2.get_current_user)
 ):
     is_user_in_sales_role(current_user)
     
     
-    customer = db.query(models.Customer).filter(models.Customer.customer_id == customer_id).first()
+    customer = await db.scalar(select(models.Customer).filter(models.Customer.customer_id == customer_id))
     if customer is None:
         raise HTTPException(status_code=404, detail="Customer not found")
     
     
-    sign_content = await customer_sign.read()
-    customer_sign_bytesio = BytesIO(sign_content)
-    
-    
-    compressed_sign = await compress_image(customer_sign_bytesio)
-
-    
-    sign_compressed_filename = generate_unique_filename("sign.png")
-    
-    compressed_sign.seek(0)
-    sign_url = await utils.upload_image_to_s3(compressed_sign, "tvstophaven", sign_compressed_filename)
+    image_urls = await imaging.upload_images(
+        [imaging.ImageUpload("customer_sign", customer_sign, "sign.png")], "tvstophaven"
+    )
 
    
-    customer.customer_sign = sign_url
+    customer.customer_sign = image_urls["customer_sign"]
 
     
-    db.commit()
-    db.refresh(customer)
+    await db.commit()
+    await db.refresh(customer)
 
     return customer
 
@@ -330,7 +188,7 @@ async def update_customer_sign(
 
 
 @router.put("/customers/{customer_id}", response_model=schemas.CustomerResponse)
-def update_customer(
+async def update_customer(
     customer_id: int,
     first_name: Optional[str] = Form(None),
     last_name: Optional[str] = Form(None),
@@ -353,17 +211,19 @@ def update_customer(
     optional_accessories: Optional[float] = Form(None),
     amount_paid: Optional[float] = Form(None),
     vehicle_number: Optional[str] = Form(None),
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_async_db),
     current_user: models.User = Depends(oauth2.get_current_user)
 ):
     # Check user role
     is_user_in_sales_role(current_user)
     
     # Fetch customer record
-    customer = db.query(models.Customer).filter(models.Customer.customer_id == customer_id).first()
+    customer = await db.scalar(select(models.Customer).filter(models.Customer.customer_id == customer_id))
     if customer is None:
         raise HTTPException(status_code=404, detail="Customer not found")
 
+    before = reporting.snapshot(customer)
+
     # Update fields if values are provided
     if first_name is not None:
         customer.first_name = first_name
@@ -437,8 +297,9 @@ def update_customer(
         customer.vehicle_number = vehicle_number
 
     # Commit changes to the database
-    db.commit()
-    db.refresh(customer)
+    await db.run_sync(reporting.record_change, before, customer)
+    await db.commit()
+    await db.refresh(customer)
 
     # Prepare response
     full_name = f"{customer.first_name} {customer.last_name}"
@@ -463,9 +324,9 @@ def update_customer(
 
 
 @router.post("/create-customer")
-def create_customer(
+async def create_customer(
     customer: schemas.CustomerBase,
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_async_db),
     current_user: models.User = Depends(oauth2.get_current_user)
 ):
     is_user_in_sales_role(current_user)
@@ -527,8 +388,9 @@ def create_customer(
     )
     
     db.add(new_customer)
-    db.commit()
-    db.refresh(new_customer)
+    await db.run_sync(reporting.record_change, None, new_customer)
+    await db.commit()
+    invalidate_sales_dashboard(new_customer.branch_id, new_customer.sales_executive_id)
     
     
     return {"customer_link": customer_link}
@@ -536,45 +398,38 @@ def create_customer(
 
 
 @router.get("/customer-verification/count")
-def customer_review_count_sales_executive(db: Session = Depends(database.get_db), current_user: models.User = Depends(oauth2.get_current_user)):
+async def customer_review_count_sales_executive(db: AsyncSession = Depends(database.get_async_db), current_user: models.User = Depends(oauth2.get_current_user)):
     if current_user.role_id != 2:
         raise HTTPException(status_code=403, detail="Not authorized.")
     
-    review_pending = db.query(models.Customer).filter(models.Customer.branch_id == current_user.branch_id,
-                                                 models.Customer.sales_executive_id== current_user.user_id,
-                                                 models.Customer.sales_verified==False,
-                                                 models.Customer.status=='submitted').count()
-    review_done = db.query(models.Customer).filter(models.Customer.branch_id == current_user.branch_id,
-                                                 models.Customer.sales_executive_id== current_user.user_id,
-                                                 models.Customer.sales_verified==True).count()
+    stats = await db.run_sync(sales_dashboard_stats, current_user.branch_id, current_user.user_id)
     return {
-        "reviews pending":review_pending,
-        "reviews Done":review_done
+        "reviews pending":stats["reviews_pending"],
+        "reviews Done":stats["reviews_done"]
     }
 
 
 @router.get("/customers/count")
-def get_customer_count_for_sales_executive(db: Session = Depends(database.get_db), current_user: models.User = Depends(oauth2.get_current_user)):
+async def get_customer_count_for_sales_executive(db: AsyncSession = Depends(database.get_async_db), current_user: models.User = Depends(oauth2.get_current_user)):
     if current_user.role_id != 2:
         raise HTTPException(status_code=403, detail="Not authorized.")
     
-    total_customers = db.query(models.Customer).filter(models.Customer.branch_id == current_user.branch_id,
-                                                 models.Customer.sales_executive_id== current_user.user_id).count()
-    
-    total_pending_customers = db.query(models.Customer).filter(models.Customer.branch_id == current_user.branch_id,
-                                                 models.Customer.sales_executive_id== current_user.user_id,
-                                                 models.Customer.status=="pending").count()
-    total_submitted_customers = db.query(models.Customer).filter(models.Customer.branch_id == current_user.branch_id,
-                                                 models.Customer.sales_executive_id== current_user.user_id,
-                                                 models.Customer.status=="submitted").count()
-    
+    stats = await db.run_sync(sales_dashboard_stats, current_user.branch_id, current_user.user_id)
     
-    
-    return {"total_count":total_customers,
-            "total_pending": total_pending_customers,
-            "total_submitted": total_submitted_customers
+    return {"total_count":stats["total_count"],
+            "total_pending": stats["total_pending"],
+            "total_submitted": stats["total_submitted"]
             }
 
+
+@router.get("/dashboard-stats", response_model=schemas.SalesDashboardStats)
+async def get_dashboard_stats(db: AsyncSession = Depends(database.get_async_db), current_user: models.User = Depends(oauth2.get_current_user)):
+    if current_user.role_id != 2:
+        raise HTTPException(status_code=403, detail="Not authorized.")
+
+    # Every dashboard bucket in one query, cached briefly per executive
+    return await db.run_sync(sales_dashboard_stats, current_user.branch_id, current_user.user_id)
+
 @router.get("/customers/count_per_day")
 def get_customer_count_per_day(db: Session = Depends(database.get_db), current_user: models.User = Depends(oauth2.get_current_user)):
     if current_user.role_id != 2:  # Check if the user is a sales executive
@@ -597,17 +452,19 @@ def get_customer_count_per_day(db: Session = Depends(database.get_db), current_u
 
 
 @router.post("/verify/{customer_id}")
-def verify_customer_sales(customer_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(oauth2.get_current_user)):
+async def verify_customer_sales(customer_id: int, db: AsyncSession = Depends(database.get_async_db), current_user: models.User = Depends(oauth2.get_current_user)):
     # Ensure the user is a sales executive (role_id == 2 for sales executive)
     if current_user.role_id != 2:
         raise HTTPException(status_code=403, detail="Not authorized.")
 
     # Retrieve the customer by ID
-    customer = db.query(models.Customer).filter(models.Customer.customer_id == customer_id).first()
+    customer = await db.scalar(select(models.Customer).filter(models.Customer.customer_id == customer_id))
 
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found.")
 
+    before = reporting.snapshot(customer)
+
     # Update the customer verification status for sales
     customer.sales_verified = True
     
@@ -619,21 +476,24 @@ def verify_customer_sales(customer_id: int, db: Session = Depends(database.get_d
     )
     
     db.add(verification_log)
-    db.commit()
+    await db.run_sync(reporting.record_change, before, customer)
+    await db.commit()
+    invalidate_sales_dashboard(customer.branch_id, customer.sales_executive_id)
 
     return {"message": "Customer sales verification completed."}
 
 
-@router.get("/customers", response_model=List[schemas.CustomerOutSales])
-def get_customers_for_sales_executive(db: Session = Depends(database.get_db), current_user: models.User = Depends(oauth2.get_current_user)):
+@router.get("/customers", response_model=schemas.Page[schemas.CustomerOutSales])
+async def get_customers_for_sales_executive(page: PageParams = Depends(), filters: CustomerFilters = Depends(), db: AsyncSession = Depends(database.get_async_db), current_user: models.User = Depends(oauth2.get_current_user)):
     if current_user.role_id != 2:
         raise HTTPException(status_code=403, detail="Not authorized.")
     
-    customers = db.query(models.Customer).filter(models.Customer.branch_id == current_user.branch_id,
-                                                 models.Customer.sales_executive_id== current_user.user_id).all()
+    def query(session):
+        return project(session, schemas.CustomerOutSales).filter(models.Customer.branch_id == current_user.branch_id,
+                                                     models.Customer.sales_executive_id== current_user.user_id)
 
     #will return the customers' data relevant to the sales executive
-    return customers
+    return await paginate_async(db, query, page, filters)
 
 
 @router.get("/customers/{customer_id}", response_model=schemas.CustomerOutSales)
@@ -668,7 +528,10 @@ def delete_customer(customer_id: int, db: Session = Depends(database.get_db)):
     db.query(models.VerificationLog).filter(models.VerificationLog.customer_id == customer_id).delete()
     
     # Delete the customer
+    branch_id, sales_executive_id = customer.branch_id, customer.sales_executive_id
+    reporting.record_change(db, reporting.snapshot(customer), None)
     db.delete(customer)
     db.commit()
+    invalidate_sales_dashboard(branch_id, sales_executive_id)
 
     return {"message": f"Customer with ID {customer_id} has been deleted successfully"}
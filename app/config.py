@@ -1,5 +1,6 @@
 from pydantic_settings import BaseSettings
 from pathlib import Path
+from typing import Optional
 
 class Settings(BaseSettings):
     database_hostname: str
@@ -17,6 +18,69 @@ class Settings(BaseSettings):
     redirect_uri: str
     # mail_pass: str
 
+    # Process pool for CPU-bound image work (see image_executor.py)
+    image_pool_workers: int = 2
+    image_pool_max_pending: int = 16
+    image_pool_retry_after: int = 5
+
+    # Shared S3 client (see s3_transport.py); set the endpoint for MinIO/moto
+    s3_max_pool_connections: int = 20
+    s3_endpoint_url: Optional[str] = None
+    s3_region_name: Optional[str] = None
+
+    # Longest side, in pixels, images are decoded to before processing
+    # (see imaging.decode_image); the per-field values override the default
+    image_max_dimension: int = 2500
+    image_max_dimension_passport: int = 1200
+    image_max_dimension_aadhaar: int = 2000
+    image_max_dimension_signature: int = 1200
+
+    # Upload ingestion (see imaging.ingest): files over the spool threshold
+    # are written to a temp file in upload_spool_dir (system default if unset)
+    upload_spool_threshold: int = 1024 * 1024
+    upload_spool_dir: Optional[str] = None
+    # Largest accepted upload in bytes; the per-field values override the default
+    upload_max_bytes: int = 15 * 1024 * 1024
+    upload_max_bytes_document: int = 10 * 1024 * 1024
+    upload_max_bytes_signature: int = 2 * 1024 * 1024
+
+    # Background image jobs (see image_jobs.py). Workers run inside the API
+    # process; set image_job_workers to 0 and run `python image_jobs.py`
+    # to process them elsewhere instead
+    image_job_workers: int = 1
+    image_job_poll_interval: float = 2.0
+    image_job_max_attempts: int = 5
+    # Seconds before the first retry; doubles with every further attempt
+    image_job_retry_delay: int = 5
+    # Seconds after which a running job whose worker died is claimed again
+    image_job_timeout: int = 300
+
+    # Files processed and uploaded at once per request by imaging.upload_images
+    upload_max_concurrency: int = 4
+
+    # Customer list pagination (see pagination.py)
+    page_size_default: int = 50
+    page_size_max: int = 200
+
+    # Seconds a sales executive's dashboard counts are cached (see dashboard.py)
+    dashboard_cache_ttl: int = 30
+
+    # Seconds before the in-process role map is reloaded (see roles.py)
+    role_cache_ttl: int = 300
+
+    # Authenticated user lookups cached by oauth2.get_current_user
+    user_cache_ttl: int = 60
+    user_cache_max_entries: int = 4096
+
+    # SQLAlchemy connection pool (see database.create_db_engine)
+    db_pool_size: int = 10
+    db_max_overflow: int = 10
+    db_pool_timeout: int = 10
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    # Per-statement timeout in milliseconds; 0 disables it
+    db_statement_timeout_ms: int = 30000
+
 
 
     class Config:
@@ -0,0 +1,39 @@
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+import models
+from cache import TTLCache
+from config import settings
+
+
+# Sales dashboards poll these counts; cache them briefly per executive and
+# drop the entry whenever one of their customers changes bucket.
+_sales_stats = TTLCache(ttl=settings.dashboard_cache_ttl)
+
+
+def sales_dashboard_stats(db: Session, branch_id, user_id) -> dict:
+    """All status buckets for one sales executive, from a single aggregate query."""
+    key = (branch_id, user_id)
+    stats = _sales_stats.get(key)
+    if stats is not None:
+        return stats
+
+    Customer = models.Customer
+    row = db.query(
+        func.count().label("total_count"),
+        func.count().filter(Customer.status == "pending").label("total_pending"),
+        func.count().filter(Customer.status == "submitted").label("total_submitted"),
+        func.count().filter(Customer.sales_verified == False, Customer.status == "submitted").label("reviews_pending"),
+        func.count().filter(Customer.sales_verified == True).label("reviews_done"),
+    ).filter(
+        Customer.branch_id == branch_id,
+        Customer.sales_executive_id == user_id,
+    ).one()
+
+    stats = dict(row._mapping)
+    _sales_stats.set(key, stats)
+    return stats
+
+
+def invalidate_sales_dashboard(branch_id, user_id):
+    _sales_stats.invalidate((branch_id, user_id))
@@ -1,15 +1,99 @@
-from sqlalchemy import create_engine
+import threading
+import time
+from sqlalchemy import create_engine, exc
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from config import settings
+from metrics import LatencyStat
 
 
 
 SQLALCHEMY_DATABASE_URL = f'postgresql://{settings.database_username}:{settings.database_password}@{settings.database_hostname}:{settings.database_port}/{settings.database_name}'
+ASYNC_SQLALCHEMY_DATABASE_URL = SQLALCHEMY_DATABASE_URL.replace('postgresql://', 'postgresql+asyncpg://', 1)
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+
+class _TimedCheckout:
+    """Pool mixin that times how long each checkout waits for a connection.
+
+    Counters live on the pool class so they survive the pool being recreated
+    after dispose() or an invalidation.
+    """
+
+    _lock = threading.Lock()
+
+    def _do_get(self):
+        started_at = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            with _TimedCheckout._lock:
+                type(self).timeouts += 1
+            raise
+        finally:
+            self.checkout_wait.record(time.perf_counter() - started_at)
+
+
+class InstrumentedQueuePool(_TimedCheckout, QueuePool):
+    checkout_wait = LatencyStat()
+    timeouts = 0
+
+
+class InstrumentedAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    checkout_wait = LatencyStat()
+    timeouts = 0
+
+
+def _pool_options() -> dict:
+    return dict(
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+        pool_pre_ping=settings.db_pool_pre_ping,
+    )
+
+
+def create_db_engine(url: str = SQLALCHEMY_DATABASE_URL):
+    connect_args = {}
+    if settings.db_statement_timeout_ms:
+        # Applied by Postgres to every statement on the connection
+        connect_args["options"] = f"-c statement_timeout={settings.db_statement_timeout_ms}"
+
+    return create_engine(url, poolclass=InstrumentedQueuePool, connect_args=connect_args, **_pool_options())
+
+
+def create_async_db_engine(url: str = ASYNC_SQLALCHEMY_DATABASE_URL):
+    connect_args = {}
+    if settings.db_statement_timeout_ms:
+        # asyncpg takes server settings directly instead of a libpq options string
+        connect_args["server_settings"] = {"statement_timeout": str(settings.db_statement_timeout_ms)}
+
+    return create_async_engine(url, poolclass=InstrumentedAsyncQueuePool, connect_args=connect_args, **_pool_options())
+
+
+def pool_metrics(bind=None) -> dict:
+    pool = (bind or engine).pool
+    return {
+        "size": pool.size(),
+        "max_overflow": settings.db_max_overflow,
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+        "timeouts": type(pool).timeouts,
+        "checkout_wait": type(pool).checkout_wait.snapshot(),
+    }
+
+
+engine = create_db_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async counterpart for handlers that run on the event loop. Objects stay
+# usable after commit so handlers can return them without another round trip.
+async_engine = create_async_db_engine()
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 
 
 
@@ -21,4 +105,9 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()  
\ No newline at end of file
+        db.close()  
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
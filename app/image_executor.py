@@ -0,0 +1,106 @@
+import asyncio
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from fastapi import HTTPException, status
+
+from config import settings
+from metrics import LatencyStat
+
+
+def _timed_call(fn, submitted_at: float, *args):
+    # Runs inside the worker process; wall-clock timestamps are comparable
+    # across processes on the same host.
+    started_at = time.time()
+    result = fn(*args)
+    return result, started_at - submitted_at, time.time() - started_at
+
+
+class ImageExecutor:
+    """Bounded process pool for CPU-bound image work.
+
+    At most ``max_pending`` jobs may be queued or running at once; beyond that
+    callers get a 503 with Retry-After instead of piling up behind the pool.
+    """
+
+    def __init__(self, max_workers: int, max_pending: int, retry_after: int):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.retry_after = retry_after
+
+        self._pool = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._rejected = 0
+        self.queue_wait = LatencyStat()
+        self.processing = LatencyStat()
+
+    def start(self):
+        with self._lock:
+            if self._pool is None:
+                # Spawn rather than fork: the server process already runs
+                # threads (anyio worker pool, S3 transfers).
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def _acquire_slot(self):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._rejected += 1
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Image processing is busy, please retry shortly.",
+                    headers={"Retry-After": str(self.retry_after)},
+                )
+            self._pending += 1
+
+    def _release_slot(self):
+        with self._lock:
+            self._pending -= 1
+
+    async def run(self, fn, *args):
+        """Run ``fn(*args)`` in the pool. ``fn`` and its arguments must be picklable."""
+        self._acquire_slot()
+        try:
+            self.start()
+            loop = asyncio.get_running_loop()
+            result, wait, elapsed = await loop.run_in_executor(
+                self._pool, _timed_call, fn, time.time(), *args
+            )
+        finally:
+            self._release_slot()
+
+        self.queue_wait.record(max(wait, 0.0))
+        self.processing.record(elapsed)
+        logging.debug(f"{fn.__name__}: waited {wait * 1000:.1f} ms, ran {elapsed * 1000:.1f} ms")
+        return result
+
+    def metrics(self) -> dict:
+        with self._lock:
+            pending, rejected = self._pending, self._rejected
+        return {
+            "workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "pending": pending,
+            "rejected": rejected,
+            "queue_wait": self.queue_wait.snapshot(),
+            "processing": self.processing.snapshot(),
+        }
+
+
+executor = ImageExecutor(
+    max_workers=settings.image_pool_workers,
+    max_pending=settings.image_pool_max_pending,
+    retry_after=settings.image_pool_retry_after,
+)
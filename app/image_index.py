@@ -0,0 +1,54 @@
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+
+import database
+import models
+
+
+# Index of content-addressed image objects (models.ImageObject) used by
+# imaging to skip work it has already done. Every call runs in its own short
+# session and commits straight away: once an object is in S3 it stays there
+# whether or not the request that uploaded it commits, so its index row must
+# not roll back with the request either.
+
+
+async def lookup(bucket_name: str, source_sha256: str, variant: str) -> Optional[str]:
+    """URL of the object stored for this source and processing variant, if any."""
+    ImageObject = models.ImageObject
+    async with database.AsyncSessionLocal() as session:
+        return await session.scalar(
+            select(ImageObject.url).filter(
+                ImageObject.bucket == bucket_name,
+                ImageObject.source_sha256 == source_sha256,
+                ImageObject.variant == variant,
+            )
+        )
+
+
+async def object_exists(bucket_name: str, object_key: str) -> bool:
+    ImageObject = models.ImageObject
+    async with database.AsyncSessionLocal() as session:
+        found = await session.scalar(
+            select(ImageObject.object_key)
+            .filter(ImageObject.bucket == bucket_name, ImageObject.object_key == object_key)
+            .limit(1)
+        )
+    return found is not None
+
+
+async def record(bucket_name: str, source_sha256: str, variant: str, object_key: str, url: str, size: int):
+    # Two requests racing on the same image store identical bytes under the
+    # same key, so whichever row lands first is as good as the other
+    statement = insert(models.ImageObject).values(
+        bucket=bucket_name,
+        source_sha256=source_sha256,
+        variant=variant,
+        object_key=object_key,
+        url=url,
+        size=size,
+    ).on_conflict_do_nothing()
+    async with database.AsyncSessionLocal() as session:
+        await session.execute(statement)
+        await session.commit()
@@ -0,0 +1,322 @@
+import argparse
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import and_, delete, exists, func, insert, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased, selectinload
+from starlette.datastructures import UploadFile
+
+import database
+import image_executor
+import imaging
+import models
+import s3_transport
+from config import settings
+
+
+# Durable queue for the image work behind the customer form, kept in
+# Postgres so it needs no broker. submit_customer_form stores the raw
+# uploads and a job in the same transaction as the form itself; workers
+# claim jobs with FOR UPDATE SKIP LOCKED, so any number of them, in the API
+# process or started with `python image_jobs.py`, can share the table
+# without running a job twice.
+
+BUCKET_NAME = "tvstophaven"
+
+# Raw uploads are stored as ImageJobBlobChunk rows of at most this many bytes
+BLOB_CHUNK_SIZE = 1024 * 1024
+
+_wakeup = asyncio.Event()
+_workers: List[asyncio.Task] = []
+
+
+async def enqueue(db: AsyncSession, customer: models.Customer, uploads: List[imaging.ImageUpload]):
+    """Queue ``uploads`` for ``customer``; nothing is stored until the caller commits.
+
+    UploadFiles go through imaging.ingest first, so oversized files are
+    rejected here, before the form is accepted. Each source is stored once,
+    however many uploads use it (a signature and its copy share one blob).
+    """
+    # Both collections start out loaded, so appending after a flush never
+    # tries to lazy load them
+    job = models.ImageJob(customer_id=customer.customer_id, files=[], blobs=[])
+    db.add(job)
+    blobs = {}
+    for upload in uploads:
+        if id(upload.source) not in blobs:
+            blobs[id(upload.source)] = await _store_blob(db, job, upload)
+        job.files.append(models.ImageJobFile(
+            field=upload.field,
+            filename=upload.filename,
+            compress=upload.compress,
+            remove_background=upload.remove_background,
+            blob=blobs[id(upload.source)],
+        ))
+
+    customer.processing_status = "pending"
+
+
+async def _store_blob(db: AsyncSession, job: models.ImageJob, upload: imaging.ImageUpload) -> models.ImageJobBlob:
+    # Copied from the spool a chunk at a time, so a large upload is never
+    # held in memory whole on its way into the table
+    source = upload.source
+    if isinstance(source, UploadFile):
+        source = await imaging.ingest(source, upload.field)
+    elif not isinstance(source, imaging.SpooledImage):
+        data = await imaging.read_image_input(source)
+        source = imaging.SpooledImage(upload.field, len(data), hashlib.sha256(data).hexdigest(), data=data)
+
+    try:
+        blob = models.ImageJobBlob(sha256=source.sha256, size=source.size)
+        job.blobs.append(blob)
+        await db.flush()
+
+        with source.open() as fileobj:
+            seq = 0
+            while chunk := await run_in_threadpool(fileobj.read, BLOB_CHUNK_SIZE):
+                await db.execute(insert(models.ImageJobBlobChunk).values(blob_id=blob.id, seq=seq, data=chunk))
+                seq += 1
+    finally:
+        if source is not upload.source:
+            source.close()
+    return blob
+
+
+async def _load_blob(db: AsyncSession, blob: models.ImageJobBlob, field: str) -> imaging.SpooledImage:
+    """Read a stored upload back the way imaging.ingest spools one.
+
+    Up to settings.upload_spool_threshold it is kept in memory; anything
+    larger goes to a temp file, a chunk at a time.
+    """
+    Chunk = models.ImageJobBlobChunk
+    chunks = await db.stream_scalars(select(Chunk.data).filter(Chunk.blob_id == blob.id).order_by(Chunk.seq))
+    if blob.size <= settings.upload_spool_threshold:
+        return imaging.SpooledImage(field, blob.size, blob.sha256, data=b"".join([chunk async for chunk in chunks]))
+
+    spill = tempfile.NamedTemporaryFile(dir=settings.upload_spool_dir, prefix="job-", delete=False)
+    try:
+        async for chunk in chunks:
+            await run_in_threadpool(spill.write, chunk)
+    except BaseException:
+        spill.close()
+        os.unlink(spill.name)
+        raise
+    spill.close()
+    return imaging.SpooledImage(field, blob.size, blob.sha256, path=spill.name)
+
+
+def notify():
+    # Wake this process's workers instead of waiting for their next poll
+    _wakeup.set()
+
+
+async def _claim(db: AsyncSession) -> Optional[models.ImageJob]:
+    ImageJob = models.ImageJob
+    now = datetime.utcnow()
+    stale = now - timedelta(seconds=settings.image_job_timeout)
+
+    # Jobs for one customer run in order, so a resubmitted form can never be
+    # overwritten by the images from an earlier submission
+    earlier = aliased(ImageJob)
+    earlier_unfinished = exists().where(
+        earlier.customer_id == ImageJob.customer_id,
+        earlier.id < ImageJob.id,
+        earlier.status.in_(("pending", "running")),
+    )
+
+    while True:
+        job = await db.scalar(
+            select(ImageJob)
+            .filter(
+                or_(
+                    and_(ImageJob.status == "pending", ImageJob.run_after <= now),
+                    and_(ImageJob.status == "running", ImageJob.locked_at < stale),
+                ),
+                ~earlier_unfinished,
+            )
+            .order_by(ImageJob.id)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        )
+        if job is None:
+            return None
+
+        if job.status == "running" and job.attempts >= settings.image_job_max_attempts:
+            # Its last attempt died (worker killed or stuck) without recording
+            # a result; give up on it rather than run it once more
+            await _fail(db, job, TimeoutError(f"no result within {settings.image_job_timeout}s"))
+            continue
+
+        job.status = "running"
+        job.locked_at = now
+        job.attempts += 1
+        await db.commit()
+        return job
+
+
+async def _is_latest(db: AsyncSession, job: models.ImageJob) -> bool:
+    # A resubmitted form queues another job; the customer's processing_status
+    # belongs to that one until it has finished
+    later = aliased(models.ImageJob)
+    return not await db.scalar(
+        select(exists().where(
+            later.customer_id == job.customer_id,
+            later.id > job.id,
+            later.status.in_(("pending", "running")),
+        ))
+    )
+
+
+async def _fail(db: AsyncSession, job: models.ImageJob, error: Exception):
+    job.last_error = f"{type(error).__name__}: {error}"
+    if job.attempts >= settings.image_job_max_attempts:
+        job.status = "failed"
+        customer = await db.get(models.Customer, job.customer_id)
+        if customer is not None and await _is_latest(db, job):
+            customer.processing_status = "failed"
+        logging.error(f"Image job {job.id} for customer {job.customer_id} failed after {job.attempts} attempts: {error}")
+    else:
+        delay = settings.image_job_retry_delay * 2 ** (job.attempts - 1)
+        job.status = "pending"
+        job.run_after = datetime.utcnow() + timedelta(seconds=delay)
+        logging.warning(f"Image job {job.id} for customer {job.customer_id} failed, retrying in {delay}s: {error}")
+    await db.commit()
+
+
+async def _run(job_id: int, locked_at: datetime):
+    ImageJob = models.ImageJob
+    ImageJobFile = models.ImageJobFile
+
+    # Load the uploads and let the session go: processing takes seconds and
+    # must not hold a pooled connection or an open transaction meanwhile
+    sources: Dict[int, imaging.SpooledImage] = {}
+    try:
+        async with database.AsyncSessionLocal() as db:
+            job = await db.scalar(
+                select(ImageJob)
+                .options(selectinload(ImageJob.files).selectinload(ImageJobFile.blob))
+                .filter(ImageJob.id == job_id)
+            )
+            if job is None:
+                # Deleted along with its customer
+                return
+            for file in job.files:
+                if file.blob_id not in sources:
+                    sources[file.blob_id] = await _load_blob(db, file.blob, file.field)
+            uploads = [
+                imaging.ImageUpload(file.field, sources[file.blob_id], file.filename, compress=file.compress, remove_background=file.remove_background)
+                for file in job.files
+            ]
+
+        error = None
+        try:
+            image_urls = await imaging.upload_images(uploads, BUCKET_NAME)
+        except Exception as e:
+            error = e
+    finally:
+        for source in sources.values():
+            source.close()
+
+    async with database.AsyncSessionLocal() as db:
+        job = await db.scalar(select(ImageJob).filter(ImageJob.id == job_id).with_for_update())
+        if job is None or job.status != "running" or job.locked_at != locked_at:
+            # Deleted with its customer, or taken over by another worker once
+            # image_job_timeout passed; whatever that one does stands
+            return
+
+        if error is not None:
+            await _fail(db, job, error)
+            return
+
+        customer = await db.get(models.Customer, job.customer_id)
+        if customer is not None:
+            for field, url in image_urls.items():
+                setattr(customer, field, url)
+            if await _is_latest(db, job):
+                customer.processing_status = "done"
+
+        # Keep the job as a record but drop the raw uploads
+        job.status = "done"
+        job.last_error = None
+        blob_ids = select(models.ImageJobBlob.id).filter(models.ImageJobBlob.job_id == job.id)
+        await db.execute(delete(models.ImageJobBlobChunk).filter(models.ImageJobBlobChunk.blob_id.in_(blob_ids)))
+        await db.execute(delete(ImageJobFile).filter(ImageJobFile.job_id == job.id))
+        await db.execute(delete(models.ImageJobBlob).filter(models.ImageJobBlob.job_id == job.id))
+        await db.commit()
+
+
+async def run_pending(limit: Optional[int] = None) -> int:
+    """Claim and run ready jobs until there are none left; returns how many ran."""
+    ran = 0
+    while limit is None or ran < limit:
+        async with database.AsyncSessionLocal() as db:
+            job = await _claim(db)
+        if job is None:
+            break
+        await _run(job.id, job.locked_at)
+        ran += 1
+    return ran
+
+
+async def worker():
+    while True:
+        try:
+            await run_pending()
+        except Exception as e:
+            logging.error(f"Image job worker error: {e}")
+
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=settings.image_job_poll_interval)
+        except asyncio.TimeoutError:
+            pass
+        _wakeup.clear()
+
+
+def start_workers(count: Optional[int] = None):
+    for _ in range(settings.image_job_workers if count is None else count):
+        _workers.append(asyncio.create_task(worker()))
+
+
+async def stop_workers():
+    # A job cut off here stays "running" and is picked up again once
+    # image_job_timeout has passed
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+
+
+async def queue_metrics(db: AsyncSession) -> dict:
+    ImageJob = models.ImageJob
+    rows = await db.execute(select(ImageJob.status, func.count()).group_by(ImageJob.status))
+    return dict(rows.all())
+
+
+async def main(once: bool = False, workers: int = 1):
+    image_executor.executor.start()
+    s3_transport.transport.start()
+    try:
+        if once:
+            logging.info(f"Ran {await run_pending()} image jobs")
+        else:
+            await asyncio.gather(*(worker() for _ in range(workers)))
+    finally:
+        image_executor.executor.shutdown()
+        s3_transport.transport.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Process queued customer image jobs.")
+    parser.add_argument("--once", action="store_true", help="run every ready job, then exit")
+    parser.add_argument("--workers", type=int, default=max(settings.image_job_workers, 1))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main(once=args.once, workers=args.workers))
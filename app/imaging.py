@@ -0,0 +1,620 @@
+import asyncio
+import hashlib
+import inspect
+import logging
+import math
+import os
+import tempfile
+import time
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Any, Dict, List, Optional, Union
+
+import cv2
+import numpy as np
+from fastapi import HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from PIL import Image
+# Requests hand endpoints Starlette's UploadFile; fastapi.UploadFile is only a
+# subclass of it, so isinstance checks against that would miss real uploads
+from starlette.datastructures import UploadFile
+
+import image_executor
+import image_index
+import s3_transport
+from config import settings
+from utils import upload_image_to_s3
+
+
+# Every router goes through these helpers for image work, so there is one
+# implementation of each transform and one place to change or measure it.
+# Anything handed to image_executor must stay a module-level function so the
+# spawned pool workers can import it by name.
+
+ImageInput = Union[UploadFile, "SpooledImage", BytesIO, bytes, bytearray, memoryview]
+
+# What pool workers receive: encoded bytes, or the path of a spooled upload
+ImageSource = Union[bytes, str]
+
+# Customer image fields with their own decode bound; anything else uses
+# settings.image_max_dimension.
+FIELD_MAX_DIMENSION_SETTINGS = {
+    "photo_passport": "image_max_dimension_passport",
+    "adhaar_front": "image_max_dimension_aadhaar",
+    "adhaar_back": "image_max_dimension_aadhaar",
+    "customer_sign": "image_max_dimension_signature",
+    "customer_sign_copy": "image_max_dimension_signature",
+}
+
+# Customer image fields with their own upload size limit; anything else uses
+# settings.upload_max_bytes.
+FIELD_MAX_BYTES_SETTINGS = {
+    "photo_passport": "upload_max_bytes_document",
+    "adhaar_front": "upload_max_bytes_document",
+    "adhaar_back": "upload_max_bytes_document",
+    "customer_sign": "upload_max_bytes_signature",
+    "customer_sign_copy": "upload_max_bytes_signature",
+}
+
+INGEST_CHUNK_SIZE = 256 * 1024
+
+# Stored objects are reused for the same source and processing variant (see
+# upload_images); bump this when a change here alters the processed output.
+PIPELINE_VERSION = 1
+
+
+class SpooledImage:
+    """An upload copied once, chunk by chunk, into memory or a temp file.
+
+    Uploads up to settings.upload_spool_threshold stay in memory; larger
+    ones are written to a temp file that pool workers open by path, so the
+    bytes never sit in the server's heap or get pickled across processes.
+    Use it as a context manager, or call close(), to remove the temp file.
+    """
+
+    def __init__(self, field: str, size: int, sha256: str, data: Optional[bytes] = None, path: Optional[str] = None):
+        self.field = field
+        self.size = size
+        self.sha256 = sha256
+        self.data = data
+        self.path = path
+
+    @property
+    def source(self) -> ImageSource:
+        return self.path if self.path is not None else self.data
+
+    def open(self):
+        """A new binary file object over the contents, e.g. for S3 uploads."""
+        if self.path is not None:
+            return open(self.path, "rb")
+        # BytesIO shares the bytes object's buffer until it is written to
+        return BytesIO(self.data)
+
+    def close(self):
+        if self.path is not None:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+        self.data = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def max_bytes_for(field: str) -> int:
+    return getattr(settings, FIELD_MAX_BYTES_SETTINGS.get(field, "upload_max_bytes"))
+
+
+async def ingest(upload: UploadFile, field: str) -> SpooledImage:
+    """Stream ``upload`` into a SpooledImage, hashing and size-checking it on the way.
+
+    Raises 413 as soon as more than the field's limit has been read, without
+    buffering the rest of the file.
+    """
+    limit = max_bytes_for(field)
+    digest = hashlib.sha256()
+    chunks = []
+    size = 0
+    spill = None
+
+    await upload.seek(0)
+    try:
+        while chunk := await upload.read(INGEST_CHUNK_SIZE):
+            size += len(chunk)
+            if size > limit:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=f"{field} is larger than the {limit / (1024 * 1024):g} MB limit.",
+                )
+            digest.update(chunk)
+
+            if spill is None and size > settings.upload_spool_threshold:
+                spill = tempfile.NamedTemporaryFile(dir=settings.upload_spool_dir, prefix="upload-", delete=False)
+                await run_in_threadpool(spill.writelines, chunks)
+                chunks = []
+            if spill is not None:
+                await run_in_threadpool(spill.write, chunk)
+            else:
+                chunks.append(chunk)
+    except BaseException:
+        if spill is not None:
+            spill.close()
+            os.unlink(spill.name)
+        raise
+
+    if spill is not None:
+        spill.close()
+        return SpooledImage(field, size, digest.hexdigest(), path=spill.name)
+    return SpooledImage(field, size, digest.hexdigest(), data=b"".join(chunks))
+
+
+async def read_image_input(source: ImageInput) -> bytes:
+    """Return the full contents of ``source`` as bytes.
+
+    Reads always start from the beginning, so the same UploadFile or buffer
+    can be passed to several helpers without being rewound in between.
+    """
+    if isinstance(source, bytes):
+        return source
+    if isinstance(source, SpooledImage):
+        if source.path is None:
+            return source.data
+        with open(source.path, "rb") as spooled:
+            return await run_in_threadpool(spooled.read)
+    if isinstance(source, (bytearray, memoryview)):
+        return bytes(source)
+    if isinstance(source, BytesIO):
+        # getvalue() ignores the read position and skips a second copy
+        return source.getvalue()
+    if isinstance(source, UploadFile):
+        await source.seek(0)
+        return await source.read()
+    if hasattr(source, "read"):
+        # Other binary file objects: sync ones such as a SpooledTemporaryFile,
+        # or async ones whose seek()/read() return awaitables
+        position = source.seek(0)
+        if inspect.isawaitable(position):
+            await position
+            return await source.read()
+        return await run_in_threadpool(source.read)
+    raise TypeError("Unsupported image input. Must be UploadFile, a binary buffer or bytes.")
+
+
+async def _image_source(source: ImageInput) -> ImageSource:
+    # Spooled uploads go to the pool by path; everything else as bytes
+    if isinstance(source, SpooledImage):
+        return source.source
+    return await read_image_input(source)
+
+
+def max_dimension_for(field: str) -> int:
+    return getattr(settings, FIELD_MAX_DIMENSION_SETTINGS.get(field, "image_max_dimension"))
+
+
+def decode_image(source: ImageSource, max_dimension: int) -> Image.Image:
+    """Decode ``source`` (bytes or a file path) with its longest side at most ``max_dimension``.
+
+    JPEGs are decoded straight at a reduced DCT scale (1/2, 1/4 or 1/8) via
+    draft(), choosing the smallest scale that still covers the target, so a
+    12 MP camera photo is never held in memory at full size. A LANCZOS
+    resample then takes it down to the exact bound.
+    """
+    image = Image.open(source if isinstance(source, str) else BytesIO(source))
+    longest = max(image.size)
+    if longest > max_dimension:
+        scale = max_dimension / longest
+        # Must run before anything loads the pixels; a no-op for non-JPEGs
+        image.draft(image.mode, (math.ceil(image.width * scale), math.ceil(image.height * scale)))
+        if image.mode == "P":
+            # Palette images only resize with NEAREST; keep LANCZOS quality
+            image = image.convert("RGBA")
+        image.thumbnail((max_dimension, max_dimension), Image.LANCZOS, reducing_gap=None)
+    return image
+
+
+def edge_detect_and_crop(contents: bytes) -> BytesIO:
+    npimg = np.frombuffer(contents, np.uint8)
+    image = cv2.imdecode(npimg, cv2.IMREAD_UNCHANGED)
+
+    if image is None:
+        raise ValueError("Could not decode the image.")
+
+    ratio = image.shape[0] / 500.0
+    orig = image.copy()
+    image = cv2.resize(image, (500, int(image.shape[1] * ratio)))
+
+    # Convert to grayscale
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    gray = cv2.GaussianBlur(gray, (5, 5), 0)
+    edged = cv2.Canny(gray, 75, 200)
+
+    cnts = cv2.findContours(edged.copy(), cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+    cnts = cnts[0] if len(cnts) == 2 else cnts[1]
+    cnts = sorted(cnts, key=cv2.contourArea, reverse=True)[:5]
+
+    screenCnt = None
+    for c in cnts:
+        peri = cv2.arcLength(c, True)
+        approx = cv2.approxPolyDP(c, 0.02 * peri, True)
+        if len(approx) == 4:
+            screenCnt = approx
+            break
+
+    if screenCnt is None:
+        raise ValueError("No document found")
+
+    warped = four_point_transform(orig, screenCnt.reshape(4, 2) * ratio)
+    
+    # Convert the cropped image back to a format suitable for return
+    img = cv2.cvtColor(warped, cv2.COLOR_BGR2RGB)
+    file_object = BytesIO()
+    img = Image.fromarray(img)
+    img.save(file_object, 'PNG')
+    file_object.seek(0)
+
+    return file_object
+
+def four_point_transform(image, pts):
+    rect = order_points(pts)  # Order points in a consistent manner
+    (tl, tr, br, bl) = rect  # Unpack ordered points
+
+    # Compute the width of the new image
+    widthA = np.linalg.norm(br - bl)
+    widthB = np.linalg.norm(tr - tl)
+    maxWidth = max(int(widthA), int(widthB))
+
+    # Compute the height of the new image
+    heightA = np.linalg.norm(tr - br)
+    heightB = np.linalg.norm(tl - bl)
+    maxHeight = max(int(heightA), int(heightB))
+
+    # Set destination points for the perspective transformation
+    dst = np.array([
+        [0, 0],
+        [maxWidth - 1, 0],
+        [maxWidth - 1, maxHeight - 1],
+        [0, maxHeight - 1]], dtype="float32")
+
+    # Compute the perspective transformation matrix
+    M = cv2.getPerspectiveTransform(rect, dst)
+    warped = cv2.warpPerspective(image, M, (maxWidth, maxHeight))
+
+    return warped  # Return the transformed image
+
+
+def order_points(pts):
+    # Initialize a list of coordinates
+    rect = np.zeros((4, 2), dtype="float32")
+
+    # Sum the coordinates to get top-left and bottom-right
+    s = pts.sum(axis=1)
+    rect[0] = pts[np.argmin(s)]  # Top-left
+    rect[2] = pts[np.argmax(s)]  # Bottom-right
+
+    # Compute the difference to get top-right and bottom-left
+    diff = np.diff(pts, axis=1)
+    rect[1] = pts[np.argmin(diff)]  # Top-right
+    rect[3] = pts[np.argmax(diff)]  # Bottom-left
+
+    return rect
+
+
+def _remove_background(source: ImageSource) -> bytes:
+    # Read the uploaded image as a numpy array using OpenCV
+    if isinstance(source, str):
+        file_bytes = np.fromfile(source, np.uint8)
+    else:
+        file_bytes = np.frombuffer(source, np.uint8)
+    img = cv2.imdecode(file_bytes, cv2.IMREAD_GRAYSCALE)
+
+    # Threshold the image to create a binary image
+    _, img_thresh = cv2.threshold(img, 110, 255, cv2.THRESH_BINARY)
+
+    # White pixels become fully transparent, everything else stays opaque.
+    # Building the alpha channel as one array op gives the same RGBA image as
+    # walking every pixel, without the per-pixel Python overhead.
+    alpha = np.where(img_thresh == 255, 0, 255).astype(np.uint8)
+    rgba = cv2.merge((img_thresh, img_thresh, img_thresh, alpha))
+    img_pil = Image.fromarray(rgba)
+
+    # Save the modified image as PNG
+    transparent_image_io = BytesIO()
+    img_pil.save(transparent_image_io, format="PNG")
+    return transparent_image_io.getvalue()
+
+
+async def remove_background(image: ImageInput) -> BytesIO:
+    source = await _image_source(image)
+    return BytesIO(await image_executor.executor.run(_remove_background, source))
+
+
+def _combine_images_vertically(image1_source: ImageSource, image2_source: ImageSource, max_dimension: int) -> bytes:
+    # Decode both images, each bounded to max_dimension
+    image1 = decode_image(image1_source, max_dimension)
+    image2 = decode_image(image2_source, max_dimension)
+    
+    # Get the width and height of both images
+    width1, height1 = image1.size
+    width2, height2 = image2.size
+
+    # Create a new image with the width of the wider image and the combined height
+    total_height = height1 + height2
+    max_width = max(width1, width2)
+    
+    # Create a blank image for the combined result
+    combined_image = Image.new("RGB", (max_width, total_height))
+    
+    # Paste the first image at the top and the second image below it
+    combined_image.paste(image1, (0, 0))
+    combined_image.paste(image2, (0, height1))
+    
+    # Save combined image as JPEG
+    combined_image_bytes = BytesIO()
+    combined_image.save(combined_image_bytes, format='JPEG')
+    return combined_image_bytes.getvalue()
+
+
+async def combine_images_vertically(image1: ImageInput, image2: ImageInput, max_dimension: Optional[int] = None) -> BytesIO:
+    image1_source = await _image_source(image1)
+    image2_source = await _image_source(image2)
+    max_dimension = max_dimension or settings.image_max_dimension
+    return BytesIO(await image_executor.executor.run(_combine_images_vertically, image1_source, image2_source, max_dimension))
+
+
+# Longest side of the thumbnail used to fit the quality -> size model.
+COMPRESS_TRIAL_DIMENSION = 512
+
+COMPRESS_MIN_QUALITY = 10
+COMPRESS_MAX_QUALITY = 95
+
+# Default size window for compress_image
+COMPRESS_MIN_KB = 300
+COMPRESS_MAX_KB = 400
+
+
+def _encode_jpeg(image: Image.Image, quality: int) -> bytes:
+    buffer = BytesIO()
+    image.save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def _fit_size_model(image: Image.Image):
+    """Fit log(size) = a + b * quality from two encodes of a small thumbnail.
+
+    JPEG size grows roughly exponentially with quality and roughly linearly
+    with pixel count, so the thumbnail sizes scaled by the pixel ratio give a
+    cheap first estimate of the full-resolution size at any quality.
+    """
+    trial = image.copy()
+    trial.thumbnail((COMPRESS_TRIAL_DIMENSION, COMPRESS_TRIAL_DIMENSION))
+    pixel_ratio = (image.width * image.height) / (trial.width * trial.height)
+
+    low_q, high_q = 40, 90
+    low_size = math.log(len(_encode_jpeg(trial, low_q)) * pixel_ratio)
+    high_size = math.log(len(_encode_jpeg(trial, high_q)) * pixel_ratio)
+
+    slope = (high_size - low_size) / (high_q - low_q)
+    intercept = low_size - slope * low_q
+    return intercept, slope
+
+
+def _predict_quality(model, target_bytes: float, lo: int, hi: int, under=None, over=None) -> int:
+    """Pick the next quality to try inside the current [lo, hi] bracket.
+
+    Once encodes on both sides of the window exist, interpolate log(size)
+    between them; before that, use the thumbnail model shifted to match the
+    last real encode.
+    """
+    if under is not None and over is not None:
+        (q1, s1), (q2, s2) = under, over
+        slope = (math.log(s2) - math.log(s1)) / (q2 - q1)
+        intercept = math.log(s1) - slope * q1
+    else:
+        intercept, slope = model
+        last = under or over
+        if last is not None:
+            q, size = last
+            intercept = math.log(size) - slope * q
+    if slope <= 0:
+        return (lo + hi) // 2
+    quality = round((math.log(target_bytes) - intercept) / slope)
+    return min(max(quality, lo), hi)
+
+
+def _compress_image(source: ImageSource, min_size_kb: int, max_size_kb: int, max_dimension: int):
+    started = time.perf_counter()
+
+    # Decode oversized inputs at reduced size so every encode below works on
+    # fewer pixels
+    image = decode_image(source, max_dimension)
+
+    # Convert to RGB if necessary
+    if image.mode in ("RGBA", "P"):
+        image = image.convert("RGB")
+
+    min_bytes = min_size_kb * 1024
+    max_bytes = max_size_kb * 1024
+    target_bytes = (min_bytes + max_bytes) / 2
+
+    model = _fit_size_model(image)
+    lo, hi = COMPRESS_MIN_QUALITY, COMPRESS_MAX_QUALITY
+    quality = _predict_quality(model, target_bytes, lo, hi)
+
+    encodes = 0
+    result = None
+    under = None    # (quality, size) of the best encode below the window
+    over = None     # (quality, size) of the best encode above the window
+    best_under = best_over = None
+
+    # Bisect on quality, using the size model to pick each probe
+    while lo <= hi:
+        data = _encode_jpeg(image, quality)
+        encodes += 1
+        size = len(data)
+
+        if min_bytes <= size <= max_bytes:
+            result, result_quality = data, quality
+            break
+        elif size < min_bytes:
+            under, best_under = (quality, size), (data, quality)
+            lo = quality + 1
+        else:
+            over, best_over = (quality, size), (data, quality)
+            hi = quality - 1
+
+        if encodes >= 3:
+            # The model has had its chance; guarantee log-time convergence
+            quality = (lo + hi) // 2
+        else:
+            quality = _predict_quality(model, target_bytes, lo, hi, under, over)
+
+    if result is None:
+        # Window not reachable: keep the best quality that still fits under
+        # the maximum, otherwise the smallest file we managed to produce.
+        result, result_quality = best_under if best_under is not None else best_over
+
+    stats = (
+        f"{encodes} encodes, quality {result_quality}, {len(result) / 1024:.0f} KB, "
+        f"{image.width}x{image.height}, {(time.perf_counter() - started) * 1000:.1f} ms"
+    )
+    return result, stats
+
+
+async def compress_image(file: ImageInput, min_size_kb=COMPRESS_MIN_KB, max_size_kb=COMPRESS_MAX_KB, max_dimension: Optional[int] = None) -> BytesIO:
+    source = await _image_source(file)
+    max_dimension = max_dimension or settings.image_max_dimension
+    result, stats = await image_executor.executor.run(_compress_image, source, min_size_kb, max_size_kb, max_dimension)
+    # The search runs in a pool worker, so report its stats from here
+    logging.info(f"compress_image: {stats}")
+    return BytesIO(result)
+
+
+@dataclass
+class ImageUpload:
+    """One file in a batch handled by upload_images."""
+    field: str                      # Customer column the resulting URL goes into
+    source: Any                     # Anything read_image_input accepts
+    filename: str                   # Only its extension is kept in the S3 key
+    compress: bool = True
+    remove_background: bool = False
+
+    def variant(self) -> str:
+        steps = []
+        if self.remove_background:
+            steps.append("remove-background")
+        if self.compress:
+            steps.append(f"compress-{COMPRESS_MIN_KB}-{COMPRESS_MAX_KB}kb-{max_dimension_for(self.field)}px")
+        return _variant(*steps) if steps else "raw"
+
+
+def _variant(*steps: str) -> str:
+    return ":".join([f"v{PIPELINE_VERSION}", *steps])
+
+
+def content_key(sha256: str, filename: str) -> str:
+    ext = filename.split('.')[-1]  # Keep the original extension
+    return f"{sha256}.{ext}"
+
+
+async def _store(bucket_name: str, source_sha256: str, variant: str, filename: str, produce) -> str:
+    """Upload what ``produce()`` returns under its content hash.
+
+    If this exact source has already been through ``variant``, the stored
+    URL is returned without calling ``produce`` at all; if the output is
+    already in the bucket under another source, only the index is updated.
+    """
+    url = await image_index.lookup(bucket_name, source_sha256, variant)
+    if url is not None:
+        return url
+
+    image = await produce()
+    if isinstance(image, SpooledImage):
+        sha256, size, fileobj = image.sha256, image.size, image.open()
+    else:
+        data = await read_image_input(image)
+        sha256, size, fileobj = hashlib.sha256(data).hexdigest(), len(data), BytesIO(data)
+
+    key = content_key(sha256, filename)
+    with fileobj:
+        if not await image_index.object_exists(bucket_name, key):
+            await upload_image_to_s3(fileobj, bucket_name, key)
+    url = s3_transport.transport.public_url(bucket_name, key)
+    await image_index.record(bucket_name, source_sha256, variant, key, url, size)
+    return url
+
+
+async def upload_images(uploads: List[ImageUpload], bucket_name: str, max_concurrency: Optional[int] = None) -> Dict[str, str]:
+    """Run the compress-then-upload pipeline for several files concurrently.
+
+    Returns a mapping of ``field`` to public URL, or raises the first error.
+    Objects are stored under their content hash, so a retry of a failed or
+    repeated request reuses whatever was already uploaded instead of
+    processing and storing the same image again.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency or settings.upload_max_concurrency)
+
+    # Ingest each source once up front, so size limits are enforced before
+    # anything reaches S3; the same UploadFile may feed several uploads
+    # (e.g. a signature and its unprocessed copy).
+    sources = {}
+    spooled = []
+
+    async def _produce(upload: ImageUpload, image):
+        if upload.remove_background:
+            image = await remove_background(image)
+        if upload.compress:
+            image = await compress_image(image, max_dimension=max_dimension_for(upload.field))
+        return image
+
+    async def _process(upload: ImageUpload):
+        async with semaphore:
+            source = sources[id(upload.source)]
+            if isinstance(source, SpooledImage):
+                source_sha256 = source.sha256
+            else:
+                source_sha256 = hashlib.sha256(source).hexdigest()
+            url = await _store(bucket_name, source_sha256, upload.variant(), upload.filename,
+                               lambda: _produce(upload, source))
+            return upload.field, url
+
+    try:
+        for upload in uploads:
+            if id(upload.source) in sources:
+                continue
+            if isinstance(upload.source, UploadFile):
+                source = await ingest(upload.source, upload.field)
+                spooled.append(source)
+            elif isinstance(upload.source, SpooledImage):
+                source = upload.source
+            else:
+                source = await read_image_input(upload.source)
+            sources[id(upload.source)] = source
+
+        results = await asyncio.gather(*(_process(upload) for upload in uploads), return_exceptions=True)
+    finally:
+        for source in spooled:
+            source.close()
+
+    errors = [result for result in results if isinstance(result, BaseException)]
+    if errors:
+        raise errors[0]
+
+    return dict(results)
+
+
+async def upload_combined(image1: SpooledImage, image2: SpooledImage, filename: str, bucket_name: str, max_dimension: int) -> str:
+    """Stack two ingested images, compress the result and store it like upload_images."""
+    source_sha256 = hashlib.sha256(f"{image1.sha256}:{image2.sha256}".encode()).hexdigest()
+    variant = _variant(
+        f"combine-{max_dimension}px",
+        f"compress-{COMPRESS_MIN_KB}-{COMPRESS_MAX_KB}kb-{settings.image_max_dimension}px",
+    )
+
+    async def _produce():
+        return await compress_image(await combine_images_vertically(image1, image2, max_dimension))
+
+    return await _store(bucket_name, source_sha256, variant, filename, _produce)
@@ -0,0 +1,35 @@
+from decimal import Decimal
+from typing import Any
+
+import orjson
+from fastapi.responses import ORJSONResponse
+
+
+def _default(obj):
+    # Same money handling as FastAPI's jsonable_encoder: whole amounts become
+    # ints, anything with a fractional part becomes a float
+    if isinstance(obj, Decimal):
+        if obj.as_tuple().exponent >= 0:
+            return int(obj)
+        return float(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class FastJSONResponse(ORJSONResponse):
+    """App-wide JSON response rendered by orjson.
+
+    datetimes, dates and UUIDs are handled natively by orjson; Decimal goes
+    through ``_default``.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+
+def trusted_response(content: Any, status_code: int = 200) -> FastJSONResponse:
+    """Return ``content`` as-is, skipping response_model validation and jsonable_encoder.
+
+    Only for payloads the handler builds itself in the declared response
+    shape; the route's response_model then only documents the output.
+    """
+    return FastJSONResponse(content, status_code=status_code)
@@ -2,12 +2,17 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import models
 import database
-from api import admin, login, sales, customer, accounts, finance, rto, pdf, chasis
+import image_executor
+import image_jobs
+import s3_transport
+import process_pdf
+from json_responses import FastJSONResponse
+from api import admin, login, sales, customer, accounts, finance, rto, pdf, chasis, metrics
 from dotenv import load_dotenv
 
 
 load_dotenv()
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
 
 
 
@@ -24,6 +29,23 @@ app.add_middleware(
 
 models.Base.metadata.create_all(bind=database.engine)
 
+
+@app.on_event("startup")
+def start_workers():
+    image_executor.executor.start()
+    s3_transport.transport.start()
+    process_pdf.asset_cache.preload()
+    image_jobs.start_workers()
+
+
+@app.on_event("shutdown")
+async def stop_workers():
+    await image_jobs.stop_workers()
+    image_executor.executor.shutdown()
+    s3_transport.transport.shutdown()
+    await rto.close_http_client()
+
+
 app.include_router(admin.router)
 app.include_router(login.router)
 app.include_router(sales.router)
@@ -33,6 +55,7 @@ app.include_router(finance.router)
 app.include_router(rto.router)
 app.include_router(pdf.router)
 app.include_router(chasis.router)
+app.include_router(metrics.router)
 @app.get("/")
 async def root():
     return {"message": "Welcome to API docs of Top Haven Tvs RTO registration automation softwate. Please go to /docs page to view the documentation"}
\ No newline at end of file
@@ -0,0 +1,28 @@
+import threading
+
+
+class LatencyStat:
+    """Running count / total / max of a duration, safe to update from any thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            avg = self.total / self.count if self.count else 0.0
+            return {
+                "count": self.count,
+                "avg_ms": round(avg * 1000, 2),
+                "max_ms": round(self.max * 1000, 2),
+                "total_ms": round(self.total * 1000, 2),
+            }
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, DateTime, DECIMAL, Date
+from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, DateTime, DECIMAL, Date, Index, LargeBinary, text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import database
@@ -44,6 +44,32 @@ class User(database.Base):
 
 class Customer(database.Base):
     __tablename__ = "customers"
+    __table_args__ = (
+        # Trailing (created_at, customer_id) lets list endpoints page with a
+        # keyset straight off the index (see pagination.py)
+        Index("ix_customers_created_at_id", "created_at", "customer_id"),
+        Index("ix_customers_branch_created_at_id", "branch_id", "created_at", "customer_id"),
+        Index("ix_customers_branch_sales_exec_created_at_id", "branch_id", "sales_executive_id", "created_at", "customer_id"),
+        Index("ix_customers_branch_status", "branch_id", "status"),
+        # Partial indexes for the verification queues; predicates are written
+        # the way SQLAlchemy renders `== True` / `== False` so the planner can
+        # match them
+        Index(
+            "ix_customers_accounts_pending",
+            "branch_id", "created_at", "customer_id",
+            postgresql_where=text("sales_verified = true AND accounts_verified = false"),
+        ),
+        Index(
+            "ix_customers_rto_pending",
+            "created_at", "customer_id",
+            postgresql_where=text("sales_verified = true AND accounts_verified = true AND rto_verified = false"),
+        ),
+        Index(
+            "ix_customers_rto_verified",
+            "created_at", "customer_id",
+            postgresql_where=text("rto_verified = true"),
+        ),
+    )
 
     customer_id = Column(Integer, primary_key=True, index=True)
     name = Column(String)
@@ -97,6 +123,9 @@ class Customer(database.Base):
     accounts_verified = Column(Boolean, default=False)
     rto_verified = Column(Boolean, default=False)
     registered = Column(Boolean, nullable=True, default=False)
+    # Background image processing for the submitted form (see image_jobs.py):
+    # None when nothing was queued, then "pending", "done" or "failed"
+    processing_status = Column(String, nullable=True)
     branch = relationship("Branch", back_populates="customers")
 
 class VerificationLog(database.Base):
@@ -147,3 +176,102 @@ class Chassis(database.Base):
     user_id = Column(Integer, ForeignKey('users.user_id'), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     user = relationship("User", back_populates="chassis_data")
+
+
+class CustomerDailyStats(database.Base):
+    """Rollup of customers per creation day, branch, sales executive and pipeline stage.
+
+    Maintained incrementally by reporting.record_change; 0 stands in for a
+    missing branch or executive so every key column can be part of the
+    primary key.
+    """
+    __tablename__ = "customer_daily_stats"
+
+    day = Column(Date, primary_key=True)
+    branch_id = Column(Integer, primary_key=True)
+    sales_executive_id = Column(Integer, primary_key=True)
+    stage = Column(String, primary_key=True)
+    customers = Column(Integer, nullable=False, default=0)
+    revenue = Column(DECIMAL(14, 2), nullable=False, default=0)
+
+
+class ImageObject(database.Base):
+    """An S3 object stored under the sha256 of its contents.
+
+    Keyed by the sha256 of the original upload and the processing applied to
+    it, so a repeated upload of the same file maps straight to the stored
+    object without being processed again (see image_index.py).
+    """
+    __tablename__ = "image_objects"
+    __table_args__ = (
+        Index("ix_image_objects_bucket_object_key", "bucket", "object_key"),
+    )
+
+    bucket = Column(String, primary_key=True)
+    source_sha256 = Column(String(64), primary_key=True)
+    variant = Column(String, primary_key=True)
+    object_key = Column(String, nullable=False)
+    url = Column(String, nullable=False)
+    size = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class ImageJob(database.Base):
+    """Image processing queued for a customer after they submit their form.
+
+    Claimed by image_jobs workers with FOR UPDATE SKIP LOCKED; the raw
+    uploads live in ImageJobBlob rows until the job is done.
+    """
+    __tablename__ = "image_jobs"
+    __table_args__ = (
+        Index("ix_image_jobs_status_run_after", "status", "run_after"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    customer_id = Column(Integer, ForeignKey('customers.customer_id', ondelete="CASCADE"), nullable=False, index=True)
+    status = Column(String, nullable=False, default="pending")  # pending, running, done, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(String, nullable=True)
+    run_after = Column(DateTime, nullable=False, default=datetime.utcnow)
+    locked_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    files = relationship("ImageJobFile", cascade="all, delete-orphan", passive_deletes=True)
+    blobs = relationship("ImageJobBlob", cascade="all, delete-orphan", passive_deletes=True)
+
+
+class ImageJobFile(database.Base):
+    """One customer image an ImageJob produces, with how it is to be processed."""
+    __tablename__ = "image_job_files"
+
+    id = Column(Integer, primary_key=True)
+    job_id = Column(Integer, ForeignKey('image_jobs.id', ondelete="CASCADE"), nullable=False, index=True)
+    blob_id = Column(Integer, ForeignKey('image_job_blobs.id', ondelete="CASCADE"), nullable=False, index=True)
+    field = Column(String, nullable=False)
+    filename = Column(String, nullable=False)
+    compress = Column(Boolean, nullable=False, default=True)
+    remove_background = Column(Boolean, nullable=False, default=False)
+
+    blob = relationship("ImageJobBlob")
+
+
+class ImageJobBlob(database.Base):
+    """One raw upload waiting in an ImageJob, shared by every ImageJobFile made from it.
+
+    The bytes are in ImageJobBlobChunk rows, so they can be written and read
+    back a chunk at a time instead of as one value.
+    """
+    __tablename__ = "image_job_blobs"
+
+    id = Column(Integer, primary_key=True)
+    job_id = Column(Integer, ForeignKey('image_jobs.id', ondelete="CASCADE"), nullable=False, index=True)
+    sha256 = Column(String, nullable=False)
+    size = Column(Integer, nullable=False)
+
+
+class ImageJobBlobChunk(database.Base):
+    __tablename__ = "image_job_blob_chunks"
+
+    blob_id = Column(Integer, ForeignKey('image_job_blobs.id', ondelete="CASCADE"), primary_key=True)
+    seq = Column(Integer, primary_key=True)
+    data = Column(LargeBinary, nullable=False)
@@ -5,7 +5,8 @@ from fastapi import Depends, status, HTTPException
 from fastapi.security import OAuth2PasswordBearer,OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from config import  settings
-from typing import Union
+from typing import NamedTuple, Optional, Union
+from cache import TTLCache
 # from .config import settings
 
 oauth2_scheme_user = OAuth2PasswordBearer(tokenUrl="login")
@@ -43,13 +44,46 @@ def verify_access_token_user(token: str, credentials_exception):
 
 
 
+class CurrentUser(NamedTuple):
+    """The parts of a User that request handlers and role checks read."""
+    user_id: int
+    role_id: Optional[int]
+    branch_id: Optional[int]
+    is_active: Optional[bool]
+
+
+# user_id -> CurrentUser, so most authenticated requests skip the users table.
+# Per process, so the TTL bounds how long another worker can serve a stale
+# role or branch after an update.
+_user_cache = TTLCache(ttl=settings.user_cache_ttl, max_entries=settings.user_cache_max_entries)
+
+
+def invalidate_user(user_id: int):
+    _user_cache.invalidate(user_id)
+
+
 def get_current_user(token: str = Depends(oauth2_scheme_user), db: Session = Depends(database.get_db)):
+    # FastAPI resolves this once per request even when both the router and
+    # the handler depend on it
     credentials_exception = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                                           detail=f"Could not validate credentials", headers={"WWW-Authenticate": "Bearer"})
 
     token = verify_access_token_user(token, credentials_exception)
 
-    user = db.query(models.User).filter(models.User.user_id == token.id).first()
-
+    user = _user_cache.get(token.id)
+    if user is not None:
+        return user
+
+    row = db.query(
+        models.User.user_id,
+        models.User.role_id,
+        models.User.branch_id,
+        models.User.is_active
+    ).filter(models.User.user_id == token.id).first()
+    if row is None:
+        return None
+
+    user = CurrentUser(*row)
+    _user_cache.set(user.user_id, user)
     return user
 
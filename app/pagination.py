@@ -0,0 +1,157 @@
+import base64
+import binascii
+import json
+from functools import lru_cache
+from datetime import date, datetime, time, timedelta
+from typing import Literal, Optional
+
+from fastapi import HTTPException, Query, status
+from sqlalchemy import Row, and_, or_, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+from config import settings
+
+
+# Keyset pagination for customer lists. Pages are ordered on
+# (created_at, customer_id) and the cursor carries the last row's key, so
+# fetching page N costs the same as page 1 instead of an OFFSET scan.
+# NULL created_at sorts the way Postgres does by default (after every date
+# going up, before every date going down) so a plain index on the key can
+# serve both directions.
+
+
+def encode_cursor(created_at: Optional[datetime], customer_id: int) -> str:
+    payload = json.dumps([created_at.isoformat() if created_at else None, customer_id])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, customer_id = json.loads(base64.urlsafe_b64decode(padded))
+        return (datetime.fromisoformat(created_at) if created_at else None), int(customer_id)
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor.")
+
+
+class PageParams:
+    """Query parameters shared by every paginated customer list."""
+
+    def __init__(
+        self,
+        cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+        limit: int = Query(settings.page_size_default, ge=1, le=settings.page_size_max),
+        order: Literal["newest", "oldest"] = Query("newest"),
+    ):
+        self.cursor = cursor
+        self.limit = limit
+        self.order = order
+
+
+class CustomerFilters:
+    """Optional server-side filters for customer lists."""
+
+    def __init__(
+        self,
+        search: Optional[str] = Query(None, min_length=1, description="Matches name or phone number"),
+        created_from: Optional[date] = Query(None),
+        created_to: Optional[date] = Query(None),
+        vehicle_name: Optional[str] = Query(None),
+        finance_id: Optional[int] = Query(None),
+    ):
+        self.search = search
+        self.created_from = created_from
+        self.created_to = created_to
+        self.vehicle_name = vehicle_name
+        self.finance_id = finance_id
+
+    def apply(self, query):
+        Customer = models.Customer
+        if self.search:
+            pattern = f"%{self.search}%"
+            query = query.filter(or_(Customer.name.ilike(pattern), Customer.phone_number.ilike(pattern)))
+        if self.created_from:
+            query = query.filter(Customer.created_at >= datetime.combine(self.created_from, time.min))
+        if self.created_to:
+            # Inclusive of the whole end day
+            query = query.filter(Customer.created_at < datetime.combine(self.created_to + timedelta(days=1), time.min))
+        if self.vehicle_name:
+            query = query.filter(Customer.vehicle_name == self.vehicle_name)
+        if self.finance_id is not None:
+            query = query.filter(Customer.finance_id == self.finance_id)
+        return query
+
+
+@lru_cache(maxsize=None)
+def customer_columns(schema) -> tuple:
+    """The Customer columns ``schema`` serializes, plus the keyset columns."""
+    table_columns = models.Customer.__table__.c
+    names = [name for name in schema.model_fields if name in table_columns]
+    names += [name for name in ("created_at", "customer_id") if name not in names]
+    return tuple(getattr(models.Customer, name) for name in names)
+
+
+def project(session, schema):
+    """Query only the columns a list response needs.
+
+    Rows come back as plain tuples, so nothing goes through the identity
+    map and the S3 URLs and other columns the schema drops are never read.
+    """
+    return session.query(*customer_columns(schema))
+
+
+def _after_cursor(created_at: Optional[datetime], customer_id: int, newest_first: bool):
+    Customer = models.Customer
+    if newest_first:
+        if created_at is None:
+            return or_(and_(Customer.created_at.is_(None), Customer.customer_id < customer_id),
+                       Customer.created_at.isnot(None))
+        return tuple_(Customer.created_at, Customer.customer_id) < tuple_(created_at, customer_id)
+
+    if created_at is None:
+        return and_(Customer.created_at.is_(None), Customer.customer_id > customer_id)
+    return or_(tuple_(Customer.created_at, Customer.customer_id) > tuple_(created_at, customer_id),
+               Customer.created_at.is_(None))
+
+
+def paginate(query, params: PageParams, filters: Optional[CustomerFilters] = None, transform=None) -> dict:
+    """Fetch one page of ``query`` as a Page envelope.
+
+    ``query`` must select rows exposing ``created_at`` and ``customer_id``
+    (Customer entities, or column rows that include both). ``transform``
+    maps each row to the item returned to the client.
+    """
+    Customer = models.Customer
+    if filters is not None:
+        query = filters.apply(query)
+
+    newest_first = params.order == "newest"
+    if params.cursor:
+        query = query.filter(_after_cursor(*decode_cursor(params.cursor), newest_first))
+
+    if newest_first:
+        query = query.order_by(Customer.created_at.desc().nulls_first(), Customer.customer_id.desc())
+    else:
+        query = query.order_by(Customer.created_at.asc().nulls_last(), Customer.customer_id.asc())
+
+    # One extra row tells us whether another page exists without a COUNT(*)
+    rows = query.limit(params.limit + 1).all()
+    next_cursor = None
+    if len(rows) > params.limit:
+        rows = rows[:params.limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last.created_at, last.customer_id)
+
+    if transform:
+        items = [transform(row) for row in rows]
+    elif rows and isinstance(rows[0], Row):
+        items = [row._asdict() for row in rows]
+    else:
+        items = rows
+    return {"items": items, "next_cursor": next_cursor, "limit": params.limit}
+
+
+async def paginate_async(db: AsyncSession, build_query, params: PageParams, filters: Optional[CustomerFilters] = None, transform=None) -> dict:
+    """paginate() for an AsyncSession; ``build_query`` gets the sync session to query on."""
+    return await db.run_sync(lambda session: paginate(build_query(session), params, filters, transform))
@@ -1,154 +1,437 @@
 import fitz  
+import hashlib
+import json
+import logging
 import os
+import threading
+import time
+from collections import OrderedDict
+from types import MappingProxyType
+from typing import Mapping, NamedTuple, Optional, Tuple
 
 STAMPS_DIR = "./stamps/"
-SIGNATURES_DIR = "./uploads/signatures/"
-CHASSIS_IMAGE_DIR = "./uploads/chassis/"
 
 
 
 
 os.makedirs(STAMPS_DIR, exist_ok=True)
-os.makedirs(SIGNATURES_DIR, exist_ok=True)
-os.makedirs(CHASSIS_IMAGE_DIR, exist_ok=True)
 
 MIN_SIZE_POINTS = 0.20 * 72
 
-def add_stamps_and_signature(pdf_path, signature_path, output_pdf_path, config, selected_finance, text_inputs,chassis_image_path=None):
-    # Open the PDF
-    doc = fitz.open(pdf_path)
-
-    # Add stamps
-    for stamp in config.get("stamps", []):
-        stamp_image_path = os.path.join(STAMPS_DIR, stamp["name"])
-        if not os.path.exists(stamp_image_path):
-            raise FileNotFoundError(f"Stamp image '{stamp['name']}' not found in stamps directory.")
-        
-        for placement in stamp["placements"]:
-            page_number = placement["page"]
-            if page_number - 1 < 0 or page_number - 1 >= len(doc):
-                raise IndexError(f"Page number {page_number} is out of range for the PDF.")
-            
-            page = doc[page_number - 1]
-            rect = fitz.Rect(
-                placement["position"]["x"],
-                placement["position"]["y"],
-                placement["position"]["x"] + placement["width"],
-                placement["position"]["y"] + placement["height"]
-            )
-            page.insert_image(rect, filename=stamp_image_path)
-    
-    # Add finance seals
-    finance_config = config.get("finances", {}).get(selected_finance)
-    if finance_config:
-        for seal in finance_config.get("seals", []):
-            finance_image_path = os.path.join(STAMPS_DIR, seal["name"])
-            if not os.path.exists(finance_image_path):
-                raise FileNotFoundError(f"Finance image '{seal['name']}' not found in stamps directory.")
-            
-            for placement in seal["placements"]:
-                page_number = placement["page"]
-                if page_number - 1 < 0 or page_number - 1 >= len(doc):
-                    raise IndexError(f"Page number {page_number} is out of range for the PDF.")
-                
-                page = doc[page_number - 1]
-                rect = fitz.Rect(
-                    placement["position"]["x"],
-                    placement["position"]["y"],
-                    placement["position"]["x"] + placement["width"],
-                    placement["position"]["y"] + placement["height"]
-                )
-                page.insert_image(rect, filename=finance_image_path)
-
-    # Add signature
+image_path = "./assets/ticknew.png"
+
+# Tick box rects of recurring page templates, see TickBoxIndex
+BOX_INDEX_PATH = "./tick_box_index.json"
+
+
+class StampAssetCache:
+    """Stamp and tick images decoded once and kept in memory as Pixmaps.
+
+    Placements insert the cached Pixmap directly, so a document never
+    re-reads or re-decodes a PNG. Changed files are picked up by refresh(),
+    which preload() runs and get() triggers at most every
+    ``refresh_interval`` seconds, so replacing a PNG in stamps/ still takes
+    effect without a restart and without a stat per placement.
+    """
+
+    def __init__(self, refresh_interval: float = 60.0):
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._assets = {}
+        self._refreshed_at = time.monotonic()
+
+    @staticmethod
+    def _version(path: str):
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def _load(self, path: str) -> fitz.Pixmap:
+        version = self._version(path)
+        # Decoding here also means a corrupt asset fails at load, not mid-document
+        pixmap = fitz.Pixmap(path)
+        with self._lock:
+            self._assets[path] = (version, pixmap)
+        return pixmap
+
+    def get(self, path: str) -> fitz.Pixmap:
+        if time.monotonic() - self._refreshed_at > self.refresh_interval:
+            self.refresh()
+        with self._lock:
+            cached = self._assets.get(path)
+        if cached is not None:
+            return cached[1]
+        return self._load(path)
+
+    def refresh(self):
+        """Reload every cached asset whose file changed since it was decoded."""
+        self._refreshed_at = time.monotonic()
+        with self._lock:
+            cached = list(self._assets.items())
+        for path, (version, _) in cached:
+            try:
+                changed = self._version(path) != version
+            except FileNotFoundError:
+                # Keep serving the last good copy; compile_plan reports the
+                # missing file the next time a config names it
+                continue
+            if changed:
+                self._load(path)
+
+    def preload(self, directory: str = STAMPS_DIR):
+        self.refresh()
+        for name in os.listdir(directory):
+            if name.lower().endswith(".png"):
+                self.get(os.path.join(directory, name))
+        if os.path.exists(image_path):
+            self.get(image_path)
+
+
+asset_cache = StampAssetCache()
+
+
+def _insert_image(page, rect, key, xrefs, load):
+    # The first placement of an image embeds it; later placements in the same
+    # document point at that xref instead of embedding another copy.
+    xref = xrefs.get(key)
+    if xref:
+        page.insert_image(rect, xref=xref)
+        return
+    image = load()
+    if isinstance(image, fitz.Pixmap):
+        xrefs[key] = page.insert_image(rect, pixmap=image)
+    else:
+        xrefs[key] = page.insert_image(rect, stream=image)
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as image_file:
+        return image_file.read()
+
+
+# Order in which placements are applied on a page. Later phases draw on top
+# of earlier ones, matching the order the config sections were always applied.
+PHASE_STAMP, PHASE_SEAL, PHASE_SIGNATURE, PHASE_TEXT, PHASE_TICKS, PHASE_CHASSIS = range(6)
+
+
+class ImagePlacement(NamedTuple):
+    phase: int
+    rect: fitz.Rect
+    asset: str          # stamp path, or "signature" / "chassis_image" for per-request images
+
+
+class TextPlacement(NamedTuple):
+    phase: int
+    point: Tuple[float, float]
+    key: Optional[str]  # dynamic text looked up in text_inputs
+    text: str           # static text when key is None
+    font_size: float
+    color: Tuple[float, ...]
+
+
+class PlacementPlan(NamedTuple):
+    """A validated config, grouped by 0-based page index and sorted by phase.
+
+    ``pages`` holds the placements shared by every request; ``finance_pages``
+    holds the same layout merged with each finance company's seals, so
+    executing a plan never re-walks the JSON.
+    """
+    pages: Mapping[int, Tuple]
+    finance_pages: Mapping[str, Mapping[int, Tuple]]
+    page_count: int     # highest page number any required placement needs
+    finance_page_counts: Mapping[str, int]
+    chassis_page_count: int     # highest page number the optional chassis photo needs
+
+    def for_finance(self, selected_finance):
+        if selected_finance in self.finance_pages:
+            return self.finance_pages[selected_finance], self.finance_page_counts[selected_finance]
+        return self.pages, self.page_count
+
+
+def _compile_rect(placement) -> Tuple[int, fitz.Rect]:
+    page_number = placement["page"]
+    if page_number < 1:
+        raise ValueError(f"Page number {page_number} is out of range for the PDF.")
+    x, y = placement["position"]["x"], placement["position"]["y"]
+    return page_number - 1, fitz.Rect(x, y, x + placement["width"], y + placement["height"])
+
+
+def _compile_images(entries, phase, asset_for, pages):
+    for entry in entries:
+        asset = asset_for(entry)
+        for placement in entry["placements"]:
+            page_index, rect = _compile_rect(placement)
+            pages.setdefault(page_index, []).append(ImagePlacement(phase, rect, asset))
+
+
+def _stamp_asset(entry, label):
+    path = os.path.join(STAMPS_DIR, entry["name"])
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{label} image '{entry['name']}' not found in stamps directory.")
+    asset_cache.get(path)
+    return path
+
+
+def _freeze(pages) -> Mapping[int, Tuple]:
+    return MappingProxyType({
+        page_index: tuple(sorted(ops, key=lambda op: op.phase))
+        for page_index, ops in pages.items()
+    })
+
+
+def _page_count(pages, chassis: bool = False) -> int:
+    # The chassis photo is optional, so its placements are counted separately
+    # and only checked against the document when one is uploaded
+    used = [
+        page_index for page_index, ops in pages.items()
+        if any((op.phase == PHASE_CHASSIS) == chassis for op in ops)
+    ]
+    return max(used, default=-1) + 1
+
+
+def compile_plan(config) -> PlacementPlan:
+    """Validate a placement config once and turn it into an immutable plan."""
+    pages = {}
+
+    _compile_images(config.get("stamps", []), PHASE_STAMP, lambda entry: _stamp_asset(entry, "Stamp"), pages)
+
     signature_config = config.get("signature")
     if signature_config:
-        for placement in signature_config["placements"]:
-            page_number = placement["page"]
-            if page_number - 1 < 0 or page_number - 1 >= len(doc):
-                raise IndexError(f"Page number {page_number} is out of range for the PDF.")
-            
-            page = doc[page_number - 1]
-            rect = fitz.Rect(
-                placement["position"]["x"],
-                placement["position"]["y"],
-                placement["position"]["x"] + placement["width"],
-                placement["position"]["y"] + placement["height"]
-            )
-            page.insert_image(rect, filename=signature_path)
+        _compile_images([signature_config], PHASE_SIGNATURE, lambda entry: "signature", pages)
 
     for text_item in config.get("texts", []):
-        page_number = text_item["page"]
-        if page_number - 1 < 0 or page_number - 1 >= len(doc):
-            raise IndexError(f"Page number {page_number} is out of range for the PDF.")
-        
-        page = doc[page_number - 1]
+        page_index, _ = _compile_rect({**text_item, "width": 0, "height": 0})
         if "key" in text_item:  # Dynamic text
-            text_to_add = text_inputs.get(text_item["key"], "")  # Get user input for this key
+            key, text = text_item["key"], ""
         elif "text" in text_item:  # Static text
-            text_to_add = text_item["text"]  # Use predefined static text
+            key, text = None, text_item["text"]
+        else:
+            raise ValueError(f"Text placement on page {text_item['page']} has neither 'key' nor 'text'.")
+        pages.setdefault(page_index, []).append(TextPlacement(
+            PHASE_TEXT,
+            (text_item["position"]["x"], text_item["position"]["y"]),
+            key,
+            text,
+            text_item.get("font_size", 12),
+            tuple(text_item.get("color", (0, 0, 0))),
+        ))
+
+    chassis_config = config.get("chassis_image")
+    if chassis_config:
+        _compile_images([chassis_config], PHASE_CHASSIS, lambda entry: "chassis_image", pages)
+
+    finance_pages, finance_page_counts = {}, {}
+    for finance_name, finance_config in config.get("finances", {}).items():
+        merged = {page_index: list(ops) for page_index, ops in pages.items()}
+        _compile_images(finance_config.get("seals", []), PHASE_SEAL, lambda entry: _stamp_asset(entry, "Finance"), merged)
+        finance_pages[finance_name] = _freeze(merged)
+        finance_page_counts[finance_name] = _page_count(merged)
+
+    return PlacementPlan(
+        pages=_freeze(pages),
+        finance_pages=MappingProxyType(finance_pages),
+        page_count=_page_count(pages),
+        finance_page_counts=MappingProxyType(finance_page_counts),
+        chassis_page_count=_page_count(pages, chassis=True),
+    )
 
-        position = text_item["position"]
-        font_size = text_item.get("font_size", 12)
-        text_color = text_item.get("color", (0, 0, 0))
-        
+
+def _apply(page, op, xrefs, images, text_inputs):
+    if isinstance(op, TextPlacement):
+        text_to_add = text_inputs.get(op.key, "") if op.key is not None else op.text
         # Draw the text on the page at the specified position
-        page.insert_text(
-            (position["x"], position["y"]),
-            text_to_add,
-            fontsize=font_size,
-            color=text_color
-        )
-    
-    large_box_count = 0  # Initialize a counter for boxes larger than 0.29 inches
-
-    # Iterate through each page in the document
-    for page_num in range(len(doc)):
-        page = doc[page_num]  # Get the current page
-        
-        # Get all graphical elements (drawings) on the page
-        drawings = page.get_drawings()
-        
-        # Count and place image in rectangles larger than 0.29 inches
-        for drawing in drawings:
-            # Check if the drawing has a 'rect' attribute
-            if 'rect' in drawing:
-                rect = drawing['rect']
-                # Check if the rectangle dimensions are greater than 0.29 inches
-                if rect.width > MIN_SIZE_POINTS and rect.height > MIN_SIZE_POINTS:
-                    large_box_count += 1  # Increment the count
-
-                    # Calculate the center position for the image
-                    image_width, image_height = 20, 20  # Adjust these based on the desired image size in points
-                    center_x = rect.x0 + (rect.width - image_width) / 2
-                    center_y = rect.y0 + (rect.height - image_height) / 2
-                    image_rect = fitz.Rect(center_x, center_y, center_x + image_width, center_y + image_height)
-
-                    # Insert the image in the center òf the box
-                    page.insert_image(image_rect, filename=image_path)
+        page.insert_text(op.point, text_to_add, fontsize=op.font_size, color=op.color)
+    elif op.asset in images:
+        _insert_image(page, op.rect, op.asset, xrefs, lambda: images[op.asset])
+    else:
+        _insert_image(page, op.rect, op.asset, xrefs, lambda: asset_cache.get(op.asset))
+
+
+def _scan_tick_boxes(page) -> Tuple[Tuple[float, float, float, float], ...]:
+    # Get all graphical elements (drawings) on the page
+    drawings = page.get_drawings()
+
+    # Place the tick image in rectangles larger than MIN_SIZE_POINTS
+    boxes = []
+    for drawing in drawings:
+        # Check if the drawing has a 'rect' attribute
+        if 'rect' in drawing:
+            rect = drawing['rect']
+            if rect.width > MIN_SIZE_POINTS and rect.height > MIN_SIZE_POINTS:
+                boxes.append((rect.x0, rect.y0, rect.x1, rect.y1))
+    return tuple(boxes)
+
+
+def page_fingerprint(page) -> str:
+    """Hash of everything that decides where a page's boxes are drawn.
+
+    Covers the page content streams, any form XObjects they invoke (which
+    get_drawings also walks), the page size and its rotation. Must be taken
+    before anything is inserted into the page.
+    """
+    digest = hashlib.sha256()
+    digest.update(repr((tuple(page.rect), page.rotation)).encode())
+    digest.update(page.read_contents())
+    for xref, *_ in page.get_xobjects():
+        digest.update(page.parent.xref_stream_raw(xref) or b"")
+    return digest.hexdigest()
+
+
+class TickBoxIndex:
+    """Tick box rects per page template, so get_drawings() runs once per layout.
+
+    Uploaded PDFs that share a template (same content streams) reuse the boxes
+    found the first time. Layouts seen more than once are written to
+    ``path`` so the index survives restarts; one-off pages only live in the
+    bounded in-memory LRU and never reach the file.
+    """
+
+    def __init__(self, path: str = BOX_INDEX_PATH, max_entries: int = 256):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._boxes = OrderedDict()
+        self._persisted = {}
+        self._loaded = False
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            with open(self.path, "r") as index_file:
+                stored = json.load(index_file)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logging.error(f"Ignoring unreadable tick box index {self.path}: {e}")
+            return
+        for fingerprint, boxes in stored.items():
+            self._persisted[fingerprint] = tuple(tuple(box) for box in boxes)
+
+    def _save(self):
+        # Write-then-rename so a crash never leaves a truncated index behind
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w") as index_file:
+                json.dump(self._persisted, index_file)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logging.error(f"Could not write tick box index {self.path}: {e}")
+
+    def boxes_for(self, page):
+        fingerprint = page_fingerprint(page)
+        with self._lock:
+            self._load()
+            boxes = self._persisted.get(fingerprint)
+            if boxes is None and fingerprint in self._boxes:
+                # Second sighting: this is a recurring template, keep it on disk
+                boxes = self._boxes.pop(fingerprint)
+                self._persisted[fingerprint] = boxes
+                self._save()
+            if boxes is not None:
+                self.hits += 1
+                return boxes
+            self.misses += 1
+
+        # Unknown template: fall back to a live scan
+        boxes = _scan_tick_boxes(page)
+        with self._lock:
+            self._boxes[fingerprint] = boxes
+            while len(self._boxes) > self.max_entries:
+                self._boxes.popitem(last=False)
+        return boxes
 
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "persisted_templates": len(self._persisted),
+                "recent_templates": len(self._boxes),
+            }
 
 
+box_index = TickBoxIndex()
+
+
+def _insert_ticks(page, boxes, xrefs):
+    for x0, y0, x1, y1 in boxes:
+        # Calculate the center position for the image
+        image_width, image_height = 20, 20  # Adjust these based on the desired image size in points
+        center_x = x0 + ((x1 - x0) - image_width) / 2
+        center_y = y0 + ((y1 - y0) - image_height) / 2
+        image_rect = fitz.Rect(center_x, center_y, center_x + image_width, center_y + image_height)
+
+        # Insert the image in the center of the box
+        _insert_image(page, image_rect, image_path, xrefs, lambda: asset_cache.get(image_path))
+
+
+def execute_plan(doc, plan: PlacementPlan, selected_finance, signature_bytes, text_inputs, chassis_image_bytes=None):
+    """Apply a compiled plan to an open document, one pass per page."""
+    pages, page_count = plan.for_finance(selected_finance)
+    if page_count > len(doc):
+        raise IndexError(f"Page number {page_count} is out of range for the PDF.")
+    if chassis_image_bytes and plan.chassis_page_count > len(doc):
+        raise IndexError(f"Page number {plan.chassis_page_count} is out of range for the PDF.")
+
+    images = {}
+    if signature_bytes:
+        images["signature"] = signature_bytes
+    if chassis_image_bytes:
+        images["chassis_image"] = chassis_image_bytes
+
+    xrefs = {}
+    for page_index in range(len(doc)):
+        page = doc[page_index]
+        ops = pages.get(page_index, ())
+        # Look the boxes up before anything is drawn, while the page still
+        # matches its template
+        tick_boxes = box_index.boxes_for(page)
+
+        for op in ops:
+            if op.phase >= PHASE_TICKS:
+                break
+            if op.phase == PHASE_SIGNATURE and "signature" not in images:
+                raise ValueError("This document needs a signature image.")
+            _apply(page, op, xrefs, images, text_inputs)
+
+        _insert_ticks(page, tick_boxes, xrefs)
+
+        for op in ops:
+            # The chassis photo is optional; skip it when none was uploaded
+            if op.phase > PHASE_TICKS and op.asset in images:
+                _apply(page, op, xrefs, images, text_inputs)
+
+
+def add_stamps_and_signature(pdf_path, signature_path, output_pdf_path, config, selected_finance, text_inputs,chassis_image_path=None):
+    # Path-based wrapper around stamp_pdf_bytes
+    signature_bytes = _read_file(signature_path) if signature_path else None
+    chassis_image_bytes = None
     if chassis_image_path and os.path.exists(chassis_image_path):
-        chassis_config = config.get("chassis_image")
-        if chassis_config:
-            for placement in chassis_config["placements"]:
-                page_number = placement["page"]
-                if page_number - 1 < 0 or page_number - 1 >= len(doc):
-                    raise IndexError(f"Page number {page_number} is out of range for the PDF.")
-                
-                page = doc[page_number - 1]
-                rect = fitz.Rect(
-                    placement["position"]["x"],
-                    placement["position"]["y"],
-                    placement["position"]["x"] + placement["width"],
-                    placement["position"]["y"] + placement["height"]
-                )
-                page.insert_image(rect, filename=chassis_image_path)
-    
-    
-    # Save the modified PDF
-    doc.save(output_pdf_path)
-    doc.close()
+        chassis_image_bytes = _read_file(chassis_image_path)
 
-image_path = "./assets/ticknew.png"
+    output = stamp_pdf_bytes(_read_file(pdf_path), signature_bytes, config, selected_finance, text_inputs, chassis_image_bytes)
+    with open(output_pdf_path, "wb") as output_file:
+        output_file.write(output)
+
+
+def stamp_pdf_bytes(pdf_bytes, signature_bytes, plan, selected_finance, text_inputs, chassis_image_bytes=None) -> bytes:
+    """Stamp a PDF held in memory and return the result as bytes; nothing touches disk.
+
+    ``plan`` is normally a PlacementPlan compiled once at startup; a raw
+    config dict is compiled on the fly.
+    """
+    if not isinstance(plan, PlacementPlan):
+        plan = compile_plan(plan)
+
+    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    try:
+        execute_plan(doc, plan, selected_finance, signature_bytes, text_inputs, chassis_image_bytes)
+
+        # Serialize the modified PDF; inserted stamps are stored uncompressed, so
+        # deflate them and drop unused objects
+        return doc.tobytes(garbage=3, deflate=True)
+    finally:
+        doc.close()
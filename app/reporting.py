@@ -0,0 +1,175 @@
+from datetime import date
+from decimal import Decimal
+from typing import NamedTuple, Optional
+
+from sqlalchemy import extract, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+import models
+
+
+# Pipeline stages in funnel order
+STAGES = ("Pending", "Submitted", "Sales", "Accounts", "RTO", "Registered")
+
+
+def pipeline_stage(customer) -> str:
+    # Furthest step the customer has reached
+    if customer.registered:
+        return "Registered"
+    if customer.rto_verified:
+        return "RTO"
+    if customer.accounts_verified:
+        return "Accounts"
+    if customer.sales_verified:
+        return "Sales"
+    if customer.status == "submitted":
+        return "Submitted"
+    return "Pending"
+
+
+class StatsKey(NamedTuple):
+    day: date
+    branch_id: int
+    sales_executive_id: int
+    stage: str
+
+
+class Contribution(NamedTuple):
+    key: StatsKey
+    revenue: Decimal
+
+
+def snapshot(customer) -> Optional[Contribution]:
+    """What ``customer`` currently adds to customer_daily_stats.
+
+    Take one before mutating a customer and hand it to record_change.
+    """
+    if customer is None or customer.created_at is None:
+        return None
+    key = StatsKey(
+        customer.created_at.date(),
+        customer.branch_id or 0,
+        customer.sales_executive_id or 0,
+        pipeline_stage(customer),
+    )
+    return Contribution(key, customer.total_price or Decimal("0"))
+
+
+def _add(db: Session, contribution: Contribution, sign: int):
+    table = models.CustomerDailyStats.__table__
+    customers, revenue = sign, sign * contribution.revenue
+    statement = insert(table).values(**contribution.key._asdict(), customers=customers, revenue=revenue)
+    # Concurrent transitions on the same key serialize on the row instead of
+    # racing to insert it
+    statement = statement.on_conflict_do_update(
+        index_elements=list(StatsKey._fields),
+        set_={
+            "customers": table.c.customers + customers,
+            "revenue": table.c.revenue + revenue,
+        },
+    )
+    db.execute(statement)
+
+
+def record_change(db: Session, before: Optional[Contribution], customer):
+    """Move a customer's contribution from ``before`` to its current state.
+
+    Runs inside the caller's transaction, so the rollup commits or rolls back
+    together with the customer row. Pass ``customer=None`` for a deletion and
+    ``before=None`` for a new customer.
+    """
+    if customer is not None and customer.created_at is None:
+        # created_at is filled in by the column default on flush
+        db.flush()
+    after = snapshot(customer)
+    if before == after:
+        return
+    if before is not None:
+        _add(db, before, -1)
+    if after is not None:
+        _add(db, after, 1)
+
+
+def _scoped(query, year=None, branch_id=None, start=None, end=None):
+    Stats = models.CustomerDailyStats
+    if year is not None:
+        query = query.filter(Stats.day >= date(year, 1, 1), Stats.day < date(year + 1, 1, 1))
+    if branch_id is not None:
+        query = query.filter(Stats.branch_id == branch_id)
+    if start is not None:
+        query = query.filter(Stats.day >= start)
+    if end is not None:
+        query = query.filter(Stats.day <= end)
+    return query
+
+
+def monthly_trends(db: Session, year: int, branch_id: Optional[int] = None):
+    Stats = models.CustomerDailyStats
+    month = extract("month", Stats.day)
+    rows = _scoped(
+        db.query(
+            month.label("month"),
+            func.sum(Stats.customers).label("customers"),
+            func.sum(Stats.revenue).label("revenue"),
+            func.sum(Stats.customers).filter(Stats.stage == "Registered").label("registered"),
+        ),
+        year=year, branch_id=branch_id,
+    ).group_by(month).order_by(month).all()
+
+    return [
+        {
+            "month": int(row.month),
+            "customers": row.customers or 0,
+            "revenue": float(row.revenue or 0),
+            "registered": row.registered or 0,
+        }
+        for row in rows
+    ]
+
+
+def branch_leaderboard(db: Session, start: Optional[date] = None, end: Optional[date] = None):
+    Stats = models.CustomerDailyStats
+    rows = _scoped(
+        db.query(
+            Stats.branch_id,
+            models.Branch.name.label("branch_name"),
+            func.sum(Stats.customers).label("customers"),
+            func.sum(Stats.revenue).label("revenue"),
+            func.sum(Stats.customers).filter(Stats.stage == "Registered").label("registered"),
+        ).outerjoin(models.Branch, models.Branch.branch_id == Stats.branch_id),
+        start=start, end=end,
+    ).group_by(Stats.branch_id, models.Branch.name).order_by(func.sum(Stats.revenue).desc()).all()
+
+    return [
+        {
+            "branch_id": row.branch_id,
+            "branch_name": row.branch_name,
+            "customers": row.customers or 0,
+            "revenue": float(row.revenue or 0),
+            "registered": row.registered or 0,
+        }
+        for row in rows
+    ]
+
+
+def stage_funnel(db: Session, branch_id: Optional[int] = None, start: Optional[date] = None, end: Optional[date] = None):
+    Stats = models.CustomerDailyStats
+    rows = _scoped(
+        db.query(
+            Stats.stage,
+            func.sum(Stats.customers).label("customers"),
+            func.sum(Stats.revenue).label("revenue"),
+        ),
+        branch_id=branch_id, start=start, end=end,
+    ).group_by(Stats.stage).all()
+
+    totals = {row.stage: row for row in rows}
+    return [
+        {
+            "stage": stage,
+            "customers": totals[stage].customers if stage in totals else 0,
+            "revenue": float(totals[stage].revenue) if stage in totals else 0.0,
+        }
+        for stage in STAGES
+    ]
@@ -0,0 +1,65 @@
+import threading
+import time
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+import models
+from config import settings
+
+
+class RoleMap:
+    """In-process role_id -> role_name map for the small, rarely changing roles table.
+
+    Loaded with one query and reloaded after ``ttl`` seconds, when an unknown
+    role_id is asked for, or as soon as a Role row is written through the ORM
+    in this process.
+    """
+
+    # Unknown ids trigger a reload at most this often, so a dangling role_id
+    # can't turn every lookup back into a query
+    MISS_RELOAD_INTERVAL = 5.0
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._names = {}
+        self._loaded_at = None
+
+    def _load(self, db: Session):
+        names = dict(db.query(models.Role.role_id, models.Role.role_name).all())
+        with self._lock:
+            self._names = names
+            self._loaded_at = time.monotonic()
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def name(self, db: Session, role_id) -> Optional[str]:
+        if role_id is None:
+            return None
+        with self._lock:
+            loaded_at, names = self._loaded_at, self._names
+        now = time.monotonic()
+        if loaded_at is None or now - loaded_at > self.ttl:
+            self._load(db)
+        elif role_id not in names and now - loaded_at > self.MISS_RELOAD_INTERVAL:
+            self._load(db)
+        with self._lock:
+            return self._names.get(role_id)
+
+
+role_map = RoleMap(ttl=settings.role_cache_ttl)
+
+
+def role_name(db: Session, role_id) -> Optional[str]:
+    return role_map.name(db, role_id)
+
+
+@event.listens_for(models.Role, "after_insert")
+@event.listens_for(models.Role, "after_update")
+@event.listens_for(models.Role, "after_delete")
+def _role_changed(mapper, connection, target):
+    role_map.invalidate()
@@ -0,0 +1,86 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import boto3
+from botocore.config import Config
+
+from config import settings
+
+
+class S3Transport:
+    """One long-lived S3 client plus a thread pool sized to its connection pool.
+
+    boto3 clients are thread-safe, so every upload shares the same client and
+    its pooled TLS connections. Blocking calls run on the transport's own
+    threads so the event loop is never held up by network I/O.
+    """
+
+    def __init__(self, max_connections: int, endpoint_url: Optional[str] = None, region_name: Optional[str] = None):
+        self.max_connections = max_connections
+        self.endpoint_url = endpoint_url
+        self.region_name = region_name
+
+        self._lock = threading.Lock()
+        self._client = None
+        self._pool = None
+
+    def start(self):
+        with self._lock:
+            if self._client is not None:
+                return
+            self._client = boto3.client(
+                's3',
+                aws_access_key_id=settings.AWS_SERVER_PUBLIC_KEY,
+                aws_secret_access_key=settings.AWS_SERVER_SECRET_KEY,
+                endpoint_url=self.endpoint_url,
+                region_name=self.region_name,
+                config=Config(
+                    max_pool_connections=self.max_connections,
+                    retries={"max_attempts": 3, "mode": "standard"},
+                    tcp_keepalive=True,
+                ),
+            )
+            self._pool = ThreadPoolExecutor(max_workers=self.max_connections, thread_name_prefix="s3")
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+            self._client = None
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+    @property
+    def client(self):
+        self.start()
+        return self._client
+
+    async def _run(self, fn):
+        client = self.client
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, fn, client)
+
+    async def upload_fileobj(self, fileobj, bucket_name: str, key: str):
+        await self._run(lambda client: client.upload_fileobj(fileobj, bucket_name, key))
+
+    async def delete_object(self, bucket_name: str, key: str):
+        await self._run(lambda client: client.delete_object(Bucket=bucket_name, Key=key))
+
+    async def get_object_bytes(self, bucket_name: str, key: str) -> bytes:
+        def _get(client):
+            return client.get_object(Bucket=bucket_name, Key=key)["Body"].read()
+        return await self._run(_get)
+
+    def public_url(self, bucket_name: str, key: str) -> str:
+        if self.endpoint_url:
+            # Local stand-ins (MinIO, moto server) use path-style URLs
+            return f"{self.endpoint_url.rstrip('/')}/{bucket_name}/{key}"
+        return f"https://{bucket_name}.s3.amazonaws.com/{key}"
+
+
+transport = S3Transport(
+    max_connections=settings.s3_max_pool_connections,
+    endpoint_url=settings.s3_endpoint_url,
+    region_name=settings.s3_region_name,
+)
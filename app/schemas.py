@@ -1,6 +1,6 @@
 from datetime import datetime, date
 from pydantic import BaseModel, EmailStr,HttpUrl
-from typing import Optional, List
+from typing import Generic, Optional, List, TypeVar
 
 class UserCreate(BaseModel):
     first_name: str
@@ -160,6 +160,44 @@ class CustomerListResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class SalesDashboardStats(BaseModel):
+    total_count: int
+    total_pending: int
+    total_submitted: int
+    reviews_pending: int
+    reviews_done: int
+
+
+class MonthlyTrend(BaseModel):
+    month: int
+    customers: int
+    revenue: float
+    registered: int
+
+
+class BranchLeaderboardEntry(BaseModel):
+    branch_id: int
+    branch_name: Optional[str] = None
+    customers: int
+    revenue: float
+    registered: int
+
+
+class StageCount(BaseModel):
+    stage: str
+    customers: int
+    revenue: float
+
+
+T = TypeVar("T")
+
+
+class Page(BaseModel, Generic[T]):
+    items: List[T]
+    next_cursor: Optional[str] = None
+    limit: int
+
+
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -202,6 +240,7 @@ class CustomerResponse(BaseModel):
     balance_amount: Optional[float] = None
     finance_id: Optional[int] = None
     finance_amount: Optional[float] = None
+    processing_status: Optional[str] = None
 
     class Config:
         orm_mode = True
@@ -0,0 +1,129 @@
+"""The app the sync vs async benchmark drives, run under uvicorn in its own process.
+
+    uvicorn benchmark_server:create_app --factory
+
+It reads TEST_DATABASE_URL and serves the customer and sales routers beside
+copies of their handlers as they were before the async session layer.
+Clients authenticate with a real bearer token (see ``token``): any entry in
+app.dependency_overrides makes FastAPI re-analyse every dependency on every
+request, which would swamp what is being measured.
+"""
+import os
+from datetime import datetime
+from decimal import Decimal
+
+from fastapi import Depends, FastAPI, Form, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+
+import database
+import models
+import oauth2
+import reporting
+import schemas
+from api import customer, sales
+from dashboard import invalidate_sales_dashboard
+from pagination import CustomerFilters, PageParams, paginate, project
+
+
+def token(user_id: int = 1) -> str:
+    return oauth2.create_access_token({"user_id": user_id})
+
+
+# The handlers as they were before the async layer, on a sync Session. The
+# plain `def` ones ran on FastAPI's threadpool; the `async def` ones blocked
+# the event loop on every query
+
+
+def before_get_customer_data(link_token: str, db: Session = Depends(database.get_db)):
+    customer = db.query(models.Customer).filter(models.Customer.link_token == link_token).first()
+    if not customer:
+        raise HTTPException(status_code=404, detail="Customer not found.")
+    return {
+        "name": customer.name,
+        "phone_number": customer.phone_number,
+        "vehicle_name": customer.vehicle_name,
+        "vehicle_variant": customer.vehicle_variant,
+        "vehicle_color": customer.vehicle_color,
+        "ex_showroom_price": customer.ex_showroom_price,
+        "tax": customer.tax,
+        "insurance": customer.insurance,
+        "tp_registration": customer.tp_registration,
+        "man_accessories": customer.man_accessories,
+        "optional_accessories": customer.optional_accessories,
+        "total_price": customer.total_price,
+        "booking": customer.booking,
+        "finance_amount": customer.finance_amount,
+        "processing_status": customer.processing_status,
+    }
+
+
+def before_get_customers(page: PageParams = Depends(), filters: CustomerFilters = Depends(), db: Session = Depends(database.get_db), current_user: models.User = Depends(oauth2.get_current_user)):
+    query = project(db, schemas.CustomerOutSales).filter(
+        models.Customer.branch_id == current_user.branch_id,
+        models.Customer.sales_executive_id == current_user.user_id,
+    )
+    return paginate(query, page, filters)
+
+
+async def before_submit_customer_form(
+    link_token: str,
+    first_name: str = Form(None),
+    dob: str = Form(None),
+    db: Session = Depends(database.get_db),
+):
+    # Form fields only: the file uploads it also took are left out on both
+    # sides, as they would measure S3 and image work rather than the session
+    customer = db.query(models.Customer).filter(models.Customer.link_token == link_token).first()
+    if not customer:
+        raise HTTPException(status_code=404, detail="Customer not found.")
+
+    before = reporting.snapshot(customer)
+    if dob:
+        dob = datetime.strptime(dob, "%Y-%m-%d").date()
+
+    customer.first_name = first_name if first_name else customer.first_name
+    customer.dob = dob if dob else customer.dob
+    finance_amount = customer.finance_amount or Decimal("0.0")
+    amount_paid = customer.amount_paid or Decimal("0.0")
+    customer.balance_amount = customer.total_price - finance_amount - amount_paid
+    customer.status = "submitted"
+
+    reporting.record_change(db, before, customer)
+    db.commit()
+    db.refresh(customer)
+    invalidate_sales_dashboard(customer.branch_id, customer.sales_executive_id)
+
+    return schemas.CustomerResponse(
+        customer_id=customer.customer_id,
+        name=customer.first_name or "",
+        phone_number=customer.phone_number,
+        address=customer.address,
+        email=customer.email,
+        vehicle_name=customer.vehicle_name,
+        vehicle_variant=customer.vehicle_variant,
+        sales_verified=customer.sales_verified,
+        accounts_verified=customer.accounts_verified,
+        status=customer.status,
+        created_at=customer.created_at,
+        balance_amount=customer.balance_amount,
+        processing_status=customer.processing_status,
+    )
+
+
+def create_app() -> FastAPI:
+    """The server under test, with both pooled engines built as in production."""
+    url = os.environ["TEST_DATABASE_URL"]
+    database.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=database.create_db_engine(url))
+    database.AsyncSessionLocal = async_sessionmaker(
+        database.create_async_db_engine(url.replace("postgresql://", "postgresql+asyncpg://", 1)),
+        class_=AsyncSession, autoflush=False, expire_on_commit=False,
+    )
+
+    app = FastAPI()
+    app.include_router(customer.router)
+    app.include_router(sales.router)
+    app.add_api_route("/before/customer-form/{link_token}", before_get_customer_data)
+    app.add_api_route("/before/customer/{link_token}", before_submit_customer_form, methods=["POST"], response_model=schemas.CustomerResponse)
+    app.add_api_route("/before/sales/customers", before_get_customers, response_model=schemas.Page[schemas.CustomerOutSales])
+    return app
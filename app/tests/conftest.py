@@ -0,0 +1,259 @@
+import asyncio
+import os
+import sys
+from datetime import datetime
+from decimal import Decimal
+from io import BytesIO
+from pathlib import Path
+from typing import Any, NamedTuple
+
+import pytest
+
+try:
+    from moto import mock_s3
+except ImportError:
+    mock_s3 = None
+
+# The app runs from app/ with flat imports (`import imaging`, `import models`)
+APP_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(APP_DIR))
+# ...and from that directory: stamps, assets and PDF configs use relative paths
+os.chdir(APP_DIR)
+
+# Settings has no defaults for these; placeholders are enough for anything
+# that does not reach a real database or bucket
+for _name, _value in {
+    "database_hostname": "localhost",
+    "database_port": "5432",
+    "database_password": "test",
+    "database_name": "test",
+    "database_username": "test",
+    "secret_key": "test",
+    "algorithm": "HS256",
+    "access_token_expire_minutes": "5",
+    "AWS_SERVER_PUBLIC_KEY": "testing",
+    "AWS_SERVER_SECRET_KEY": "testing",
+    "google_client_id": "test",
+    "google_client_secret": "test",
+    "redirect_uri": "http://localhost/callback",
+}.items():
+    os.environ.setdefault(_name, _value)
+
+# Scratch Postgres database for the tests that need the real planner or
+# driver, e.g. postgresql://postgres@localhost/rto_test. Its tables are
+# dropped and recreated, so never point this at a database you care about;
+# those tests are skipped when it is unset or unreachable.
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+
+# Timing benchmarks are slow and only meaningful on a quiet machine, so they
+# run only when asked for: RUN_BENCHMARKS=1 python -m pytest -s -m benchmark
+RUN_BENCHMARKS = os.environ.get("RUN_BENCHMARKS") == "1"
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "benchmark: timing benchmark, run with RUN_BENCHMARKS=1")
+
+
+def pytest_collection_modifyitems(config, items):
+    if RUN_BENCHMARKS:
+        return
+    skip = pytest.mark.skip(reason="set RUN_BENCHMARKS=1 to run benchmarks")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _image_executor():
+    # The spawned process pool outlives a test unless it is shut down
+    yield
+    import image_executor
+    image_executor.executor.shutdown()
+
+
+BUCKET_NAME = "tvstophaven"
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    """A moto-backed S3Transport with the app's bucket, installed as s3_transport.transport."""
+    if mock_s3 is None:
+        pytest.skip("moto is not installed")
+    import s3_transport
+
+    with mock_s3():
+        transport = s3_transport.S3Transport(max_connections=4, region_name="us-east-1")
+        transport.client.create_bucket(Bucket=BUCKET_NAME)
+        monkeypatch.setattr(s3_transport, "transport", transport)
+        try:
+            yield transport
+        finally:
+            transport.shutdown()
+
+
+async def _create_schema(engine):
+    import database
+    import models  # noqa: F401 - registers the tables on database.Base
+
+    async with engine.begin() as connection:
+        await connection.run_sync(database.Base.metadata.create_all)
+
+
+@pytest.fixture
+def async_db(tmp_path, monkeypatch):
+    """A SQLite database with the full schema, installed as database.AsyncSessionLocal.
+
+    Returns the sessionmaker, so tests can seed and inspect rows directly.
+    """
+    pytest.importorskip("aiosqlite")
+    from sqlalchemy.dialects import sqlite
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+    from sqlalchemy.pool import NullPool
+
+    import database
+    import image_index
+    import reporting
+
+    # Upserts use the postgresql insert(); SQLite's has the same
+    # on_conflict_* API
+    monkeypatch.setattr(reporting, "insert", sqlite.insert)
+    monkeypatch.setattr(image_index, "insert", sqlite.insert)
+
+    # No pooling: the TestClient runs the app on its own event loop
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}", poolclass=NullPool)
+    asyncio.run(_create_schema(engine))
+    sessionmaker = async_sessionmaker(engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+    monkeypatch.setattr(database, "AsyncSessionLocal", sessionmaker)
+    yield sessionmaker
+    asyncio.run(engine.dispose())
+
+
+@pytest.fixture
+def sync_db(tmp_path, monkeypatch):
+    """A SQLite database with the full schema, installed as database.engine/SessionLocal."""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    import database
+    import models  # noqa: F401 - registers the tables on database.Base
+    import roles
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    database.Base.metadata.create_all(engine)
+    monkeypatch.setattr(database, "engine", engine)
+    monkeypatch.setattr(database, "SessionLocal", sessionmaker(autocommit=False, autoflush=False, bind=engine))
+    # The role map is process-wide; start every test from an empty one
+    roles.role_map.invalidate()
+    yield engine
+    roles.role_map.invalidate()
+    engine.dispose()
+
+
+def customer_row(**fields):
+    """A Customer with every column the response schema requires filled in."""
+    import models
+
+    values = dict(
+        name="Test Customer",
+        phone_number="9999999999",
+        link_token="token",
+        vehicle_name="Jupiter",
+        vehicle_variant="ZX",
+        total_price=Decimal("100000"),
+        branch_id=1,
+        sales_executive_id=1,
+        created_at=datetime.utcnow(),
+    )
+    values.update(fields)
+    return models.Customer(**values)
+
+
+def jpeg_bytes(width: int, height: int, seed: int = 0, quality: int = 90) -> bytes:
+    """A photo-like JPEG: smooth random colour blocks, so it compresses like a real picture."""
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    blocks = rng.integers(0, 255, (max(height // 8, 1), max(width // 8, 1), 3), dtype=np.uint8)
+    out = BytesIO()
+    Image.fromarray(blocks).resize((width, height)).save(out, format="JPEG", quality=quality)
+    return out.getvalue()
+
+
+def signature_bytes(width: int, height: int, seed: int = 0, format: str = "JPEG") -> bytes:
+    """Ink strokes on slightly noisy paper, so background removal has work to do."""
+    import cv2
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    paper = rng.normal(200, 30, (height, width, 3)).clip(0, 255).astype(np.uint8)
+    for _ in range(12):
+        points = rng.integers(0, (width, height), size=(6, 2)).astype(np.int32)
+        cv2.polylines(paper, [points], False, (20, 20, 60), thickness=int(rng.integers(1, 6)))
+    out = BytesIO()
+    Image.fromarray(paper).save(out, format=format)
+    return out.getvalue()
+
+
+class Postgres(NamedTuple):
+    url: str
+    engine: Any
+    async_engine: Any
+
+
+@pytest.fixture(scope="session")
+def postgres():
+    """Engines on TEST_DATABASE_URL with the full schema freshly created."""
+    if not TEST_DATABASE_URL:
+        pytest.skip("set TEST_DATABASE_URL to run the Postgres tests")
+    from sqlalchemy import exc
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from sqlalchemy.pool import NullPool
+
+    import database
+    import models  # noqa: F401 - registers the tables on database.Base
+
+    engine = database.create_db_engine(TEST_DATABASE_URL)
+    try:
+        with engine.connect():
+            pass
+    except exc.OperationalError as e:
+        engine.dispose()
+        pytest.skip(f"Postgres at TEST_DATABASE_URL is unavailable: {e}")
+
+    database.Base.metadata.drop_all(engine)
+    database.Base.metadata.create_all(engine)
+    # No pooling: asyncpg connections belong to the event loop that opened
+    # them, and tests run several loops
+    async_url = TEST_DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1)
+    async_engine = create_async_engine(async_url, poolclass=NullPool)
+    try:
+        yield Postgres(TEST_DATABASE_URL, engine, async_engine)
+    finally:
+        asyncio.run(async_engine.dispose())
+        database.Base.metadata.drop_all(engine)
+        engine.dispose()
+
+
+def use_postgres(monkeypatch, pg: Postgres):
+    """Point the app's engines and session factories at ``pg``."""
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+    from sqlalchemy.orm import sessionmaker
+
+    import database
+
+    monkeypatch.setattr(database, "engine", pg.engine)
+    monkeypatch.setattr(database, "SessionLocal", sessionmaker(autocommit=False, autoflush=False, bind=pg.engine))
+    monkeypatch.setattr(database, "async_engine", pg.async_engine)
+    monkeypatch.setattr(database, "AsyncSessionLocal", async_sessionmaker(
+        pg.async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False,
+    ))
+
+
+def truncate_postgres(pg: Postgres):
+    import database
+
+    tables = ", ".join(table.name for table in database.Base.metadata.sorted_tables)
+    with pg.engine.begin() as connection:
+        connection.exec_driver_sql(f"TRUNCATE {tables} RESTART IDENTITY CASCADE")
@@ -0,0 +1,72 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import event, insert
+
+import models
+import oauth2
+from api import admin
+
+ADMIN = models.User(user_id=1, role_id=1, branch_id=None)
+
+
+@pytest.fixture
+def client(sync_db):
+    with sync_db.begin() as connection:
+        connection.execute(insert(models.Role), [
+            dict(role_id=1, role_name="admin"), dict(role_id=2, role_name="sales"),
+            dict(role_id=3, role_name="accounts"), dict(role_id=4, role_name="rto"),
+        ])
+
+    app = FastAPI()
+    app.include_router(admin.router)
+    app.dependency_overrides[oauth2.get_current_user] = lambda: ADMIN
+    with TestClient(app) as client:
+        yield client
+
+
+def add_users(engine, count: int, start: int = 1):
+    with engine.begin() as connection:
+        connection.execute(insert(models.User), [
+            dict(user_id=user_id, first_name="User", last_name=str(user_id), email=f"user{user_id}@example.com", role_id=user_id % 4 + 1)
+            for user_id in range(start, start + count)
+        ])
+
+
+def count_statements(engine, request):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        response = request()
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    assert response.status_code == 200, response.text
+    return response, statements
+
+
+def test_user_list_query_count_independent_of_user_count(client, sync_db):
+    add_users(sync_db, 1)
+    response, one_user = count_statements(sync_db, lambda: client.get("/admin/users"))
+    assert len(response.json()) == 1
+
+    add_users(sync_db, 49, start=2)
+    response, many_users = count_statements(sync_db, lambda: client.get("/admin/users"))
+    assert len(response.json()) == 50
+
+    assert len(one_user) == len(many_users) == 1
+    assert {user["role_name"] for user in response.json()} == {"admin", "sales", "accounts", "rto"}
+
+
+def test_user_lookups_share_the_role_map(client, sync_db):
+    add_users(sync_db, 20)
+
+    # The first lookup loads the role map; every later one is a single query
+    _, first = count_statements(sync_db, lambda: client.get("/admin/users/1"))
+    counts = [len(count_statements(sync_db, lambda: client.get(f"/admin/users/{user_id}"))[1]) for user_id in range(2, 21)]
+
+    assert len(first) == 2
+    assert set(counts) == {1}
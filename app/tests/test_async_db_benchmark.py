@@ -0,0 +1,147 @@
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import httpx
+import pytest
+from sqlalchemy import insert
+
+import models
+from benchmark_server import token
+from conftest import APP_DIR, truncate_postgres
+
+CONCURRENCY = 200
+REQUESTS = 2000
+# Enough that the two form submission runs each write to their own customers
+CUSTOMERS = 2 * REQUESTS
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(scope="module")
+def server(postgres):
+    with postgres.engine.begin() as connection:
+        connection.execute(insert(models.Role), [dict(role_id=2, role_name="sales")])
+        connection.execute(insert(models.Branch), [dict(branch_id=1, name="Branch", address="-", phone_number="8000000000", branch_manager="-")])
+        connection.execute(insert(models.User), [dict(user_id=1, email="sales@example.com", role_id=2, branch_id=1)])
+        connection.execute(insert(models.Customer), [
+            dict(
+                name=f"Customer {i}", phone_number=f"9{i:09d}", link_token=f"link-{i}",
+                vehicle_name="Jupiter", vehicle_variant="ZX", total_price=Decimal("100000"),
+                branch_id=1, sales_executive_id=1, created_at=datetime(2025, 1, 1) + timedelta(hours=i),
+            )
+            for i in range(CUSTOMERS)
+        ])
+
+    # A single uvicorn worker in its own process, as the Dockerfile runs the
+    # app, so the load generator never shares the server's event loop. The
+    # keep-alive timeout is raised because a loop running seconds behind can
+    # close a connection just as its next request arrives, and that reset
+    # says nothing about the database layer
+    port = _free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "benchmark_server:create_app", "--factory",
+         "--port", str(port), "--timeout-keep-alive", "60", "--log-level", "critical"],
+        cwd=APP_DIR,
+        env={**os.environ, "PYTHONPATH": os.pathsep.join([str(APP_DIR), os.path.dirname(__file__)])},
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                httpx.get(f"{base_url}/customer/customer-form/link-0").raise_for_status()
+                break
+            except httpx.HTTPError:
+                if time.monotonic() > deadline or process.poll() is not None:
+                    raise
+                time.sleep(0.2)
+        yield base_url
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+        truncate_postgres(postgres)
+
+
+def _get(path_for):
+    return lambda http, i: http.get(path_for(i))
+
+
+def _submit(prefix: str, first_customer: int):
+    # A new first_name every time, so each request really updates its row
+    return lambda http, i: http.post(
+        f"{prefix}/link-{first_customer + i}", data={"first_name": f"Asha {i}", "dob": "1990-01-31"}
+    )
+
+
+async def _load(base_url, send, concurrency: int, total: int):
+    latencies = []
+    errors = 0
+    next_request = iter(range(total))
+
+    async def client(http):
+        nonlocal errors
+        for i in next_request:
+            started_at = time.perf_counter()
+            try:
+                response = await send(http, i)
+                failed = response.status_code != 200
+            except httpx.TransportError:
+                # uvicorn drops the connection after an unhandled error
+                failed = True
+            latencies.append(time.perf_counter() - started_at)
+            errors += failed
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    headers = {"Authorization": f"Bearer {token()}"}
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, headers=headers, timeout=60) as http:
+        started_at = time.perf_counter()
+        await asyncio.gather(*(client(http) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started_at
+    return total / elapsed, statistics.quantiles(latencies, n=100)[98], errors
+
+
+# The least share of the sync session's req/s the async one must reach, and
+# the most its p99 may exceed by (as 1 / share):
+# - the customer form lookup already ran on the threadpool and is one query
+#   with little Python around it, so threads lose nothing there. On a single
+#   core, where the load generator, server and Postgres share the CPU, runs
+#   of it land anywhere from 25% behind to slightly ahead (pool size and
+#   pre-ping make no difference), so only a collapse fails it
+# - the sales list is mostly Python per request, which 40 threads contend on
+#   the GIL for while waiting on the database, so it must be faster
+# - form submission was an async def handler blocking the event loop on
+#   psycopg2, the case the async session is for, so it must be faster
+@pytest.mark.benchmark
+@pytest.mark.parametrize("name,before,after,least_share", [
+    ("customer form", _get(lambda i: f"/before/customer-form/link-{i % CUSTOMERS}"), _get(lambda i: f"/customer/customer-form/link-{i % CUSTOMERS}"), 0.7),
+    ("sales customer list", _get(lambda i: "/before/sales/customers?limit=50"), _get(lambda i: "/sales/customers?limit=50"), 1),
+    ("customer form submission", _submit("/before/customer", 0), _submit("/customer", REQUESTS), 1),
+], ids=["customer-form", "sales-customers", "customer-submit"])
+def test_benchmark_sync_vs_async_at_200_clients(server, name, before, after, least_share):
+    results = {}
+    for label, send in (("sync session", before), ("async session", after)):
+        asyncio.run(_load(server, send, concurrency=20, total=200))  # warm up
+        results[label] = asyncio.run(_load(server, send, CONCURRENCY, REQUESTS))
+
+    print(f"\n{name}, {CONCURRENCY} concurrent clients, {REQUESTS} requests:")
+    for label, (rps, p99, errors) in results.items():
+        print(f"  {label:>13}: {rps:7.0f} req/s, p99 {p99 * 1000:7.1f} ms, {errors} errors")
+
+    sync_rps, sync_p99, sync_errors = results["sync session"]
+    async_rps, async_p99, async_errors = results["async session"]
+    assert async_rps >= least_share * sync_rps
+    assert async_p99 <= sync_p99 / least_share
+    # Errors are requests that waited out db_pool_timeout (or lost their
+    # connection after one); moving off the threadpool must never add any
+    assert async_errors <= sync_errors
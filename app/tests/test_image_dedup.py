@@ -0,0 +1,148 @@
+import asyncio
+from collections import Counter
+from tempfile import SpooledTemporaryFile
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.datastructures import UploadFile
+
+import imaging
+import models
+import oauth2
+from api import sales
+from conftest import BUCKET_NAME, customer_row, jpeg_bytes, signature_bytes
+
+PASSPORT = jpeg_bytes(900, 1200, seed=31)
+FRONT = jpeg_bytes(1200, 800, seed=32)
+BACK = jpeg_bytes(1200, 800, seed=33)
+SIGNATURE = signature_bytes(600, 200, seed=34)
+
+
+@pytest.fixture
+def calls(async_db, s3, monkeypatch):
+    """Counts S3 writes and image transforms from here on."""
+    counter = Counter()
+
+    def count_put(event_name, **kwargs):
+        counter[event_name.split(".")[-1]] += 1
+
+    for operation in ("PutObject", "CreateMultipartUpload"):
+        s3.client.meta.events.register(f"before-call.s3.{operation}", count_put)
+
+    for name in ("compress_image", "remove_background", "combine_images_vertically"):
+        def counted(*args, _original=getattr(imaging, name), _name=name, **kwargs):
+            counter[_name] += 1
+            return _original(*args, **kwargs)
+        monkeypatch.setattr(imaging, name, counted)
+    return counter
+
+
+def _upload(data: bytes, filename: str = "upload.jpg") -> UploadFile:
+    spooled = SpooledTemporaryFile()
+    spooled.write(data)
+    return UploadFile(spooled, filename=filename)
+
+
+def _keys(s3):
+    return sorted(item["Key"] for item in s3.client.list_objects_v2(Bucket=BUCKET_NAME).get("Contents", []))
+
+
+def _customer_form_uploads():
+    # What submit_customer_form hands the image job: fresh uploads each time
+    sign = _upload(SIGNATURE, "sign.jpg")
+    return [
+        imaging.ImageUpload("photo_passport", _upload(PASSPORT), "passport.jpg"),
+        imaging.ImageUpload("adhaar_front", _upload(FRONT), "aadhaarfront.jpg", compress=False),
+        imaging.ImageUpload("customer_sign", sign, "sign.png", remove_background=True),
+        imaging.ImageUpload("customer_sign_copy", sign, "copysign.jpg"),
+    ]
+
+
+def test_repeated_upload_images_stores_and_compresses_nothing(calls, s3):
+    first = asyncio.run(imaging.upload_images(_customer_form_uploads(), BUCKET_NAME))
+    keys = _keys(s3)
+    assert calls["PutObject"] == len(keys) == 4
+    # The signature is cleaned up and compressed; its copy only compressed
+    assert (calls["compress_image"], calls["remove_background"]) == (3, 1)
+
+    calls.clear()
+    second = asyncio.run(imaging.upload_images(_customer_form_uploads(), BUCKET_NAME))
+
+    assert second == first
+    assert _keys(s3) == keys
+    assert calls == Counter()
+
+
+def test_repeated_upload_combined_stores_and_compresses_nothing(calls, s3):
+    async def combined():
+        with await imaging.ingest(_upload(FRONT), "adhaar_front") as front, \
+                await imaging.ingest(_upload(BACK), "adhaar_back") as back:
+            return await imaging.upload_combined(front, back, "aadhaar_combined.jpg", BUCKET_NAME, max_dimension=1000)
+
+    first = asyncio.run(combined())
+    keys = _keys(s3)
+    assert calls["PutObject"] == len(keys) == 1
+    assert (calls["combine_images_vertically"], calls["compress_image"]) == (1, 1)
+
+    calls.clear()
+    second = asyncio.run(combined())
+
+    assert second == first
+    assert _keys(s3) == keys
+    assert calls == Counter()
+
+
+def test_same_image_in_another_field_reuses_the_stored_object(calls, s3):
+    # Objects are keyed by content, not by the field they were uploaded for
+    raw = asyncio.run(imaging.upload_images([imaging.ImageUpload("adhaar_front", _upload(FRONT), "front.jpg", compress=False)], BUCKET_NAME))
+    again = asyncio.run(imaging.upload_images([imaging.ImageUpload("delivery_photo", _upload(FRONT), "front.jpg", compress=False)], BUCKET_NAME))
+
+    assert again["delivery_photo"] == raw["adhaar_front"]
+    assert calls["PutObject"] == len(_keys(s3)) == 1
+
+
+@pytest.fixture
+def client(async_db, s3):
+    app = FastAPI()
+    app.include_router(sales.router)
+    app.dependency_overrides[oauth2.get_current_user] = lambda: models.User(user_id=1, role_id=2, branch_id=1)
+
+    async def seed():
+        async with async_db() as db:
+            db.add(customer_row(customer_id=1))
+            await db.commit()
+
+    asyncio.run(seed())
+    with TestClient(app) as client:
+        yield client
+
+
+SALES_RETRIES = [
+    ("/sales/customers/update-passport-photo/1", {"passport_photo": PASSPORT}, "photo_passport"),
+    ("/sales/customers/update-customersign/1", {"customer_sign": SIGNATURE}, "customer_sign"),
+    ("/sales/customers/update-adhaar/1", {"aadhaar_front_photo": FRONT, "aadhaar_back_photo": BACK}, "photo_adhaar_combined"),
+    ("/sales/customers/seperate-update-adhaar-photos/1", {"aadhaar_front_photo": FRONT, "aadhaar_back_photo": BACK}, "adhaar_back"),
+]
+
+
+@pytest.mark.parametrize("path,files,field", SALES_RETRIES, ids=[path.split("/")[3] for path, _, _ in SALES_RETRIES])
+def test_retried_sales_update_stores_and_compresses_nothing(client, async_db, calls, s3, path, files, field):
+    async def stored_url():
+        async with async_db() as db:
+            return getattr(await db.get(models.Customer, 1), field)
+
+    def put():
+        response = client.put(path, files={name: (f"{name}.jpg", data, "image/jpeg") for name, data in files.items()})
+        assert response.status_code == 200, response.text
+        return asyncio.run(stored_url())
+
+    first = put()
+    keys = _keys(s3)
+    assert first is not None
+    assert calls["PutObject"] == len(keys) > 0
+
+    calls.clear()
+    assert put() == first
+    assert _keys(s3) == keys
+    assert calls == Counter()
@@ -0,0 +1,334 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+from tempfile import SpooledTemporaryFile
+
+import pytest
+from sqlalchemy import event, func, select, update
+from starlette.datastructures import UploadFile
+
+import image_jobs
+import imaging
+import models
+from conftest import customer_row, jpeg_bytes, signature_bytes
+
+PASSPORT = jpeg_bytes(800, 600, seed=41)
+FRONT = jpeg_bytes(900, 600, seed=42)
+SIGNATURE = signature_bytes(400, 150, seed=43)
+
+
+@pytest.fixture
+def db(async_db, s3):
+    async def seed():
+        async with async_db() as session:
+            session.add_all([customer_row(customer_id=1, link_token="one"), customer_row(customer_id=2, link_token="two")])
+            await session.commit()
+
+    asyncio.run(seed())
+    return async_db
+
+
+@pytest.fixture
+def settings(monkeypatch):
+    monkeypatch.setattr(image_jobs.settings, "image_job_max_attempts", 3)
+    monkeypatch.setattr(image_jobs.settings, "image_job_retry_delay", 5)
+    monkeypatch.setattr(image_jobs.settings, "image_job_timeout", 300)
+    return image_jobs.settings
+
+
+@pytest.fixture
+def processed(monkeypatch):
+    """Stands in for imaging.upload_images; records what each run was given.
+
+    Set ``processed.fail`` to a number of runs that should raise first.
+    """
+    class Recorder(list):
+        fail = 0
+
+    runs = Recorder()
+
+    async def upload_images(uploads, bucket_name):
+        runs.append({upload.field: await imaging.read_image_input(upload.source) for upload in uploads})
+        if runs.fail:
+            runs.fail -= 1
+            raise RuntimeError("S3 unavailable")
+        return {upload.field: f"https://{bucket_name}.s3.amazonaws.com/{upload.field}-{len(runs)}" for upload in uploads}
+
+    monkeypatch.setattr(imaging, "upload_images", upload_images)
+    return runs
+
+
+def _upload(data: bytes, filename: str = "upload.jpg") -> UploadFile:
+    spooled = SpooledTemporaryFile()
+    spooled.write(data)
+    return UploadFile(spooled, filename=filename)
+
+
+def _form_uploads():
+    # What submit_customer_form queues: the signature is stored twice, cleaned
+    # up once and copied as-is once
+    sign = _upload(SIGNATURE, "sign.jpg")
+    return [
+        imaging.ImageUpload("photo_passport", _upload(PASSPORT), "passport.jpg"),
+        imaging.ImageUpload("adhaar_front", _upload(FRONT), "aadhaarfront.jpg", compress=False),
+        imaging.ImageUpload("customer_sign", sign, "sign.png", remove_background=True),
+        imaging.ImageUpload("customer_sign_copy", sign, "copysign.jpg"),
+    ]
+
+
+def _enqueue(db, uploads, customer_id: int = 1):
+    async def enqueue():
+        async with db() as session:
+            await image_jobs.enqueue(session, await session.get(models.Customer, customer_id), uploads)
+            await session.commit()
+    asyncio.run(enqueue())
+
+
+def _load(db, model, **filters):
+    async def load():
+        async with db() as session:
+            return (await session.scalars(select(model).filter_by(**filters).order_by(*model.__table__.primary_key))).all()
+    return asyncio.run(load())
+
+
+def _count(db, model) -> int:
+    async def count():
+        async with db() as session:
+            return await session.scalar(select(func.count()).select_from(model))
+    return asyncio.run(count())
+
+
+def _set_job(db, job_id: int, **values):
+    async def set_job():
+        async with db() as session:
+            await session.execute(update(models.ImageJob).filter(models.ImageJob.id == job_id).values(**values))
+            await session.commit()
+    asyncio.run(set_job())
+
+
+def _customer(db, customer_id: int = 1) -> models.Customer:
+    return _load(db, models.Customer, customer_id=customer_id)[0]
+
+
+def test_enqueue_stores_each_source_once(db):
+    _enqueue(db, _form_uploads())
+
+    files = _load(db, models.ImageJobFile)
+    blobs = {blob.id: blob for blob in _load(db, models.ImageJobBlob)}
+    assert len(files) == 4
+    assert len(blobs) == 3
+    sign, copy = files[2:]
+    assert sign.blob_id == copy.blob_id
+    assert blobs[sign.blob_id].size == len(SIGNATURE)
+    assert _customer(db).processing_status == "pending"
+
+
+def test_enqueue_splits_large_uploads_into_chunks(db, monkeypatch):
+    monkeypatch.setattr(image_jobs, "BLOB_CHUNK_SIZE", 1000)
+    _enqueue(db, [imaging.ImageUpload("photo_passport", _upload(PASSPORT), "passport.jpg")])
+
+    chunks = _load(db, models.ImageJobBlobChunk)
+    assert [chunk.seq for chunk in chunks] == list(range(-(-len(PASSPORT) // 1000)))
+    assert b"".join(chunk.data for chunk in chunks) == PASSPORT
+
+
+def test_run_pending_sets_the_customer_images(db, s3):
+    _enqueue(db, _form_uploads())
+
+    assert asyncio.run(image_jobs.run_pending()) == 1
+
+    customer = _customer(db)
+    assert customer.processing_status == "done"
+    for field in ("photo_passport", "adhaar_front", "customer_sign", "customer_sign_copy"):
+        assert getattr(customer, field).startswith("https://")
+    key = customer.adhaar_front.split(".s3.amazonaws.com/", 1)[1]
+    assert asyncio.run(s3.get_object_bytes(image_jobs.BUCKET_NAME, key)) == FRONT
+
+    [job] = _load(db, models.ImageJob)
+    assert (job.status, job.attempts, job.last_error) == ("done", 1, None)
+    # The job is kept as a record; the uploads are not
+    for model in (models.ImageJobFile, models.ImageJobBlob, models.ImageJobBlobChunk):
+        assert _count(db, model) == 0
+
+
+def test_run_reads_back_every_chunk(db, processed, monkeypatch):
+    monkeypatch.setattr(image_jobs, "BLOB_CHUNK_SIZE", 1000)
+    _enqueue(db, _form_uploads())
+
+    asyncio.run(image_jobs.run_pending())
+
+    assert processed == [{
+        "photo_passport": PASSPORT, "adhaar_front": FRONT, "customer_sign": SIGNATURE, "customer_sign_copy": SIGNATURE,
+    }]
+
+
+def test_run_spools_large_uploads_to_disk(db, processed, monkeypatch, tmp_path):
+    spool_dir = tmp_path / "spool"
+    spool_dir.mkdir()
+    monkeypatch.setattr(image_jobs.settings, "upload_spool_dir", str(spool_dir))
+    monkeypatch.setattr(image_jobs.settings, "upload_spool_threshold", len(SIGNATURE))
+    _enqueue(db, _form_uploads())
+
+    async def upload_images(uploads, bucket_name):
+        on_disk = {upload.field: upload.source.path is not None for upload in uploads}
+        assert on_disk == {"photo_passport": True, "adhaar_front": True, "customer_sign": False, "customer_sign_copy": False}
+        assert await imaging.read_image_input(uploads[0].source) == PASSPORT
+        return {}
+    monkeypatch.setattr(imaging, "upload_images", upload_images)
+
+    asyncio.run(image_jobs.run_pending())
+
+    assert _load(db, models.ImageJob)[0].status == "done"
+    assert os.listdir(spool_dir) == []
+
+
+def test_run_holds_no_connection_while_processing(db, processed, monkeypatch):
+    engine = db.kw["bind"].sync_engine
+    checked_out = []
+    event.listen(engine, "checkout", lambda *args: checked_out.append(1))
+    event.listen(engine, "checkin", lambda *args: checked_out.pop())
+    _enqueue(db, _form_uploads())
+
+    async def upload_images(uploads, bucket_name):
+        assert checked_out == []
+        return await processed_upload_images(uploads, bucket_name)
+    processed_upload_images = imaging.upload_images
+    monkeypatch.setattr(imaging, "upload_images", upload_images)
+
+    assert asyncio.run(image_jobs.run_pending()) == 1
+    assert len(processed) == 1
+
+
+def test_failed_run_is_retried_with_backoff(db, processed, settings):
+    processed.fail = 2
+    _enqueue(db, _form_uploads())
+
+    started_at = datetime.utcnow()
+    assert asyncio.run(image_jobs.run_pending()) == 1
+    [job] = _load(db, models.ImageJob)
+    assert (job.status, job.attempts, job.last_error) == ("pending", 1, "RuntimeError: S3 unavailable")
+    assert started_at + timedelta(seconds=5) <= job.run_after <= datetime.utcnow() + timedelta(seconds=5)
+    assert _customer(db).processing_status == "pending"
+
+    # Not due yet
+    assert asyncio.run(image_jobs.run_pending()) == 0
+
+    _set_job(db, job.id, run_after=datetime.utcnow())
+    started_at = datetime.utcnow()
+    assert asyncio.run(image_jobs.run_pending()) == 1
+    [job] = _load(db, models.ImageJob)
+    assert (job.status, job.attempts) == ("pending", 2)
+    assert started_at + timedelta(seconds=10) <= job.run_after <= datetime.utcnow() + timedelta(seconds=10)
+
+    _set_job(db, job.id, run_after=datetime.utcnow())
+    assert asyncio.run(image_jobs.run_pending()) == 1
+    [job] = _load(db, models.ImageJob)
+    assert (job.status, job.attempts, job.last_error) == ("done", 3, None)
+    assert _customer(db).processing_status == "done"
+    assert len(processed) == 3
+
+
+def test_job_fails_after_max_attempts(db, processed, settings):
+    processed.fail = 3
+    _enqueue(db, _form_uploads())
+
+    for attempt in range(settings.image_job_max_attempts):
+        [job] = _load(db, models.ImageJob)
+        _set_job(db, job.id, run_after=datetime.utcnow())
+        assert asyncio.run(image_jobs.run_pending()) == 1
+
+    [job] = _load(db, models.ImageJob)
+    assert (job.status, job.attempts) == ("failed", 3)
+    assert _customer(db).processing_status == "failed"
+    # Its uploads stay behind with it, so it can be looked into and requeued
+    assert _count(db, models.ImageJobBlob) == 3
+
+    _set_job(db, job.id, run_after=datetime.utcnow())
+    assert asyncio.run(image_jobs.run_pending()) == 0
+    assert len(processed) == 3
+
+
+def test_stale_running_job_is_reclaimed(db, processed, settings):
+    _enqueue(db, _form_uploads())
+    [job] = _load(db, models.ImageJob)
+    # A worker claimed it and died
+    _set_job(db, job.id, status="running", attempts=1, locked_at=datetime.utcnow() - timedelta(seconds=301))
+
+    assert asyncio.run(image_jobs.run_pending()) == 1
+
+    [job] = _load(db, models.ImageJob)
+    assert (job.status, job.attempts) == ("done", 2)
+    assert _customer(db).processing_status == "done"
+
+
+def test_running_job_is_left_alone_until_stale(db, processed, settings):
+    _enqueue(db, _form_uploads())
+    [job] = _load(db, models.ImageJob)
+    _set_job(db, job.id, status="running", attempts=1, locked_at=datetime.utcnow() - timedelta(seconds=60))
+
+    assert asyncio.run(image_jobs.run_pending()) == 0
+    assert processed == []
+
+
+def test_stale_job_at_max_attempts_is_failed_not_rerun(db, processed, settings):
+    _enqueue(db, _form_uploads())
+    _enqueue(db, [imaging.ImageUpload("photo_passport", _upload(PASSPORT), "passport.jpg")], customer_id=2)
+    first, second = _load(db, models.ImageJob)
+    _set_job(db, first.id, status="running", attempts=3, locked_at=datetime.utcnow() - timedelta(seconds=301))
+
+    # Gives up on the first and carries on with the next
+    assert asyncio.run(image_jobs.run_pending()) == 1
+
+    first, second = _load(db, models.ImageJob)
+    assert (first.status, first.attempts) == ("failed", 3)
+    assert first.last_error == "TimeoutError: no result within 300s"
+    assert _customer(db, 1).processing_status == "failed"
+    assert second.status == "done"
+    assert list(processed[0]) == ["photo_passport"]
+
+
+def test_later_job_owns_the_customer_status(db, processed, settings, monkeypatch):
+    monkeypatch.setattr(settings, "image_job_max_attempts", 1)
+    processed.fail = 1
+    _enqueue(db, _form_uploads())
+    _enqueue(db, [imaging.ImageUpload("photo_passport", _upload(PASSPORT), "passport.jpg")])
+
+    # The resubmitted form is still queued, so the first job failing does not
+    # mark the customer failed
+    assert asyncio.run(image_jobs.run_pending(limit=1)) == 1
+    first, second = _load(db, models.ImageJob)
+    assert (first.status, second.status) == ("failed", "pending")
+    assert _customer(db).processing_status == "pending"
+
+    assert asyncio.run(image_jobs.run_pending()) == 1
+    assert _customer(db).processing_status == "done"
+
+
+def test_earlier_job_finishing_keeps_the_customer_pending(db, processed, settings):
+    _enqueue(db, _form_uploads())
+    _enqueue(db, [imaging.ImageUpload("photo_passport", _upload(PASSPORT), "passport.jpg")])
+
+    assert asyncio.run(image_jobs.run_pending(limit=1)) == 1
+
+    customer = _customer(db)
+    assert customer.processing_status == "pending"
+    assert customer.adhaar_front.endswith("adhaar_front-1")
+
+
+def test_result_of_a_superseded_run_is_dropped(db, processed, settings):
+    _enqueue(db, _form_uploads())
+
+    async def claim():
+        async with db() as session:
+            return await image_jobs._claim(session)
+    job = asyncio.run(claim())
+    # It ran past image_job_timeout and another worker took it over
+    _set_job(db, job.id, attempts=2, locked_at=job.locked_at + timedelta(seconds=301))
+
+    asyncio.run(image_jobs._run(job.id, job.locked_at))
+
+    [stored] = _load(db, models.ImageJob)
+    assert (stored.status, stored.attempts) == ("running", 2)
+    assert _customer(db).processing_status == "pending"
+    assert _customer(db).photo_passport is None
+    assert _count(db, models.ImageJobFile) == 4
@@ -0,0 +1,216 @@
+import asyncio
+import os
+import statistics
+import time
+from io import BytesIO
+from tempfile import SpooledTemporaryFile
+
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+from starlette.datastructures import UploadFile
+
+import imaging
+from conftest import jpeg_bytes, signature_bytes
+
+GOLDEN_DIR = os.path.join(os.path.dirname(__file__), "golden")
+
+# Rewrite the golden images from the current code instead of comparing, after
+# a deliberate change to a transform's output:
+#   UPDATE_GOLDENS=1 python -m pytest app/tests/test_imaging.py
+UPDATE_GOLDENS = os.environ.get("UPDATE_GOLDENS") == "1"
+
+# Mean absolute difference per channel (0-255) tolerated for lossy output,
+# where libjpeg builds disagree by a level on scattered pixels. A different
+# resampling filter or JPEG quality moves the mean by a level or more.
+LOSSY_TOLERANCE = 0.5
+
+
+
+def _document(width: int, height: int, seed: int = 0) -> bytes:
+    """A photographed ID card, near enough: flat colour panels and lines of text on a gradient.
+
+    Smooth enough that the golden PNGs stay small, with edges and text for
+    resampling and JPEG quality to show up on.
+    """
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width]
+    image = np.dstack([200 + 40 * x / width, 190 + 50 * y / height, np.full((height, width), 170.0)]).astype(np.uint8)
+    for _ in range(8):
+        x0, y0 = (int(v) for v in rng.integers(0, (width, height)))
+        x1, y1 = x0 + int(rng.integers(40, width // 3)), y0 + int(rng.integers(20, height // 4))
+        cv2.rectangle(image, (x0, y0), (x1, y1), tuple(int(c) for c in rng.integers(0, 200, 3)), -1)
+    for row in range(height // 10, height, height // 12):
+        cv2.putText(image, "GOVERNMENT OF INDIA 1234 5678 9012", (width // 20, row), cv2.FONT_HERSHEY_SIMPLEX,
+                    width / 1600, (30, 30, 30), max(width // 800, 1), cv2.LINE_AA)
+    out = BytesIO()
+    Image.fromarray(image).save(out, format="JPEG", quality=90)
+    return out.getvalue()
+
+
+PHOTO = _document(1600, 1200, seed=21)
+SCAN = _document(1200, 800, seed=22)
+SIGNATURE = signature_bytes(640, 240, seed=23)
+
+
+class AsyncFile:
+    """A file object with coroutine seek()/read(), like aiofiles or another framework's upload."""
+
+    def __init__(self, data: bytes):
+        self._buffer = BytesIO(data)
+
+    async def seek(self, offset: int) -> int:
+        return self._buffer.seek(offset)
+
+    async def read(self, size: int = -1) -> bytes:
+        return self._buffer.read(size)
+
+
+def _spooled_file(data: bytes, max_size: int = 1):
+    # Rolls over to a real temp file once more than max_size is written
+    spooled = SpooledTemporaryFile(max_size=max_size)
+    spooled.write(data)
+    return spooled
+
+
+def _buffer_at_end(data: bytes) -> BytesIO:
+    buffer = BytesIO(data)
+    buffer.seek(0, os.SEEK_END)
+    return buffer
+
+
+INPUTS = {
+    "bytes": lambda data, tmp_path: data,
+    "bytearray": lambda data, tmp_path: bytearray(data),
+    "memoryview": lambda data, tmp_path: memoryview(data),
+    "bytesio_at_end": lambda data, tmp_path: _buffer_at_end(data),
+    "upload_file": lambda data, tmp_path: UploadFile(_spooled_file(data, max_size=1024 * 1024), filename="photo.jpg"),
+    "upload_file_on_disk": lambda data, tmp_path: UploadFile(_spooled_file(data), filename="photo.jpg"),
+    "spooled_temporary_file": lambda data, tmp_path: _spooled_file(data),
+    "async_file": lambda data, tmp_path: AsyncFile(data),
+    "spooled_image_in_memory": lambda data, tmp_path: imaging.SpooledImage("photo_passport", len(data), "-", data=data),
+    "spooled_image_on_disk": lambda data, tmp_path: _spooled_image_on_disk(data, tmp_path),
+}
+
+
+def _spooled_image_on_disk(data: bytes, tmp_path) -> imaging.SpooledImage:
+    path = tmp_path / "upload"
+    path.write_bytes(data)
+    return imaging.SpooledImage("photo_passport", len(data), "-", path=str(path))
+
+
+@pytest.mark.parametrize("kind", sorted(INPUTS))
+def test_read_image_input_accepts_every_input(kind, tmp_path):
+    source = INPUTS[kind](PHOTO, tmp_path)
+
+    async def read_twice():
+        return await imaging.read_image_input(source), await imaging.read_image_input(source)
+
+    first, second = asyncio.run(read_twice())
+    assert first == second == PHOTO
+
+
+def test_read_image_input_rejects_other_types():
+    with pytest.raises(TypeError):
+        asyncio.run(imaging.read_image_input("photo.jpg"))
+
+
+@pytest.mark.parametrize("kind", ["upload_file", "async_file", "spooled_image_on_disk"])
+def test_transforms_accept_any_input(kind, tmp_path):
+    expected = imaging._compress_image(PHOTO, 10, 20, 400)[0]
+    result = asyncio.run(imaging.compress_image(INPUTS[kind](PHOTO, tmp_path), 10, 20, max_dimension=400))
+
+    assert result.getvalue() == expected
+
+
+def _pixels(image: Image.Image) -> np.ndarray:
+    return np.asarray(image).astype(np.int16)
+
+
+def _check_golden(name: str, image: Image.Image, tolerance: float = 0):
+    path = os.path.join(GOLDEN_DIR, f"{name}.png")
+    if UPDATE_GOLDENS:
+        os.makedirs(GOLDEN_DIR, exist_ok=True)
+        image.save(path, format="PNG", optimize=True)
+        return
+    golden = Image.open(path)
+
+    assert (image.mode, image.size) == (golden.mode, golden.size)
+    difference = np.abs(_pixels(image) - _pixels(golden))
+    if tolerance:
+        assert difference.mean() <= tolerance, f"{name} drifted from its golden image by {difference.mean():.2f}"
+    else:
+        assert not difference.any(), f"{name} differs from its golden image in {np.count_nonzero(difference)} values"
+
+
+def test_decode_image_matches_golden():
+    # Not a power-of-two reduction, so the LANCZOS pass after draft() shows
+    image = imaging.decode_image(PHOTO, 360)
+
+    assert image.size == (360, 270)
+    _check_golden("decode_image", image.convert("RGB"), LOSSY_TOLERANCE)
+
+
+def test_decode_image_leaves_small_images_alone():
+    image = imaging.decode_image(SIGNATURE, 4000)
+
+    assert image.size == (640, 240)
+    assert np.array_equal(np.asarray(image), np.asarray(Image.open(BytesIO(SIGNATURE))))
+
+
+def test_combine_images_vertically_matches_golden():
+    combined = Image.open(BytesIO(imaging._combine_images_vertically(PHOTO, SCAN, 200)))
+
+    assert combined.size == (200, 150 + 133)
+    _check_golden("combine_images_vertically", combined, LOSSY_TOLERANCE)
+
+
+def test_compress_image_matches_golden():
+    data, _ = imaging._compress_image(PHOTO, 10, 20, 400)
+    compressed = Image.open(BytesIO(data))
+
+    assert 10 * 1024 <= len(data) <= 20 * 1024
+    assert compressed.size == (400, 300)
+    _check_golden("compress_image", compressed, LOSSY_TOLERANCE)
+
+
+def test_remove_background_matches_golden():
+    # Thresholded and lossless, so it must match exactly
+    _check_golden("remove_background", Image.open(BytesIO(imaging._remove_background(SIGNATURE))))
+
+
+def _median_ms(fn, *args, repeat: int) -> float:
+    fn(*args)
+    timings = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        fn(*args)
+        timings.append(time.perf_counter() - started_at)
+    return statistics.median(timings) * 1000
+
+
+def _decode_full_then_resize(source: bytes, max_dimension: int) -> Image.Image:
+    # What every helper did before decode_image: load all pixels, then shrink
+    image = Image.open(BytesIO(source))
+    image.load()
+    image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+    return image
+
+
+@pytest.mark.benchmark
+def test_benchmark_imaging_helpers():
+    camera_photo = jpeg_bytes(4000, 3000, seed=24)
+    camera_upload = UploadFile(_spooled_file(camera_photo), filename="photo.jpg")
+    benchmarks = {
+        "decode_image 12MP -> 1600px": (lambda: imaging.decode_image(camera_photo, 1600), 10),
+        "  full decode + thumbnail": (lambda: _decode_full_then_resize(camera_photo, 1600), 10),
+        "compress_image 12MP, 300-400 KB": (lambda: imaging._compress_image(camera_photo, 300, 400, 1600), 5),
+        "combine_images_vertically 2x2MP": (lambda: imaging._combine_images_vertically(PHOTO, PHOTO, 1600), 10),
+        "remove_background 0.15MP signature": (lambda: imaging._remove_background(SIGNATURE), 50),
+        "read_image_input UploadFile 12MP": (lambda: asyncio.run(imaging.read_image_input(camera_upload)), 50),
+    }
+
+    print()
+    for name, (fn, repeat) in benchmarks.items():
+        print(f"{name:<40} {_median_ms(fn, repeat=repeat):8.2f} ms")
@@ -0,0 +1,258 @@
+import asyncio
+import hashlib
+import os
+import tracemalloc
+from io import BytesIO
+from tempfile import SpooledTemporaryFile
+from typing import List
+
+import httpx
+import pytest
+from fastapi import FastAPI, File, HTTPException, UploadFile
+from fastapi.testclient import TestClient
+from starlette.datastructures import UploadFile as StarletteUploadFile
+
+import imaging
+import models
+import oauth2
+from api import sales
+from conftest import BUCKET_NAME, customer_row
+
+SIGNATURE_LIMIT = 1000
+DOCUMENT_LIMIT = 3000
+DEFAULT_LIMIT = 5000
+
+
+@pytest.fixture
+def limits(monkeypatch, tmp_path):
+    monkeypatch.setattr(imaging.settings, "upload_max_bytes_signature", SIGNATURE_LIMIT)
+    monkeypatch.setattr(imaging.settings, "upload_max_bytes_document", DOCUMENT_LIMIT)
+    monkeypatch.setattr(imaging.settings, "upload_max_bytes", DEFAULT_LIMIT)
+    spool_dir = tmp_path / "spool"
+    spool_dir.mkdir()
+    monkeypatch.setattr(imaging.settings, "upload_spool_dir", str(spool_dir))
+    return spool_dir
+
+
+def _upload(data: bytes) -> StarletteUploadFile:
+    spooled = SpooledTemporaryFile()
+    spooled.write(data)
+    return StarletteUploadFile(spooled, filename="upload.jpg")
+
+
+def _ingest(data: bytes, field: str) -> imaging.SpooledImage:
+    return asyncio.run(imaging.ingest(_upload(data), field))
+
+
+FIELD_LIMITS = [
+    ("customer_sign", SIGNATURE_LIMIT),
+    ("customer_sign_copy", SIGNATURE_LIMIT),
+    ("photo_passport", DOCUMENT_LIMIT),
+    ("adhaar_front", DOCUMENT_LIMIT),
+    ("adhaar_back", DOCUMENT_LIMIT),
+    ("delivery_photo", DEFAULT_LIMIT),
+    ("chassis_photo", DEFAULT_LIMIT),
+]
+
+
+@pytest.mark.parametrize("field,limit", FIELD_LIMITS)
+def test_ingest_accepts_uploads_up_to_the_field_limit(limits, field, limit):
+    with _ingest(b"x" * limit, field) as spooled:
+        assert spooled.size == limit
+
+
+@pytest.mark.parametrize("field,limit", FIELD_LIMITS)
+def test_ingest_rejects_uploads_over_the_field_limit(limits, field, limit):
+    with pytest.raises(HTTPException) as excinfo:
+        _ingest(b"x" * (limit + 1), field)
+
+    assert excinfo.value.status_code == 413
+    assert field in excinfo.value.detail
+
+
+def test_ingest_stops_reading_once_over_the_limit(limits, monkeypatch):
+    monkeypatch.setattr(imaging, "INGEST_CHUNK_SIZE", 100)
+    upload = _upload(b"x" * 100_000)
+
+    with pytest.raises(HTTPException):
+        asyncio.run(imaging.ingest(upload, "customer_sign"))
+
+    assert upload.file.tell() <= SIGNATURE_LIMIT + 100
+
+
+@pytest.mark.parametrize("size", [1, 999, 1000])
+def test_ingest_keeps_uploads_up_to_the_threshold_in_memory(limits, monkeypatch, size):
+    monkeypatch.setattr(imaging.settings, "upload_spool_threshold", 1000)
+    data = os.urandom(size)
+
+    with _ingest(data, "delivery_photo") as spooled:
+        assert spooled.path is None
+        assert spooled.data == data
+        assert spooled.sha256 == hashlib.sha256(data).hexdigest()
+    assert os.listdir(limits) == []
+
+
+@pytest.mark.parametrize("chunk_size", [100, 1024, imaging.INGEST_CHUNK_SIZE])
+def test_ingest_spills_uploads_over_the_threshold_to_a_temp_file(limits, monkeypatch, chunk_size):
+    # Small chunks cross the threshold part way through the file, so the
+    # chunks already held in memory must land in the temp file first
+    monkeypatch.setattr(imaging, "INGEST_CHUNK_SIZE", chunk_size)
+    monkeypatch.setattr(imaging.settings, "upload_spool_threshold", 1000)
+    data = os.urandom(4321)
+
+    with _ingest(data, "delivery_photo") as spooled:
+        assert spooled.data is None
+        assert os.path.dirname(spooled.path) == str(limits)
+        with open(spooled.path, "rb") as spill:
+            assert spill.read() == data
+        assert (spooled.size, spooled.sha256) == (len(data), hashlib.sha256(data).hexdigest())
+        assert asyncio.run(imaging.read_image_input(spooled)) == data
+    assert os.listdir(limits) == []
+
+
+def test_ingest_removes_the_temp_file_when_rejecting(limits, monkeypatch):
+    monkeypatch.setattr(imaging, "INGEST_CHUNK_SIZE", 100)
+    monkeypatch.setattr(imaging.settings, "upload_spool_threshold", 500)
+
+    with pytest.raises(HTTPException):
+        _ingest(b"x" * (DEFAULT_LIMIT + 1), "delivery_photo")
+
+    assert os.listdir(limits) == []
+
+
+@pytest.fixture
+def client(limits, async_db, s3):
+    app = FastAPI()
+    app.include_router(sales.router)
+    app.dependency_overrides[oauth2.get_current_user] = lambda: models.User(user_id=1, role_id=2, branch_id=1)
+
+    async def seed():
+        async with async_db() as db:
+            db.add(customer_row(customer_id=1))
+            await db.commit()
+
+    asyncio.run(seed())
+    with TestClient(app) as client:
+        yield client
+
+
+# (method, path, form fields, the one sent oversized, the customer field it is checked as, its limit)
+SALES_UPLOADS = [
+    ("put", "/sales/customers/update-customersign/1", ["customer_sign"], "customer_sign", "customer_sign", SIGNATURE_LIMIT),
+    ("put", "/sales/customers/update-passport-photo/1", ["passport_photo"], "passport_photo", "photo_passport", DOCUMENT_LIMIT),
+    ("put", "/sales/customers/update-adhaar/1", ["aadhaar_front_photo", "aadhaar_back_photo"], "aadhaar_back_photo", "adhaar_back", DOCUMENT_LIMIT),
+    ("post", "/sales/customers/delivery-update/1", ["number_plate_front", "number_plate_back", "delivery_photo"], "delivery_photo", "delivery_photo", DEFAULT_LIMIT),
+]
+
+
+@pytest.mark.parametrize("method,path,fields,oversized,field,limit", SALES_UPLOADS, ids=[path.split("/")[3] for _, path, *_ in SALES_UPLOADS])
+def test_endpoints_reject_oversized_fields_before_storing_anything(client, limits, s3, method, path, fields, oversized, field, limit):
+    # The oversized file is the last one, after the others have been spooled
+    files = {name: (f"{name}.jpg", b"x" * (limit + 1 if name == oversized else 10), "image/jpeg") for name in fields}
+
+    response = client.request(method, path, files=files)
+
+    assert response.status_code == 413
+    assert response.json()["detail"].startswith(f"{field} is larger")
+    assert s3.client.list_objects_v2(Bucket=BUCKET_NAME)["KeyCount"] == 0
+    assert os.listdir(limits) == []
+
+
+# Peak memory per request under concurrent uploads
+
+CONCURRENT_REQUESTS = 8
+PHOTO_BYTES = 4 * 1024 * 1024
+BODY_CHUNK_SIZE = 64 * 1024
+
+
+async def _drain_to_s3(image, bucket_name: str, file_name: str = None) -> str:
+    # Reads what boto3 would send, without keeping it anywhere, so the peak
+    # is the endpoint's own memory
+    while image.read(imaging.INGEST_CHUNK_SIZE):
+        pass
+    return f"https://{bucket_name}.s3.amazonaws.com/{file_name}"
+
+
+async def before_delivery_update(
+    customer_id: int,
+    number_plate_front: UploadFile = File(...),
+    number_plate_back: UploadFile = File(...),
+    delivery_photo: UploadFile = File(...),
+):
+    # The handler as it was before streaming ingestion: every file read whole
+    # into a BytesIO, then uploaded
+    number_plate_front_bytes = BytesIO(await number_plate_front.read())
+    number_plate_back_bytes = BytesIO(await number_plate_back.read())
+    delivery_photo_bytes = BytesIO(await delivery_photo.read())
+
+    return [
+        await _drain_to_s3(number_plate_front_bytes, BUCKET_NAME, number_plate_front.filename),
+        await _drain_to_s3(number_plate_back_bytes, BUCKET_NAME, number_plate_back.filename),
+        await _drain_to_s3(delivery_photo_bytes, BUCKET_NAME, delivery_photo.filename),
+    ]
+
+
+def _multipart(files: dict):
+    request = httpx.Request("POST", "http://test", files=files)
+    return request.headers["content-type"], request.read()
+
+
+async def _in_chunks(body: bytes):
+    # What uvicorn hands the app: the body a socket read at a time, never whole
+    for start in range(0, len(body), BODY_CHUNK_SIZE):
+        yield body[start:start + BODY_CHUNK_SIZE]
+
+
+async def _peak_per_request(app: FastAPI, path: str, bodies: List[tuple]) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=120) as http:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        responses = await asyncio.gather(*(
+            http.post(path, content=_in_chunks(body), headers={"content-type": content_type})
+            for content_type, body in bodies
+        ))
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+    assert all(response.status_code == 200 for response in responses), [r.text for r in responses]
+    return peak / len(bodies)
+
+
+@pytest.mark.benchmark
+def test_benchmark_peak_memory_per_request(limits, async_db, s3, monkeypatch):
+    monkeypatch.setattr(imaging.settings, "upload_max_bytes", 15 * 1024 * 1024)
+    monkeypatch.setattr(imaging.settings, "upload_spool_threshold", 1024 * 1024)
+    monkeypatch.setattr(imaging, "upload_image_to_s3", _drain_to_s3)
+
+    async def seed():
+        async with async_db() as db:
+            db.add(customer_row(customer_id=1))
+            await db.commit()
+    asyncio.run(seed())
+
+    app = FastAPI()
+    app.include_router(sales.router)
+    app.add_api_route("/before/delivery-update/{customer_id}", before_delivery_update, methods=["POST"])
+    app.dependency_overrides[oauth2.get_current_user] = lambda: models.User(user_id=1, role_id=2, branch_id=1)
+
+    # Every request uploads different photos, so none is skipped as a repeat.
+    # Bodies are encoded up front so the client's copies are not counted;
+    # CRs are swapped out, as the multipart parser slows to a crawl on each.
+    bodies = [
+        _multipart({
+            field: (f"{field}-{i}.jpg", os.urandom(PHOTO_BYTES).replace(b"\r", b"\n"), "image/jpeg")
+            for field in ("number_plate_front", "number_plate_back", "delivery_photo")
+        })
+        for i in range(CONCURRENT_REQUESTS)
+    ]
+    tracemalloc.start()
+    try:
+        before = asyncio.run(_peak_per_request(app, "/before/delivery-update/1", bodies))
+        after = asyncio.run(_peak_per_request(app, "/sales/customers/delivery-update/1", bodies))
+    finally:
+        tracemalloc.stop()
+
+    print(f"\ndelivery-update, {CONCURRENT_REQUESTS} concurrent requests of 3 x {PHOTO_BYTES / 2**20:g} MB:")
+    print(f"  read whole files: {before / 2**20:6.1f} MB peak per request")
+    print(f"  spooled ingest:   {after / 2**20:6.1f} MB peak per request")
+
+    assert after < before
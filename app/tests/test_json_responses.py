@@ -0,0 +1,125 @@
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+from sqlalchemy import insert
+
+import models
+import oauth2
+from api import admin
+from json_responses import FastJSONResponse
+from pagination import PageParams
+from test_admin_users import ADMIN
+
+CUSTOMERS = 10_000
+
+
+def _seed(engine, count: int):
+    with engine.begin() as connection:
+        connection.execute(insert(models.Role), [dict(role_id=1, role_name="admin"), dict(role_id=2, role_name="sales")])
+        connection.execute(insert(models.Branch), [
+            dict(branch_id=branch_id, name=f"Branch {branch_id}", address="-", phone_number=f"800000000{branch_id}", branch_manager="-")
+            for branch_id in (1, 2)
+        ])
+        connection.execute(insert(models.User), [
+            dict(user_id=user_id, first_name="Sales", last_name=str(user_id), email=f"sales{user_id}@example.com", role_id=2, branch_id=user_id % 2 + 1)
+            for user_id in range(1, 11)
+        ])
+        connection.execute(insert(models.Customer), [
+            dict(
+                name=f"Customer {i}", phone_number=f"9{i:09d}", link_token=f"link-{i}",
+                vehicle_name="Jupiter", vehicle_variant="ZX", total_price=Decimal("84999.50") + i,
+                branch_id=i % 2 + 1, sales_executive_id=i % 10 + 1, created_at=datetime(2025, 1, 1) + timedelta(minutes=i),
+                sales_verified=i % 3 == 0, accounts_verified=i % 5 == 0, registered=i % 7 == 0,
+            )
+            for i in range(count)
+        ])
+
+
+def _client(response_class, limit: int = None) -> TestClient:
+    app = FastAPI(default_response_class=response_class)
+    app.include_router(admin.router)
+    app.dependency_overrides[oauth2.get_current_user] = lambda: ADMIN
+    if limit is not None:
+        # Past page_size_max, which the limit query parameter is held to
+        app.dependency_overrides[PageParams] = lambda: PageParams(None, limit, "newest")
+    return TestClient(app)
+
+
+def _validated(monkeypatch):
+    # The handler as it was before the trusted path: it hands back the page
+    # dict, which FastAPI validates against response_model and encodes
+    monkeypatch.setattr(admin, "trusted_response", lambda content, status_code=200: content)
+
+
+def _walk(client: TestClient) -> list:
+    """Every page of /admin/customers, following next_cursor to the end."""
+    bodies = []
+    params = {"limit": 200}
+    while True:
+        response = client.get("/admin/customers", params=params)
+        assert response.status_code == 200, response.text
+        bodies.append(response.content)
+        next_cursor = response.json()["next_cursor"]
+        if next_cursor is None:
+            return bodies
+        params["cursor"] = next_cursor
+
+
+def _bodies_per_response(monkeypatch) -> dict:
+    with monkeypatch.context() as patch:
+        _validated(patch)
+        with _client(JSONResponse) as client:
+            before = _walk(client)
+        with _client(FastJSONResponse) as client:
+            validated = _walk(client)
+    with _client(FastJSONResponse) as client:
+        trusted = _walk(client)
+    return {"JSONResponse": before, "FastJSONResponse": validated, "trusted_response": trusted}
+
+
+def test_every_response_path_renders_the_same_bytes(sync_db, monkeypatch):
+    _seed(sync_db, 450)
+
+    bodies = _bodies_per_response(monkeypatch)
+
+    assert len(bodies["trusted_response"]) == 3
+    assert bodies["JSONResponse"] == bodies["FastJSONResponse"] == bodies["trusted_response"]
+
+
+def _best_of(client: TestClient, repeat: int):
+    client.get("/admin/customers")
+    timings = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        response = client.get("/admin/customers")
+        timings.append(time.perf_counter() - started_at)
+        assert response.status_code == 200, response.text
+    return min(timings), response.content
+
+
+@pytest.mark.benchmark
+def test_benchmark_admin_customers(sync_db, monkeypatch):
+    _seed(sync_db, CUSTOMERS)
+
+    # All 10k rows in one page, so encoding is a large share of the request
+    results = {}
+    with monkeypatch.context() as patch:
+        _validated(patch)
+        for label, response_class in (("JSONResponse", JSONResponse), ("FastJSONResponse", FastJSONResponse)):
+            with _client(response_class, limit=CUSTOMERS) as client:
+                results[label] = _best_of(client, repeat=5)
+    with _client(FastJSONResponse, limit=CUSTOMERS) as client:
+        results["trusted_response"] = _best_of(client, repeat=5)
+
+    size = len(results["trusted_response"][1])
+    print(f"\n/admin/customers, {CUSTOMERS} rows ({size / 2**20:.2f} MB), best of 5:")
+    for label, (elapsed, _) in results.items():
+        print(f"  {label:>18}: {elapsed * 1000:7.1f} ms")
+
+    assert results["JSONResponse"][1] == results["FastJSONResponse"][1] == results["trusted_response"][1]
+    assert results["trusted_response"][0] < results["JSONResponse"][0]
@@ -0,0 +1,120 @@
+import threading
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import exc
+from sqlalchemy.orm import sessionmaker
+
+import database
+import models
+import oauth2
+from api import sales
+from conftest import use_postgres
+
+POOL_SIZE = 2
+MAX_OVERFLOW = 1
+POOL_TIMEOUT = 1
+# Longer than the pool timeout, so whoever queues behind a held connection
+# gives up before it comes back
+HOLD_SECONDS = 2
+
+
+@pytest.fixture
+def small_engine(postgres, monkeypatch):
+    monkeypatch.setattr(database.settings, "db_pool_size", POOL_SIZE)
+    monkeypatch.setattr(database.settings, "db_max_overflow", MAX_OVERFLOW)
+    monkeypatch.setattr(database.settings, "db_pool_timeout", POOL_TIMEOUT)
+    engine = database.create_db_engine(postgres.url)
+    yield engine
+    engine.dispose()
+
+
+def _burst(engine, clients: int, hold: float):
+    """Start ``clients`` threads at once, each running one slow query."""
+    barrier = threading.Barrier(clients + 1)
+    results = []
+    snapshots = []
+
+    def client():
+        barrier.wait()
+        started_at = time.perf_counter()
+        try:
+            with engine.connect() as connection:
+                connection.exec_driver_sql("SELECT 1")
+                snapshots.append(database.pool_metrics(engine))
+                connection.exec_driver_sql(f"SELECT pg_sleep({hold})")
+            results.append(("ok", time.perf_counter() - started_at))
+        except exc.TimeoutError:
+            results.append(("timeout", time.perf_counter() - started_at))
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    for thread in threads:
+        thread.join()
+    return results, max(snapshots, key=lambda metrics: metrics["checked_out"])
+
+
+def test_burst_beyond_pool_fails_fast_with_timeouts(small_engine):
+    pool_class = type(small_engine.pool)
+    timeouts_before = pool_class.timeouts
+    waits_before = pool_class.checkout_wait.snapshot()["count"]
+
+    results, peak = _burst(small_engine, clients=10, hold=HOLD_SECONDS)
+    served = [elapsed for outcome, elapsed in results if outcome == "ok"]
+    rejected = [elapsed for outcome, elapsed in results if outcome == "timeout"]
+
+    # pool_size + max_overflow connections are handed out; everyone else
+    # waits pool_timeout seconds and gets TimeoutError, not an unbounded queue
+    assert len(served) == POOL_SIZE + MAX_OVERFLOW
+    assert len(rejected) == 10 - len(served)
+    assert all(POOL_TIMEOUT * 0.9 <= elapsed < HOLD_SECONDS for elapsed in rejected)
+
+    assert peak["checked_out"] == POOL_SIZE + MAX_OVERFLOW
+    assert peak["overflow"] == MAX_OVERFLOW
+    assert pool_class.timeouts - timeouts_before == len(rejected)
+    assert pool_class.checkout_wait.snapshot()["count"] - waits_before == 10
+    assert pool_class.checkout_wait.snapshot()["max_ms"] >= POOL_TIMEOUT * 900
+
+    # Once the burst drains the pool serves normally again
+    with small_engine.connect() as connection:
+        assert connection.exec_driver_sql("SELECT 1").scalar() == 1
+    assert database.pool_metrics(small_engine)["checked_out"] == 0
+
+
+def test_statement_timeout_cancels_runaway_queries(postgres, monkeypatch):
+    monkeypatch.setattr(database.settings, "db_statement_timeout_ms", 200)
+    engine = database.create_db_engine(postgres.url)
+    try:
+        with engine.connect() as connection:
+            with pytest.raises(exc.OperationalError, match="statement timeout"):
+                connection.exec_driver_sql("SELECT pg_sleep(2)")
+    finally:
+        engine.dispose()
+
+
+def test_requests_during_exhaustion_fail_after_pool_timeout(small_engine, postgres, monkeypatch):
+    use_postgres(monkeypatch, postgres)
+    monkeypatch.setattr(database, "engine", small_engine)
+    monkeypatch.setattr(database, "SessionLocal", sessionmaker(autocommit=False, autoflush=False, bind=small_engine))
+
+    app = FastAPI()
+    app.include_router(sales.router)
+    app.dependency_overrides[oauth2.get_current_user] = lambda: models.User(user_id=1, role_id=2, branch_id=1)
+
+    # Tie up every connection the pool can hand out
+    holders = [small_engine.connect() for _ in range(POOL_SIZE + MAX_OVERFLOW)]
+    try:
+        with TestClient(app, raise_server_exceptions=False) as client:
+            started_at = time.perf_counter()
+            response = client.get("/sales/balances")
+            elapsed = time.perf_counter() - started_at
+    finally:
+        for connection in holders:
+            connection.close()
+
+    assert response.status_code == 500
+    assert POOL_TIMEOUT * 0.9 <= elapsed < POOL_TIMEOUT + 1
@@ -0,0 +1,169 @@
+import json
+import time
+
+import fitz
+import numpy as np
+import pytest
+
+import process_pdf
+
+DEALER_STAMP = "./stamps/dealerstamp.png"
+CONFIG = {
+    "stamps": [{"name": "dealerstamp.png", "placements": [
+        {"page": 1, "position": {"x": 300, "y": 500}, "width": 100, "height": 100},
+        {"page": 2, "position": {"x": 300, "y": 500}, "width": 100, "height": 100},
+    ]}],
+    "texts": [{"page": 1, "key": "name", "position": {"x": 50, "y": 700}}],
+}
+
+
+@pytest.fixture(autouse=True)
+def box_index(tmp_path, monkeypatch):
+    # Keep the persisted tick box index out of the working tree
+    index = process_pdf.TickBoxIndex(path=str(tmp_path / "tick_box_index.json"))
+    monkeypatch.setattr(process_pdf, "box_index", index)
+    return index
+
+
+def make_pdf(pages: int = 3) -> bytes:
+    doc = fitz.open()
+    for number in range(pages):
+        page = doc.new_page()
+        for i in range(3):
+            page.draw_rect(fitz.Rect(50 + 40 * i, 100, 75 + 40 * i, 125))
+        page.insert_text((50, 50), f"Page {number + 1}")
+    try:
+        return doc.tobytes()
+    finally:
+        doc.close()
+
+
+def render(pdf_bytes: bytes):
+    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    try:
+        return [np.frombuffer(page.get_pixmap(dpi=72).samples, np.uint8) for page in doc]
+    finally:
+        doc.close()
+
+
+def test_cache_decodes_once_without_stat_per_get(monkeypatch):
+    cache = process_pdf.StampAssetCache()
+    pixmap = cache.get(DEALER_STAMP)
+
+    stats = []
+    real_stat = process_pdf.os.stat
+    monkeypatch.setattr(process_pdf.os, "stat", lambda path, *args, **kwargs: stats.append(path) or real_stat(path, *args, **kwargs))
+    for _ in range(5):
+        assert cache.get(DEALER_STAMP) is pixmap
+
+    assert isinstance(pixmap, fitz.Pixmap)
+    assert stats == []
+
+
+def test_refresh_reloads_changed_files(tmp_path):
+    path = tmp_path / "stamp.png"
+    fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 4, 4), False).save(str(path))
+    cache = process_pdf.StampAssetCache(refresh_interval=3600)
+    assert cache.get(str(path)).width == 4
+
+    fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 8, 8), False).save(str(path))
+    # Within the interval the cached copy is served
+    assert cache.get(str(path)).width == 4
+    cache.refresh()
+    assert cache.get(str(path)).width == 8
+
+
+def test_get_refreshes_after_interval(tmp_path):
+    path = tmp_path / "stamp.png"
+    fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 4, 4), False).save(str(path))
+    cache = process_pdf.StampAssetCache(refresh_interval=0)
+    cache.get(str(path))
+
+    fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 8, 8), False).save(str(path))
+    assert cache.get(str(path)).width == 8
+
+
+def test_pixmap_placement_matches_png_stream(monkeypatch):
+    pdf = make_pdf()
+    plan = process_pdf.compile_plan(CONFIG)
+    stamped = process_pdf.stamp_pdf_bytes(pdf, None, plan, None, {"name": "Asha"})
+
+    # Reference: the same placements inserting the PNG bytes themselves
+    with open(DEALER_STAMP, "rb") as stamp_file:
+        png = stamp_file.read()
+    with open(process_pdf.image_path, "rb") as tick_file:
+        tick = tick_file.read()
+    streams = {DEALER_STAMP: png, process_pdf.image_path: tick}
+    monkeypatch.setattr(process_pdf.asset_cache, "get", lambda path: streams[path])
+    reference = process_pdf.stamp_pdf_bytes(pdf, None, plan, None, {"name": "Asha"})
+
+    for page, expected in zip(render(stamped), render(reference)):
+        assert np.array_equal(page, expected)
+
+
+def test_stamp_embedded_once_per_document():
+    plan = process_pdf.compile_plan(CONFIG)
+    doc = fitz.open(stream=process_pdf.stamp_pdf_bytes(make_pdf(), None, plan, None, {}), filetype="pdf")
+    try:
+        stamp_xrefs = {image[0] for page in doc for image in page.get_images() if image[2] == 276}
+    finally:
+        doc.close()
+
+    assert len(stamp_xrefs) == 1
+
+
+CHASSIS_CONFIG = {
+    "stamps": CONFIG["stamps"][:1],
+    "chassis_image": {"placements": [{"page": 5, "position": {"x": 50, "y": 50}, "width": 200, "height": 100}]},
+}
+
+
+def test_optional_chassis_page_is_not_required():
+    plan = process_pdf.compile_plan(CHASSIS_CONFIG)
+
+    assert (plan.page_count, plan.chassis_page_count) == (2, 5)
+    # No chassis photo: a three page document is long enough
+    assert process_pdf.stamp_pdf_bytes(make_pdf(3), None, plan, None, {})
+
+
+def test_chassis_page_checked_when_photo_uploaded():
+    plan = process_pdf.compile_plan(CHASSIS_CONFIG)
+    with open(DEALER_STAMP, "rb") as photo_file:
+        photo = photo_file.read()
+
+    with pytest.raises(IndexError):
+        process_pdf.stamp_pdf_bytes(make_pdf(3), None, plan, None, {}, photo)
+    assert process_pdf.stamp_pdf_bytes(make_pdf(5), None, plan, None, {}, photo)
+
+
+def test_required_page_out_of_range():
+    plan = process_pdf.compile_plan(CONFIG)
+
+    with pytest.raises(IndexError):
+        process_pdf.stamp_pdf_bytes(make_pdf(1), None, plan, None, {})
+
+
+def _ms_per_document(config, pdf, signature, finance, repeat):
+    process_pdf.stamp_pdf_bytes(pdf, signature, config, finance, {})
+    started_at = time.perf_counter()
+    for _ in range(repeat):
+        process_pdf.stamp_pdf_bytes(pdf, signature, config, finance, {})
+    return (time.perf_counter() - started_at) / repeat * 1000
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("config_path,finance", [("placement_config.json", "tvscredit"), ("form21_config.json", None)])
+def test_benchmark_per_document_latency(config_path, finance):
+    with open(config_path) as config_file:
+        config = json.load(config_file)
+    plan = process_pdf.compile_plan(config)
+    pdf = make_pdf(max(plan.finance_page_counts.get(finance, plan.page_count), 1))
+    with open(DEALER_STAMP, "rb") as signature_file:
+        signature = signature_file.read()
+
+    # Before: the config dict walked and validated on every request;
+    # after: the plan compiled once at startup. Most of a document's time is
+    # MuPDF itself, so the gap is the per-request compile cost.
+    before = _ms_per_document(config, pdf, signature, finance, repeat=50)
+    after = _ms_per_document(plan, pdf, signature, finance, repeat=50)
+    print(f"\n{config_path}: {before:.2f} ms/document from the dict, {after:.2f} ms/document from the plan")
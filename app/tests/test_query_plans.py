@@ -0,0 +1,185 @@
+import asyncio
+import json
+import random
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import event, insert
+
+import models
+import oauth2
+from api import accounts, admin, customer, rto, sales
+from conftest import truncate_postgres, use_postgres
+
+BRANCHES = 10
+EXECUTIVES_PER_BRANCH = 4
+CUSTOMERS = 40_000
+SEED_START = datetime(2024, 1, 1)
+
+ADMIN = models.User(user_id=1, role_id=1, branch_id=None)
+SALES = models.User(user_id=108, role_id=2, branch_id=3)
+ACCOUNTS = models.User(user_id=2, role_id=3, branch_id=3)
+RTO = models.User(user_id=3, role_id=4, branch_id=None)
+
+# Every customer read the list, queue and dashboard endpoints make; the
+# search filter is left out as ILIKE on name/phone has no index to use
+ROUTER_REQUESTS = [
+    (ADMIN, "/admin/customers"),
+    (ADMIN, "/admin/customers?branch_id=3"),
+    (ADMIN, "/admin/customers?order=oldest&created_from=2025-03-01&created_to=2025-03-31"),
+    (ADMIN, "/admin/customers?vehicle_name=Jupiter&branch_id=3"),
+    (ADMIN, "/admin/monthly-customers?month=3&year=2025"),
+    (ADMIN, "/admin/sales-verified-customers?branch_id=3"),
+    (ADMIN, "/admin/accounts-verified-customers?branch_id=3"),
+    (ADMIN, "/admin/rto-verified-customers?branch_id=3"),
+    (ADMIN, "/admin/total-branch-customers/3"),
+    (SALES, "/sales/customers"),
+    (SALES, "/sales/customers?created_from=2025-03-01"),
+    (SALES, "/sales/dashboard-stats"),
+    (SALES, "/sales/customers/count_per_day"),
+    (SALES, "/sales/balances"),
+    (SALES, "/sales/customers/1"),
+    (ACCOUNTS, "/accounts/customers/pending"),
+    (ACCOUNTS, "/accounts/customers/verified"),
+    (RTO, "/rto/pending-customers"),
+    (RTO, "/rto/customer-list"),
+    (RTO, "/rto/verified-customers"),
+    (None, "/customer/customer-form/link-1234"),
+]
+
+
+def _seed(engine):
+    rng = random.Random(12)
+    branches = [
+        dict(branch_id=b, name=f"Branch {b}", address="-", phone_number=f"80000000{b:02d}", branch_manager="-")
+        for b in range(1, BRANCHES + 1)
+    ]
+    executives = [
+        dict(user_id=100 + (b - 1) * EXECUTIVES_PER_BRANCH + e, first_name="Exec", last_name=str(e), email=f"exec{b}-{e}@example.com", role_id=2, branch_id=b)
+        for b in range(1, BRANCHES + 1) for e in range(EXECUTIVES_PER_BRANCH)
+    ]
+    customers, logs = [], []
+    for i in range(CUSTOMERS):
+        # The first customer belongs to SALES, for the by-id lookup
+        executive = executives[8] if i == 0 else rng.choice(executives)
+        stage = rng.random()
+        # Most customers have been through the whole pipeline; the queues
+        # only ever hold a small slice
+        sales_verified = stage > 0.05
+        accounts_verified = stage > 0.10
+        rto_verified = stage > 0.15
+        customers.append(dict(
+            customer_id=i + 1,
+            name=f"Customer {i}",
+            phone_number=f"9{i:09d}",
+            link_token=f"link-{i}",
+            vehicle_name=rng.choice(("Jupiter", "Ntorq", "Apache", "Raider", "iQube")),
+            vehicle_variant="Std",
+            total_price=Decimal("100000"),
+            amount_paid=Decimal("0"),
+            balance_amount=Decimal("5000") if rng.random() < 0.1 else Decimal("0"),
+            branch_id=executive["branch_id"],
+            sales_executive_id=executive["user_id"],
+            status="pending" if stage < 0.03 else "submitted",
+            sales_verified=sales_verified,
+            accounts_verified=accounts_verified,
+            rto_verified=rto_verified,
+            created_at=SEED_START + timedelta(minutes=rng.randrange(730 * 24 * 60)),
+        ))
+        if rto_verified:
+            logs.append(dict(user_id=3, customer_id=i + 1, action="rto_approved"))
+
+    with engine.begin() as connection:
+        connection.execute(insert(models.Role), [
+            dict(role_id=1, role_name="admin"), dict(role_id=2, role_name="sales"),
+            dict(role_id=3, role_name="accounts"), dict(role_id=4, role_name="rto"),
+        ])
+        connection.execute(insert(models.Branch), branches)
+        connection.execute(insert(models.User), [
+            dict(user_id=1, email="admin@example.com", role_id=1),
+            dict(user_id=2, email="accounts@example.com", role_id=3, branch_id=3),
+            dict(user_id=3, email="rto@example.com", role_id=4),
+        ] + executives)
+        connection.execute(insert(models.Customer), customers)
+        connection.execute(insert(models.VerificationLog), logs)
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.exec_driver_sql("ANALYZE")
+
+
+@pytest.fixture(scope="module")
+def seeded(postgres):
+    _seed(postgres.engine)
+    try:
+        yield postgres
+    finally:
+        truncate_postgres(postgres)
+
+
+@pytest.fixture
+def client(seeded, monkeypatch):
+    use_postgres(monkeypatch, seeded)
+    app = FastAPI()
+    for router in (admin.router, sales.router, accounts.router, rto.router, customer.router):
+        app.include_router(router)
+    with TestClient(app) as client:
+        yield client
+
+
+def _capture(engines):
+    """Record every SELECT on customers that the app sends, with its parameters."""
+    captured = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and "customers" in statement:
+            captured.append((conn.engine, statement, parameters))
+
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    return captured, lambda: [event.remove(engine, "before_cursor_execute", before_cursor_execute) for engine in engines]
+
+
+def _explain(pg, engine, statement, parameters):
+    explain = f"EXPLAIN (FORMAT JSON) {statement}"
+    if engine is pg.engine:
+        connection = pg.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute(explain, parameters)
+            plan = cursor.fetchone()[0]
+        finally:
+            connection.close()
+    else:
+        async def run():
+            async with pg.async_engine.connect() as connection:
+                return (await connection.exec_driver_sql(explain, parameters)).scalar()
+        plan = asyncio.run(run())
+    return json.loads(plan) if isinstance(plan, str) else plan
+
+
+def _customer_seq_scans(node):
+    if node.get("Node Type") == "Seq Scan" and node.get("Relation Name") == "customers":
+        yield node
+    for child in node.get("Plans", ()):
+        yield from _customer_seq_scans(child)
+
+
+@pytest.mark.parametrize("user,path", ROUTER_REQUESTS, ids=[path for _, path in ROUTER_REQUESTS])
+def test_router_queries_avoid_seq_scan_on_customers(client, seeded, user, path):
+    if user is not None:
+        client.app.dependency_overrides[oauth2.get_current_user] = lambda: user
+
+    captured, stop = _capture([seeded.engine, seeded.async_engine.sync_engine])
+    try:
+        response = client.get(path)
+    finally:
+        stop()
+
+    assert response.status_code == 200, response.text
+    assert captured, f"{path} sent no query on customers"
+    for engine, statement, parameters in captured:
+        plan = _explain(seeded, engine, statement, parameters)[0]["Plan"]
+        scans = list(_customer_seq_scans(plan))
+        assert not scans, f"{path} scans customers sequentially:\n{statement}\n{json.dumps(plan, indent=1)}"
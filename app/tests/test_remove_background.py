@@ -0,0 +1,83 @@
+import os
+import time
+from io import BytesIO
+
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+
+import imaging
+from conftest import signature_bytes
+
+STAMPS_DIR = os.path.join(os.path.dirname(imaging.__file__), "stamps")
+
+
+def _loop_remove_background(data: bytes) -> bytes:
+    # The original per-pixel implementation, kept as the reference output
+    file_bytes = np.frombuffer(data, np.uint8)
+    img = cv2.imdecode(file_bytes, cv2.IMREAD_GRAYSCALE)
+    _, img_thresh = cv2.threshold(img, 110, 255, cv2.THRESH_BINARY)
+    img_pil = Image.fromarray(img_thresh).convert("RGBA")
+    pixdata = img_pil.load()
+    width, height = img_pil.size
+    for y in range(height):
+        for x in range(width):
+            if pixdata[x, y] == (255, 255, 255, 255):
+                pixdata[x, y] = (255, 255, 255, 0)
+    out = BytesIO()
+    img_pil.save(out, format="PNG")
+    return out.getvalue()
+
+
+def _pixels(png: bytes):
+    image = Image.open(BytesIO(png))
+    return image.mode, image.size, np.asarray(image)
+
+
+FIXTURES = {
+    "signature_jpeg": lambda: signature_bytes(640, 240, seed=1),
+    "signature_png": lambda: signature_bytes(333, 157, seed=2, format="PNG"),
+    "tall_jpeg": lambda: signature_bytes(120, 900, seed=3),
+    "stamp_dealer": lambda: open(os.path.join(STAMPS_DIR, "dealerstamp.png"), "rb").read(),
+    "stamp_kotak_sign": lambda: open(os.path.join(STAMPS_DIR, "kotaksign.png"), "rb").read(),
+}
+
+
+@pytest.mark.parametrize("name", sorted(FIXTURES))
+def test_matches_per_pixel_loop(name):
+    data = FIXTURES[name]()
+    mode, size, pixels = _pixels(imaging._remove_background(data))
+    expected_mode, expected_size, expected_pixels = _pixels(_loop_remove_background(data))
+
+    assert (mode, size) == (expected_mode, expected_size)
+    assert np.array_equal(pixels, expected_pixels)
+
+
+def test_reads_spooled_path(tmp_path):
+    data = FIXTURES["signature_jpeg"]()
+    path = tmp_path / "sign.jpg"
+    path.write_bytes(data)
+
+    assert np.array_equal(_pixels(imaging._remove_background(str(path)))[2], _pixels(imaging._remove_background(data))[2])
+
+
+def _ms_per_megapixel(fn, data: bytes, megapixels: float, repeat: int) -> float:
+    fn(data)
+    started_at = time.perf_counter()
+    for _ in range(repeat):
+        fn(data)
+    return (time.perf_counter() - started_at) / repeat / megapixels * 1000
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("width,height", [(1000, 1000), (2000, 1500)])
+def test_benchmark_per_megapixel(width, height):
+    data = signature_bytes(width, height, seed=4)
+    megapixels = width * height / 1_000_000
+
+    loop = _ms_per_megapixel(_loop_remove_background, data, megapixels, repeat=2)
+    vectorised = _ms_per_megapixel(imaging._remove_background, data, megapixels, repeat=10)
+    print(f"\nremove_background {width}x{height}: loop {loop:.1f} ms/MP, vectorised {vectorised:.1f} ms/MP ({loop / vectorised:.0f}x)")
+
+    assert vectorised < loop
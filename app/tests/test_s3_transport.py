@@ -0,0 +1,77 @@
+import asyncio
+import threading
+from io import BytesIO
+
+import pytest
+
+import s3_transport
+import utils
+from conftest import BUCKET_NAME
+
+
+def _keys(transport):
+    listing = transport.client.list_objects_v2(Bucket=BUCKET_NAME)
+    return sorted(item["Key"] for item in listing.get("Contents", []))
+
+
+def test_start_is_idempotent_and_reuses_one_client(s3):
+    client = s3.client
+    s3.start()
+
+    assert s3.client is client
+    assert s3._pool._max_workers == s3.max_connections
+
+
+def test_upload_and_read_back(s3):
+    async def scenario():
+        await s3.upload_fileobj(BytesIO(b"first"), BUCKET_NAME, "a.jpg")
+        # Several uploads at once share the client and its connection pool
+        await asyncio.gather(*(
+            s3.upload_fileobj(BytesIO(f"body {i}".encode()), BUCKET_NAME, f"many/{i}.jpg")
+            for i in range(8)
+        ))
+        return await s3.get_object_bytes(BUCKET_NAME, "a.jpg")
+
+    assert asyncio.run(scenario()) == b"first"
+    assert _keys(s3) == ["a.jpg"] + sorted(f"many/{i}.jpg" for i in range(8))
+
+
+def test_upload_runs_off_the_event_loop(s3):
+    threads = []
+    client = s3.client
+    upload_fileobj = client.upload_fileobj
+
+    def recording_upload(*args, **kwargs):
+        threads.append(threading.current_thread().name)
+        return upload_fileobj(*args, **kwargs)
+
+    client.upload_fileobj = recording_upload
+    asyncio.run(s3.upload_fileobj(BytesIO(b"x"), BUCKET_NAME, "x.jpg"))
+
+    assert threads and threads[0].startswith("s3")
+
+
+def test_upload_image_to_s3_uses_shared_transport(s3):
+    url = asyncio.run(utils.upload_image_to_s3(BytesIO(b"image"), BUCKET_NAME, "photo.jpg"))
+
+    assert url == f"https://{BUCKET_NAME}.s3.amazonaws.com/photo.jpg"
+    assert asyncio.run(s3.get_object_bytes(BUCKET_NAME, "photo.jpg")) == b"image"
+
+
+def test_public_url():
+    assert s3_transport.S3Transport(1).public_url("bucket", "k/a.jpg") == "https://bucket.s3.amazonaws.com/k/a.jpg"
+    local = s3_transport.S3Transport(1, endpoint_url="http://localhost:9000/")
+    assert local.public_url("bucket", "k/a.jpg") == "http://localhost:9000/bucket/k/a.jpg"
+
+
+def test_shutdown_then_restart(s3):
+    asyncio.run(s3.upload_fileobj(BytesIO(b"before"), BUCKET_NAME, "before.jpg"))
+    pool = s3._pool
+    s3.shutdown()
+
+    assert s3._client is None and s3._pool is None
+    assert pool._shutdown
+
+    # The next call starts a fresh client and pool
+    asyncio.run(s3.upload_fileobj(BytesIO(b"after"), BUCKET_NAME, "after.jpg"))
+    assert _keys(s3) == ["after.jpg", "before.jpg"]
@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+import image_jobs
+import models
+import oauth2
+from api import customer, sales
+from conftest import BUCKET_NAME, customer_row, jpeg_bytes
+
+
+@pytest.fixture
+def client(async_db, s3):
+    app = FastAPI()
+    app.include_router(customer.router)
+    app.include_router(sales.router)
+    app.dependency_overrides[oauth2.get_current_user] = lambda: models.User(user_id=1, role_id=2, branch_id=1)
+
+    async def seed():
+        async with async_db() as db:
+            db.add(customer_row(customer_id=1, link_token="token"))
+            await db.commit()
+
+    asyncio.run(seed())
+    with TestClient(app) as client:
+        yield client
+
+
+def _customer(async_db) -> models.Customer:
+    async def load():
+        async with async_db() as db:
+            return await db.get(models.Customer, 1)
+    return asyncio.run(load())
+
+
+def _stored(s3, url: str) -> bytes:
+    key = url.split(".s3.amazonaws.com/", 1)[1]
+    return asyncio.run(s3.get_object_bytes(BUCKET_NAME, key))
+
+
+def test_submit_customer_form_with_real_uploads(client, async_db, s3):
+    photo, front, sign = jpeg_bytes(800, 600, seed=1), jpeg_bytes(900, 600, seed=2), jpeg_bytes(400, 150, seed=3)
+    response = client.post(
+        "/customer/token",
+        data={"first_name": "Asha", "dob": "1990-01-31"},
+        files={
+            "passport_photo": ("me.jpg", photo, "image/jpeg"),
+            "aadhaar_front_photo": ("front.jpg", front, "image/jpeg"),
+            "customer_sign": ("sign.jpg", sign, "image/jpeg"),
+        },
+    )
+
+    assert response.status_code == 200, response.text
+    assert response.json()["status"] == "submitted"
+    assert response.json()["processing_status"] == "pending"
+    assert _customer(async_db).first_name == "Asha"
+
+    assert asyncio.run(image_jobs.run_pending()) == 1
+    stored = _customer(async_db)
+    assert stored.processing_status == "done"
+    assert _stored(s3, stored.adhaar_front) == front
+    for field in ("photo_passport", "customer_sign", "customer_sign_copy"):
+        assert _stored(s3, getattr(stored, field))
+
+
+def test_submit_customer_form_rejects_oversized_signature(client, async_db):
+    response = client.post(
+        "/customer/token",
+        files={"customer_sign": ("sign.png", b"x" * (3 * 1024 * 1024), "image/png")},
+    )
+
+    assert response.status_code == 413
+
+    async def jobs():
+        async with async_db() as db:
+            return (await db.scalars(select(models.ImageJob))).all()
+    assert asyncio.run(jobs()) == []
+
+
+def test_delivery_update_with_real_uploads(client, async_db, s3):
+    photos = {name: jpeg_bytes(640, 480, seed=seed) for seed, name in enumerate(("number_plate_front", "number_plate_back", "delivery_photo"))}
+    response = client.post(
+        "/sales/customers/delivery-update/1",
+        files={name: (f"{name}.jpg", data, "image/jpeg") for name, data in photos.items()},
+    )
+
+    assert response.status_code == 200, response.text
+    stored = _customer(async_db)
+    for name, data in photos.items():
+        assert _stored(s3, getattr(stored, name)) == data